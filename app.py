@@ -1,10 +1,13 @@
 from flask import Flask
 from flask_cors import CORS
-import os
+import importlib
 from config import Config
 
+# Heavy client libraries the services import on first use rather than at startup
+LAZY_MODULES = ("openai", "requests", "aiohttp", "youtube_transcript_api")
+
 def create_app(config_class=Config):
-    app = Flask(__name__)
+    app = Flask(__name__, template_folder='Templates', static_folder='Static')
     app.config.from_object(config_class)
     
     # Enable CORS
@@ -17,11 +20,37 @@ def create_app(config_class=Config):
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp, url_prefix='/api')
     
-    # Create required directories
-    os.makedirs('instance/cache', exist_ok=True)
+    # Register CLI commands
+    from cli import batch_cli
+    
+    app.cli.add_command(batch_cli)
     
+    # Cache, task store and rate limiter directories are created on first write
     return app
 
+def warm_up(app):
+    """
+    Load what the first requests would otherwise load lazily.
+    
+    Imports the OpenAI and YouTube clients, loads the tokenizer and compiles
+    the templates. Under gunicorn --preload this runs once in the master (see
+    gunicorn.conf.py), so forked workers share all of it copy-on-write.
+    Connections, thread pools and the task store are per process and are
+    still created in each worker on first use.
+    
+    Args:
+        app: Flask application
+    """
+    from services.models import STAGES, stage_model
+    from services.chunking import count_tokens
+    
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
+    for stage in STAGES:
+        count_tokens("", stage_model(stage))
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
 if __name__ == '__main__':
     app = create_app()
     app.run(debug=True)
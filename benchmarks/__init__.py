@@ -0,0 +1,7 @@
+"""
+Offline benchmarks for GPTCheck.
+
+YouTube and OpenAI are replaced by local fakes with configurable latency and
+error rates, so results depend only on this code and the machine running it.
+Run ``python -m benchmarks.run --help`` for the available suites.
+"""
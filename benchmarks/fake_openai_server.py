@@ -0,0 +1,125 @@
+"""
+OpenAI-compatible chat completion server backed by the benchmark fakes.
+
+Usage:
+    python -m benchmarks.fake_openai_server --port 8000
+    SECTION_MODEL=local:fake LOCAL_MODEL_BASE_URL=http://127.0.0.1:8000/v1 flask run
+
+A stand-in for a local model server (vLLM, llama.cpp, Ollama), so local
+model routing and fallbacks can be exercised over real HTTP without a GPU.
+Completions are the same synthetic text as FakeBackends, and the BENCH_*
+variables of FakeBackendConfig set the latency and error rate. Injected
+errors are 503 overloaded responses, which move a stage to its fallback.
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional, List, Tuple
+from .fakes import FakeBackends, FakeBackendConfig
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class _ChatCompletionHandler(BaseHTTPRequestHandler):
+    server: "FakeOpenAIServer"
+    
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+    
+    def _send_json(self, status: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_POST(self) -> None:
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}",
+                                            "type": "invalid_request_error"}})
+            return
+        params = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b"{}")
+        fakes, config = self.server.fakes, self.server.fakes.config
+        
+        time.sleep(config.openai_latency)
+        fakes._count("openai_calls")
+        if fakes._fails(config.openai_error_rate):
+            fakes._count("openai_errors")
+            self._send_json(503, {"error": {"message": "The server is overloaded (injected by benchmark fake)",
+                                            "type": "server_error"}})
+            return
+        
+        text = fakes._completion_text(params.get("messages", []))
+        generation_time = config.openai_seconds_per_token * len(text) / 4
+        if not params.get("stream"):
+            time.sleep(generation_time)
+            self._send_json(200, fakes._response(params, text))
+            return
+        
+        # Server-sent events; the connection closes after the stream (HTTP/1.0)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        chunks = fakes._chunks(text)
+        for chunk in chunks:
+            time.sleep(generation_time / len(chunks))
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """HTTP server answering /v1/chat/completions from FakeBackends"""
+    
+    daemon_threads = True
+    
+    def __init__(self, address: Tuple[str, int], config: Optional[FakeBackendConfig] = None):
+        super().__init__(address, _ChatCompletionHandler)
+        self.fakes = FakeBackends(config)
+    
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+def start_fake_openai_server(config: Optional[FakeBackendConfig] = None, host: str = '127.0.0.1',
+                             port: int = 0) -> FakeOpenAIServer:
+    """
+    Start the server in a background thread.
+    
+    Args:
+        config: Latency and error settings, defaults to FakeBackendConfig()
+        host: Address to listen on
+        port: Port to listen on, 0 for any free port
+    
+    Returns:
+        Running server; use its base_url as LOCAL_MODEL_BASE_URL and call shutdown() to stop it
+    """
+    server = FakeOpenAIServer((host, port), config)
+    threading.Thread(target=server.serve_forever, name="fake-openai-server", daemon=True).start()
+    return server
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve fake OpenAI-compatible chat completions.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO, stream=sys.stderr)
+    
+    server = FakeOpenAIServer((args.host, args.port), FakeBackendConfig.from_environ())
+    logger.info(f"Serving fake chat completions at {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logger.info(f"Served {json.dumps(server.fakes.stats)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import os
+import time
+import random
+import logging
+import threading
+import openai
+from openai.openai_object import OpenAIObject
+from youtube_transcript_api import YouTubeTranscriptApi
+from typing import Dict, Any, Optional, List
+from .synthetic import parse_synthetic_video_id, synthetic_segments, synthetic_report, VOCABULARY
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class FakeBackendConfig:
+    """
+    Latency and failure settings of the fake YouTube and OpenAI backends.
+    
+    Args:
+        openai_latency: Seconds before a completion starts
+        openai_seconds_per_token: Extra seconds per completion token, spread over streamed chunks
+        openai_error_rate: Share of completions that fail with a 429
+        openai_retry_after: Retry-After sent with those 429s
+        completion_tokens: Approximate length of every completion
+        transcript_latency: Seconds per transcript fetch
+        transcript_error_rate: Share of transcript fetches that fail
+        title_latency: Seconds per title lookup
+        seed: Seed for the error draws
+    """
+    
+    def __init__(self, openai_latency: float = 0.05, openai_seconds_per_token: float = 0.0,
+                 openai_error_rate: float = 0.0, openai_retry_after: float = 0.05, completion_tokens: int = 200,
+                 transcript_latency: float = 0.1, transcript_error_rate: float = 0.0, title_latency: float = 0.02,
+                 seed: int = 0):
+        self.openai_latency = openai_latency
+        self.openai_seconds_per_token = openai_seconds_per_token
+        self.openai_error_rate = openai_error_rate
+        self.openai_retry_after = openai_retry_after
+        self.completion_tokens = completion_tokens
+        self.transcript_latency = transcript_latency
+        self.transcript_error_rate = transcript_error_rate
+        self.title_latency = title_latency
+        self.seed = seed
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+    
+    @classmethod
+    def from_environ(cls, prefix: str = "BENCH_") -> "FakeBackendConfig":
+        """
+        Read settings from environment variables, e.g. BENCH_OPENAI_LATENCY=0.2.
+        
+        Args:
+            prefix: Prefix of the variable names
+        
+        Returns:
+            Config with defaults for the variables that are not set
+        """
+        config = cls()
+        for name, value in vars(config).items():
+            raw = os.environ.get(prefix + name.upper())
+            if raw:
+                setattr(config, name, type(value)(raw))
+        return config
+
+class _FakeTranscript:
+    def __init__(self, segments: List[Dict[str, Any]]):
+        self._segments = segments
+    
+    def fetch(self) -> List[Dict[str, Any]]:
+        return self._segments
+
+class _FakeTranscriptList:
+    def __init__(self, segments: List[Dict[str, Any]]):
+        self._segments = segments
+    
+    def find_transcript(self, language_codes: List[str]) -> _FakeTranscript:
+        return _FakeTranscript(self._segments)
+
+class FakeBackends:
+    """
+    Replaces YouTubeTranscriptApi, the title lookup and openai.ChatCompletion with local fakes.
+    
+    Transcripts are synthetic, with the length encoded in the video ID (see
+    benchmarks.synthetic.synthetic_video_id). Everything above these calls,
+    including the OpenAI client's retries and pacing, runs unchanged.
+    
+    Use as a context manager, or call install and uninstall.
+    """
+    
+    def __init__(self, config: Optional[FakeBackendConfig] = None):
+        self.config = config or FakeBackendConfig()
+        self.stats = {"openai_calls": 0, "openai_errors": 0, "openai_prompt_tokens": 0,
+                      "transcript_fetches": 0, "transcript_errors": 0, "title_fetches": 0}
+        self._lock = threading.Lock()
+        self._rng = random.Random(self.config.seed)
+        self._originals: Dict[str, Any] = {}
+    
+    def install(self) -> "FakeBackends":
+        """Patch the fakes in."""
+        from services import youtube
+        
+        self._originals = {
+            "list_transcripts": YouTubeTranscriptApi.__dict__["list_transcripts"],
+            "create": openai.ChatCompletion.__dict__["create"],
+            "oembed": youtube._fetch_oembed_metadata
+        }
+        YouTubeTranscriptApi.list_transcripts = staticmethod(self._list_transcripts)
+        openai.ChatCompletion.create = staticmethod(self._create)
+        youtube._fetch_oembed_metadata = self._fetch_oembed_metadata
+        return self
+    
+    def uninstall(self) -> None:
+        """Restore the real backends."""
+        from services import youtube
+        
+        if not self._originals:
+            return
+        YouTubeTranscriptApi.list_transcripts = self._originals["list_transcripts"]
+        openai.ChatCompletion.create = self._originals["create"]
+        youtube._fetch_oembed_metadata = self._originals["oembed"]
+        self._originals = {}
+    
+    def __enter__(self) -> "FakeBackends":
+        return self.install()
+    
+    def __exit__(self, *exc_info) -> None:
+        self.uninstall()
+    
+    def reset_stats(self) -> Dict[str, int]:
+        """Zero the call counters, returning their previous values."""
+        with self._lock:
+            stats = dict(self.stats)
+            for key in self.stats:
+                self.stats[key] = 0
+        return stats
+    
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += amount
+    
+    def _fails(self, rate: float) -> bool:
+        with self._lock:
+            return self._rng.random() < rate
+    
+    def _list_transcripts(self, video_id: str) -> _FakeTranscriptList:
+        time.sleep(self.config.transcript_latency)
+        self._count("transcript_fetches")
+        minutes = parse_synthetic_video_id(video_id)
+        if minutes is None or self._fails(self.config.transcript_error_rate):
+            self._count("transcript_errors")
+            raise RuntimeError(f"No transcript for video {video_id}")
+        return _FakeTranscriptList(synthetic_segments(minutes, seed=f"{self.config.seed}:{video_id}"))
+    
+    def _fetch_oembed_metadata(self, watch_url: str) -> Optional[Dict[str, Any]]:
+        time.sleep(self.config.title_latency)
+        self._count("title_fetches")
+        return {"title": f"Synthetic video {watch_url.rsplit('=', 1)[-1]}", "author_name": "benchmark",
+                "thumbnail_url": None}
+    
+    def _completion_text(self, messages: List[Dict[str, str]]) -> str:
+        prompt = messages[-1]["content"] if messages else ""
+        if "JSON schema" in prompt:
+            return synthetic_report(claims_per_section=max(1, self.config.completion_tokens // 100))
+        words = max(1, self.config.completion_tokens * 3 // 4)
+        rng = random.Random(len(prompt))
+        return " ".join(rng.choices(VOCABULARY, k=words))
+    
+    def _start(self, params: Dict[str, Any]) -> str:
+        """Account for a request and decide its fate; raises the injected 429."""
+        prompt_tokens = sum(len(message.get("content") or "") for message in params.get("messages", [])) // 4
+        self._count("openai_calls")
+        self._count("openai_prompt_tokens", prompt_tokens)
+        if self._fails(self.config.openai_error_rate):
+            self._count("openai_errors")
+            raise openai.error.RateLimitError("Rate limit reached (injected by benchmark fake)", http_status=429,
+                                              headers={"retry-after": str(self.config.openai_retry_after)})
+        return self._completion_text(params.get("messages", []))
+    
+    def _response(self, params: Dict[str, Any], text: str) -> OpenAIObject:
+        prompt_tokens = sum(len(message.get("content") or "") for message in params.get("messages", [])) // 4
+        return OpenAIObject.construct_from({
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion",
+            "model": params.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4,
+                      "total_tokens": prompt_tokens + len(text) // 4}
+        })
+    
+    @staticmethod
+    def _chunks(text: str, size: int = 16) -> List[OpenAIObject]:
+        return [OpenAIObject.construct_from({"choices": [{"index": 0, "delta": {"content": text[i:i + size]}}]})
+                for i in range(0, len(text), size)]
+    
+    def _create(self, **params) -> Any:
+        time.sleep(self.config.openai_latency)
+        text = self._start(params)
+        generation_time = self.config.openai_seconds_per_token * len(text) / 4
+        if not params.get("stream"):
+            time.sleep(generation_time)
+            return self._response(params, text)
+        
+        def stream():
+            chunks = self._chunks(text)
+            for chunk in chunks:
+                time.sleep(generation_time / len(chunks))
+                yield chunk
+        return stream()
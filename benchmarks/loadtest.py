@@ -0,0 +1,417 @@
+"""
+Load-test the app under gunicorn with the fake YouTube and OpenAI backends.
+
+Usage:
+    python -m benchmarks.loadtest --users 200 --configs 1x32 2x16 4x8 --output load.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:5000 --users 50
+
+For each worker configuration (workers x threads) a gunicorn server running
+benchmarks.stub_app is started on a fresh working directory. Simulated users
+submit videos through the form (/analyze) or the API (/api/analyze), then
+poll /api/tasks/<id> until their task finishes. Results report latency
+percentiles and error rates per endpoint, task outcomes including tasks lost
+between workers, and the peak thread count of the gunicorn processes.
+"""
+import os
+import re
+import sys
+import json
+import time
+import shlex
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+import logging
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+from .run import benchmark_environment, latency_percentiles, compare_results, REPO_ROOT
+from .synthetic import synthetic_video_url
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+TASK_PAGE_PATTERN = re.compile(r'/tasks/([0-9a-f]+)$')
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+ENDPOINTS = ("form_analyze", "api_analyze", "api_task")
+
+class LoadStats:
+    """Request latencies, status codes and task outcomes collected during one run"""
+    
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+        self.statuses: Dict[str, Counter] = {endpoint: Counter() for endpoint in ENDPOINTS}
+        self.outcomes = Counter()
+        self.task_seconds: List[float] = []
+        self.peak_threads: Dict[int, int] = {}
+    
+    def record(self, endpoint: str, seconds: float, status: Any) -> None:
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+    
+    def metrics(self, wall_seconds: float) -> Dict[str, Any]:
+        """Flatten the stats into one metrics dictionary."""
+        metrics: Dict[str, Any] = {"wall_seconds": round(wall_seconds, 3)}
+        for endpoint in ENDPOINTS:
+            statuses = self.statuses[endpoint]
+            requests_made = sum(statuses.values())
+            if not requests_made:
+                continue
+            # 429s are back-pressure, counted apart from errors
+            errors = sum(count for status, count in statuses.items()
+                         if not isinstance(status, int) or (status >= 400 and status != 429 and status != 404))
+            metrics[f"{endpoint}_requests"] = requests_made
+            metrics[f"{endpoint}_errors"] = errors
+            metrics[f"{endpoint}_error_rate"] = round(errors / requests_made, 4)
+            metrics[f"{endpoint}_rejected"] = statuses.get(429, 0)
+            metrics[f"{endpoint}_requests_per_second"] = round(requests_made / wall_seconds, 3)
+            metrics.update(latency_percentiles(self.latencies[endpoint], prefix=f"{endpoint}_"))
+        for outcome in ("completed", "failed", "lost", "unfinished", "rejected", "submit_error"):
+            metrics[f"tasks_{outcome}"] = self.outcomes.get(outcome, 0)
+        metrics.update(latency_percentiles(self.task_seconds, prefix="task_completion_"))
+        if self.peak_threads:
+            metrics["processes"] = len(self.peak_threads)
+            metrics["peak_threads_total"] = sum(self.peak_threads.values())
+            metrics["peak_threads_per_process"] = max(self.peak_threads.values())
+        metrics["status_codes"] = {endpoint: {str(status): count for status, count in statuses.items()}
+                                   for endpoint, statuses in self.statuses.items() if statuses}
+        return metrics
+
+class LoadTest:
+    """
+    Simulated users submitting and polling against one server.
+    
+    Args:
+        base_url: Server URL
+        users: Number of concurrent users
+        submissions: Videos each user submits, one after the other
+        form_share: Share of submissions made through the HTML form instead of the API
+        duplicate_rate: Share of submissions picking one of a few popular videos
+        video_minutes: Length of the synthetic videos
+        ramp_seconds: Time over which users start
+        poll_interval: Seconds between status polls
+        task_timeout: Seconds a user waits for a task before giving up
+        seed: Random seed
+    """
+    
+    def __init__(self, base_url: str, users: int, submissions: int, form_share: float, duplicate_rate: float,
+                 video_minutes: int, ramp_seconds: float, poll_interval: float, task_timeout: float, seed: int):
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.submissions = submissions
+        self.form_share = form_share
+        self.duplicate_rate = duplicate_rate
+        self.video_minutes = video_minutes
+        self.ramp_seconds = ramp_seconds
+        self.poll_interval = poll_interval
+        self.task_timeout = task_timeout
+        self.rng = random.Random(seed)
+        self.stats = LoadStats()
+        self._next_video = 1000
+    
+    def _pick_video(self) -> str:
+        if self.rng.random() < self.duplicate_rate:
+            return synthetic_video_url(self.video_minutes, self.rng.randint(0, 4))
+        self._next_video += 1
+        return synthetic_video_url(self.video_minutes, self._next_video)
+    
+    async def _timed(self, session, endpoint: str, method: str, path: str, **kwargs) -> Tuple[Any, Any]:
+        """Make one request, recording its latency and status. Returns (status, response data)."""
+        start = time.perf_counter()
+        try:
+            async with session.request(method, self.base_url + path, **kwargs) as response:
+                if response.content_type == 'application/json':
+                    data = await response.json()
+                else:
+                    await response.read()
+                    data = response.headers.get('Location')
+                status = response.status
+        except Exception as e:
+            status, data = e.__class__.__name__, None
+        self.stats.record(endpoint, time.perf_counter() - start, status)
+        return status, data
+    
+    async def _submit(self, session, url: str) -> Optional[str]:
+        """Submit a video through the form or the API. Returns the task ID, or None."""
+        if self.rng.random() < self.form_share:
+            status, location = await self._timed(session, "form_analyze", "POST", "/analyze",
+                                                 data={"youtube_url": url, "api_key": "sk-loadtest"},
+                                                 allow_redirects=False)
+            match = TASK_PAGE_PATTERN.search(location or "") if status == 302 else None
+            if match:
+                return match.group(1)
+            # The form redirects to the home page with a flash message when the queue is full
+            self.stats.outcomes["rejected" if status == 302 else "submit_error"] += 1
+            return None
+        
+        status, data = await self._timed(session, "api_analyze", "POST", "/api/analyze",
+                                         json={"youtube_url": url, "api_key": "sk-loadtest"})
+        if status == 200 and data and data.get("task_id"):
+            return data["task_id"]
+        self.stats.outcomes["rejected" if status == 429 else "submit_error"] += 1
+        return None
+    
+    async def _follow(self, session, task_id: str, submitted_at: float) -> None:
+        """Poll a task until it finishes, recording its outcome."""
+        deadline = submitted_at + self.task_timeout
+        while time.monotonic() < deadline:
+            status, data = await self._timed(session, "api_task", "GET", f"/api/tasks/{task_id}")
+            if status == 404:
+                # A task another worker created but this one cannot see
+                self.stats.outcomes["lost"] += 1
+                return
+            if status == 200 and data and data.get("status") in FINISHED_STATUSES:
+                if data["status"] == "completed":
+                    self.stats.outcomes["completed"] += 1
+                    self.stats.task_seconds.append(time.monotonic() - submitted_at)
+                elif "interrupted" in (data.get("error") or ""):
+                    self.stats.outcomes["lost"] += 1
+                else:
+                    self.stats.outcomes["failed"] += 1
+                return
+            await asyncio.sleep(self.poll_interval * self.rng.uniform(0.8, 1.2))
+        self.stats.outcomes["unfinished"] += 1
+    
+    async def _user(self, session, index: int) -> None:
+        await asyncio.sleep(self.ramp_seconds * index / max(self.users, 1))
+        for _ in range(self.submissions):
+            submitted_at = time.monotonic()
+            task_id = await self._submit(session, self._pick_video())
+            if task_id is not None:
+                await self._follow(session, task_id, submitted_at)
+    
+    async def run(self, pids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Run every user to completion.
+        
+        Args:
+            pids: Server processes whose threads to sample, e.g. the gunicorn master
+        
+        Returns:
+            Metrics of the run
+        """
+        import aiohttp
+        
+        connector = aiohttp.TCPConnector(limit=0)
+        timeout = aiohttp.ClientTimeout(total=60)
+        start = time.perf_counter()
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            sampler = asyncio.ensure_future(self._sample_threads(pids)) if pids else None
+            await asyncio.gather(*(self._user(session, index) for index in range(self.users)))
+            if sampler is not None:
+                sampler.cancel()
+        return self.stats.metrics(time.perf_counter() - start)
+    
+    async def _sample_threads(self, pids: List[int]) -> None:
+        while True:
+            for pid in _process_tree(pids):
+                threads = _thread_count(pid)
+                if threads:
+                    self.stats.peak_threads[pid] = max(self.stats.peak_threads.get(pid, 0), threads)
+            await asyncio.sleep(0.5)
+
+def _process_tree(pids: List[int]) -> List[int]:
+    """The given processes and their children, read from /proc (Linux only)."""
+    tree = list(pids)
+    try:
+        entries = [entry for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return tree
+    for entry in entries:
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The parent PID follows the parenthesized command name
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent in pids:
+            tree.append(int(entry))
+    return tree
+
+def _thread_count(pid: int) -> int:
+    try:
+        return len(os.listdir(f'/proc/{pid}/task'))
+    except OSError:
+        return 0
+
+def _free_port() -> int:
+    import socket
+    
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    import requests
+    
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {process.returncode}")
+        try:
+            if requests.get(base_url + '/api/status', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.05)
+    raise RuntimeError("gunicorn did not become ready in time")
+
+def worker_memory(master_pid: int) -> Dict[str, int]:
+    """
+    Median memory of a gunicorn master's workers, read from /proc (Linux only).
+    
+    Pss charges shared pages proportionally, so it drops when workers share
+    what a preloaded master loaded; private bytes are each worker's own pages.
+    
+    Args:
+        master_pid: PID of the gunicorn master
+    
+    Returns:
+        Dictionary with pss_bytes and private_bytes, zero where unavailable
+    """
+    pss, private = [], []
+    for pid in _process_tree([master_pid])[1:]:
+        fields = {}
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) == 3 and parts[2] == 'kB':
+                        fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+        except (OSError, ValueError):
+            continue
+        pss.append(fields.get('Pss', 0))
+        private.append(fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0))
+    return {
+        "pss_bytes": int(statistics.median(pss)) if pss else 0,
+        "private_bytes": int(statistics.median(private)) if private else 0
+    }
+
+def start_server(workers: int, threads: int, workdir: str, fake_env: Dict[str, str],
+                 extra_args: List[str], app: str = 'benchmarks.stub_app:create_app()') -> Tuple[subprocess.Popen, str]:
+    """
+    Start gunicorn serving benchmarks.stub_app, as the Dockerfile does but with the fakes.
+    
+    Args:
+        workers: Worker processes
+        threads: Threads per worker
+        workdir: Directory for caches, stores and the server log
+        fake_env: BENCH_* variables configuring the fakes
+        extra_args: Extra gunicorn arguments, e.g. ['--preload']
+        app: WSGI app to serve, e.g. 'app:create_app()' for the real backends
+    
+    Returns:
+        The server process and its base URL
+    """
+    port = _free_port()
+    env = dict(os.environ, **benchmark_environment(workdir), **fake_env)
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--worker-class', 'gthread',
+               '--workers', str(workers), '--threads', str(threads), '--timeout', '120',
+               *extra_args, app]
+    log = open(os.path.join(workdir, 'gunicorn.log'), 'w')
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_until_ready(base_url, process)
+    except Exception:
+        stop_server(process)
+        raise
+    return process, base_url
+
+def stop_server(process: subprocess.Popen, timeout: float = 30) -> None:
+    """Stop gunicorn gracefully, killing it if it does not exit in time."""
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+def parse_worker_config(value: str) -> Tuple[int, int]:
+    """Parse a 'WORKERSxTHREADS' configuration such as '4x8'."""
+    match = re.fullmatch(r'(\d+)x(\d+)', value)
+    if not match:
+        raise argparse.ArgumentTypeError(f"expected WORKERSxTHREADS, got {value!r}")
+    return int(match.group(1)), int(match.group(2))
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load-test GPTCheck under gunicorn against fake backends.")
+    parser.add_argument("--configs", type=parse_worker_config, nargs="+", default=[(1, 32), (2, 16), (4, 8)],
+                        help="Worker configurations as WORKERSxTHREADS (default: 1x32 2x16 4x8)")
+    parser.add_argument("--url", help="Test a server that is already running instead of starting gunicorn")
+    parser.add_argument("--gunicorn-args", default="", help="Extra gunicorn arguments, e.g. '--preload'")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--submissions", type=int, default=1, help="Videos each user submits")
+    parser.add_argument("--form-share", type=float, default=0.2, help="Share of submissions through /analyze")
+    parser.add_argument("--duplicate-rate", type=float, default=0.3,
+                        help="Share of submissions of a few popular videos")
+    parser.add_argument("--video-minutes", type=int, default=30)
+    parser.add_argument("--ramp", type=float, default=10, help="Seconds over which users start")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--task-timeout", type=float, default=300)
+    parser.add_argument("--openai-latency", type=float, default=0.5)
+    parser.add_argument("--openai-seconds-per-token", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--transcript-latency", type=float, default=0.3)
+    parser.add_argument("--title-latency", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr)
+    
+    fake_env = {
+        "BENCH_OPENAI_LATENCY": str(args.openai_latency),
+        "BENCH_OPENAI_SECONDS_PER_TOKEN": str(args.openai_seconds_per_token),
+        "BENCH_OPENAI_ERROR_RATE": str(args.openai_error_rate),
+        "BENCH_TRANSCRIPT_LATENCY": str(args.transcript_latency),
+        "BENCH_TITLE_LATENCY": str(args.title_latency),
+        "BENCH_SEED": str(args.seed)
+    }
+    load_params = {"users": args.users, "submissions": args.submissions, "form_share": args.form_share,
+                   "duplicate_rate": args.duplicate_rate, "video_minutes": args.video_minutes}
+    
+    def load_test(base_url: str) -> LoadTest:
+        return LoadTest(base_url, args.users, args.submissions, args.form_share, args.duplicate_rate,
+                        args.video_minutes, args.ramp, args.poll_interval, args.task_timeout, args.seed)
+    
+    results = []
+    if args.url:
+        metrics = asyncio.run(load_test(args.url).run())
+        results.append({"suite": "loadtest", "name": "external", "params": dict(load_params, url=args.url),
+                        "metrics": metrics})
+    else:
+        for workers, threads in args.configs:
+            workdir = tempfile.mkdtemp(prefix="gptcheck-load-")
+            logger.info(f"Starting gunicorn with {workers} workers x {threads} threads in {workdir}")
+            process, base_url = start_server(workers, threads, workdir, fake_env, shlex.split(args.gunicorn_args))
+            try:
+                metrics = asyncio.run(load_test(base_url).run([process.pid]))
+            finally:
+                stop_server(process)
+            params = dict(load_params, workers=workers, threads=threads, gunicorn_args=args.gunicorn_args)
+            results.append({"suite": "loadtest", "name": "gunicorn", "params": params, "metrics": metrics})
+            logger.info(f"{workers}x{threads}: {json.dumps(metrics)}")
+    
+    output = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                       "fakes": fake_env, "ramp_seconds": args.ramp, "poll_interval": args.poll_interval},
+              "results": results}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            output["comparison"] = compare_results(json.load(f), output)
+    
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
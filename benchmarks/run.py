@@ -0,0 +1,485 @@
+"""
+Run the offline benchmark suites and write machine-readable results.
+
+Usage:
+    python -m benchmarks.run [micro] [e2e] [throughput] [memory] [startup] --output results.json
+    python -m benchmarks.run --quick --compare baseline.json
+
+Every run uses a fresh working directory for caches and the task store, and
+fake YouTube and OpenAI backends (see benchmarks.fakes), so results from
+different releases on the same machine can be compared directly.
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import importlib.util
+import tempfile
+import threading
+import statistics
+import subprocess
+import tracemalloc
+import logging
+from typing import Dict, Any, List, Callable, Optional
+
+SUITES = ("micro", "e2e", "throughput", "memory", "startup")
+DEFAULT_DURATIONS = (1, 10, 60, 180, 600)  # minutes, up to a 10 hour video
+DEFAULT_CONCURRENCY = (1, 4, 16, 64)
+RESULT_SCHEMA_VERSION = 1
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter by the startup suite; prints the timings as JSON
+STARTUP_SCRIPT = """
+import sys, time, json
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+status = application.test_client().get('/').status_code
+served = time.perf_counter()
+lazy = [name for name in app.LAZY_MODULES if name in sys.modules]
+app.warm_up(application)
+warmed = time.perf_counter()
+print(json.dumps({"import": imported - start, "create_app": created - imported, "first_request": served - created,
+                  "warm_up": warmed - served, "status": status, "eager_modules": lazy}))
+"""
+STARTUP_SERVER_WORKERS = 4
+STARTUP_SERVER_THREADS = 8
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def benchmark_environment(workdir: str) -> Dict[str, str]:
+    """
+    Build settings that keep a benchmark's state in its working directory.
+    
+    Caches and stores live under workdir, and client-side OpenAI pacing and
+    the inbound rate limit are off, because the fakes have no real limits and
+    all load comes from one address.
+    
+    Args:
+        workdir: Directory for caches and stores
+    
+    Returns:
+        Environment variables for Config
+    """
+    return {
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "TASK_STORE_BACKEND": "sqlite",
+        "TASK_STORE_PATH": os.path.join(workdir, "tasks.db"),
+        "RATE_LIMIT_BACKEND": "sqlite",
+        "RATE_LIMIT_PATH": os.path.join(workdir, "ratelimit.db"),
+        "BATCH_DIR": os.path.join(workdir, "batches"),
+        "OPENAI_RPM_LIMIT": "0",
+        "OPENAI_TPM_LIMIT": "0",
+        "OPENAI_BACKOFF_BASE": "0.05",
+        "RATELIMIT_DEFAULT": "1000000 per second"
+    }
+
+def _configure_environment(workdir: str) -> None:
+    """
+    Apply benchmark_environment to this process, keeping variables already set.
+    
+    Config reads the environment when it is first imported, and worker threads
+    without an app context read Config directly, so this must run before any
+    service module is imported.
+    """
+    defaults = dict(benchmark_environment(workdir), RATE_LIMIT_BACKEND="memory", SCHEDULER_QUEUE_SIZE="1000")
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+def _timings(samples: List[float]) -> Dict[str, float]:
+    return {
+        "runs": len(samples),
+        "min_seconds": round(min(samples), 6),
+        "median_seconds": round(statistics.median(samples), 6),
+        "mean_seconds": round(statistics.fmean(samples), 6),
+        "max_seconds": round(max(samples), 6)
+    }
+
+def latency_percentiles(samples: List[float], prefix: str = "") -> Dict[str, float]:
+    """
+    Summarize latencies as nearest-rank p50, p95, p99 and max.
+    
+    Args:
+        samples: Latencies in seconds
+        prefix: Prefix for the metric names
+    
+    Returns:
+        Metrics, empty if there are no samples
+    """
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    
+    def pick(fraction: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 6)
+    return {f"{prefix}p50_seconds": pick(0.5), f"{prefix}p95_seconds": pick(0.95),
+            f"{prefix}p99_seconds": pick(0.99), f"{prefix}max_seconds": round(ordered[-1], 6)}
+
+def _time(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Run func repeat times and summarize the wall times."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return _timings(samples)
+
+class BenchmarkRunner:
+    """
+    Runs the suites against fake backends and collects results.
+    
+    Args:
+        fakes: Installed FakeBackends
+        durations: Synthetic transcript lengths in minutes
+        concurrency: Numbers of concurrent submissions for the throughput suite
+        repeat: Runs per micro-benchmark
+        throughput_minutes: Transcript length used by the throughput suite
+        timeout: Maximum seconds to wait for one throughput round
+    """
+    
+    def __init__(self, fakes, durations: List[int], concurrency: List[int], repeat: int,
+                 throughput_minutes: int, timeout: float):
+        self.fakes = fakes
+        self.durations = durations
+        self.concurrency = concurrency
+        self.repeat = repeat
+        self.throughput_minutes = throughput_minutes
+        self.timeout = timeout
+        self.results: List[Dict[str, Any]] = []
+        self._next_index = 0
+        self._index_lock = threading.Lock()
+    
+    def _video_url(self, minutes: int) -> str:
+        """A synthetic video no earlier run has seen, so every analysis starts cold."""
+        from .synthetic import synthetic_video_url
+        
+        with self._index_lock:
+            self._next_index += 1
+            return synthetic_video_url(minutes, self._next_index)
+    
+    def _add(self, suite: str, name: str, params: Dict[str, Any], metrics: Dict[str, Any]) -> None:
+        self.results.append({"suite": suite, "name": name, "params": params, "metrics": metrics})
+        logger.info(f"{suite}/{name} {json.dumps(params)}: {json.dumps(metrics)}")
+    
+    def micro(self) -> None:
+        """Transcript parsing, normalization, chunking and report parsing and rendering, without any I/O."""
+        from services.transcripts import Transcript
+        from services.youtube import split_transcript_with_timestamps
+        from services.analysis import split_transcript_into_sections
+        from services.models import SECTION, stage_model
+        from services.normalization import normalize_transcript
+        from services.report import parse_report, parse_partial_report, render_report_html, report_from_text
+        from .synthetic import synthetic_segments, synthetic_summary, synthetic_report
+        
+        for minutes in self.durations:
+            segments = synthetic_segments(minutes)
+            transcript = Transcript.from_segments(segments)
+            params = {"minutes": minutes, "captions": len(segments)}
+            self._add("micro", "transcript_from_segments", params,
+                      _time(lambda: Transcript.from_segments(segments), self.repeat))
+            sections = split_transcript_into_sections(transcript)
+            self._add("micro", "split_transcript_into_sections", dict(params, sections=len(sections)),
+                      _time(lambda: split_transcript_into_sections(transcript), self.repeat))
+            parts = split_transcript_with_timestamps(transcript)
+            self._add("micro", "split_transcript_with_timestamps", dict(params, parts=len(parts)),
+                      _time(lambda: split_transcript_with_timestamps(transcript), self.repeat))
+            
+            noisy = Transcript.from_segments(synthetic_segments(minutes, noisy=True))
+            model = stage_model(SECTION)
+            normalized, stats = normalize_transcript(noisy, model)
+            self._add("micro", "normalize_transcript", dict(params, captions=len(noisy)),
+                      dict(_time(lambda: normalize_transcript(noisy, model), self.repeat),
+                           tokens_saved=stats["tokens_saved"],
+                           sections_before=len(split_transcript_into_sections(noisy)),
+                           sections_after=len(split_transcript_into_sections(normalized))))
+        
+        for claims in (5, 50, 500):
+            text = synthetic_report(claims_per_section=claims)
+            report = parse_report(text, "benchmark")
+            params = {"claims_per_section": claims, "chars": len(text)}
+            self._add("micro", "parse_report", params, _time(lambda: parse_report(text, "benchmark"), self.repeat))
+            self._add("micro", "render_report_html", params,
+                      _time(lambda: render_report_html(report, "m0001i00000"), self.repeat))
+            
+            def stream_render():
+                # Re-parse and render a partial every 20 model-sized chunks, like a streamed summary
+                for end in range(320, len(text), 320):
+                    partial = parse_partial_report(text[:end], "benchmark")
+                    if partial:
+                        render_report_html(partial)
+                return render_report_html(parse_report(text, "benchmark"))
+            self._add("micro", "report_streaming", params, _time(stream_render, self.repeat))
+            
+            summary = synthetic_summary(lines_per_section=claims)
+            self._add("micro", "report_from_text", {"lines_per_section": claims, "chars": len(summary)},
+                      _time(lambda: report_from_text(summary, "benchmark"), self.repeat))
+    
+    def e2e(self) -> None:
+        """process_video latency per transcript length, cold and then from the analysis cache."""
+        from services.analysis import process_video
+        
+        for minutes in self.durations:
+            url = self._video_url(minutes)
+            self.fakes.reset_stats()
+            start = time.perf_counter()
+            result = process_video(url, "sk-benchmark")
+            cold = time.perf_counter() - start
+            calls = self.fakes.reset_stats()
+            
+            start = time.perf_counter()
+            process_video(url, "sk-benchmark")
+            warm = time.perf_counter() - start
+            
+            self._add("e2e", "process_video", {"minutes": minutes}, {
+                "cold_seconds": round(cold, 6),
+                "cached_seconds": round(warm, 6),
+                "openai_calls": calls["openai_calls"],
+                "openai_errors": calls["openai_errors"],
+                "openai_prompt_tokens": calls["openai_prompt_tokens"],
+                "result_chars": len(result['html']) if isinstance(result, dict) else len(result)
+            })
+    
+    def throughput(self) -> None:
+        """Tasks per second with N submissions arriving at once through the task layer."""
+        from services.analysis import process_video
+        from services.scheduler import Priority, QueueFullError
+        from services.tasks import (get_or_create_video_analysis_task, enqueue_task, get_task_statuses,
+                                    task_progress_callback, task_partial_callback, ACTIVE_STATUSES)
+        from flask import current_app
+        
+        app = current_app._get_current_object()
+        for concurrency in self.concurrency:
+            urls = [self._video_url(self.throughput_minutes) for _ in range(concurrency)]
+            task_ids: List[str] = []
+            rejected = [0]
+            lock = threading.Lock()
+            barrier = threading.Barrier(concurrency)
+            
+            def submit(url: str) -> None:
+                with app.app_context():
+                    barrier.wait()
+                    task_id = get_or_create_video_analysis_task(url, "sk-benchmark")
+                    try:
+                        enqueue_task(task_id, process_video, url, "sk-benchmark", priority=Priority.API,
+                                     progress_callback=task_progress_callback(task_id),
+                                     partial_callback=task_partial_callback(task_id))
+                    except QueueFullError:
+                        with lock:
+                            rejected[0] += 1
+                        return
+                    with lock:
+                        task_ids.append(task_id)
+            
+            self.fakes.reset_stats()
+            start = time.perf_counter()
+            threads = [threading.Thread(target=submit, args=(url,)) for url in urls]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            deadline = time.time() + self.timeout
+            tasks = {}
+            while time.time() < deadline:
+                tasks = get_task_statuses(task_ids)
+                if all(task["status"] not in ACTIVE_STATUSES for task in tasks.values()):
+                    break
+                time.sleep(0.02)
+            elapsed = time.perf_counter() - start
+            
+            completed = [task for task in tasks.values() if task["status"] == "completed"]
+            latencies = [task["updated_at"] - task["created_at"] for task in completed]
+            calls = self.fakes.reset_stats()
+            self._add("throughput", "concurrent_submissions",
+                      {"concurrency": concurrency, "minutes": self.throughput_minutes}, dict({
+                          "wall_seconds": round(elapsed, 6),
+                          "tasks_per_second": round(len(completed) / elapsed, 3) if elapsed else 0.0,
+                          "completed": len(completed),
+                          "failed": sum(1 for task in tasks.values() if task["status"] == "failed"),
+                          "unfinished": sum(1 for task in tasks.values() if task["status"] in ACTIVE_STATUSES),
+                          "lost": len(task_ids) - len(tasks),
+                          "rejected": rejected[0],
+                          "openai_calls": calls["openai_calls"],
+                          "openai_errors": calls["openai_errors"]
+                      }, **latency_percentiles(latencies)))
+    
+    def memory(self) -> None:
+        """Peak Python heap allocated while one task runs, per transcript length."""
+        from services.analysis import process_video
+        
+        for minutes in self.durations:
+            url = self._video_url(minutes)
+            gc.collect()
+            tracemalloc.start()
+            try:
+                before, _ = tracemalloc.get_traced_memory()
+                process_video(url, "sk-benchmark")
+                gc.collect()
+                after, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self._add("memory", "process_video", {"minutes": minutes}, {
+                "peak_bytes": peak - before,
+                "retained_bytes": after - before
+            })
+    
+    def startup(self) -> None:
+        """Cold start of the app in a fresh interpreter, and gunicorn boot with and without --preload."""
+        samples: Dict[str, List[float]] = {"process": [], "import": [], "create_app": [], "first_request": [],
+                                           "warm_up": []}
+        eager_modules = set()
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], cwd=REPO_ROOT, capture_output=True,
+                                       text=True, timeout=120, check=True)
+            samples["process"].append(time.perf_counter() - start)
+            timings = json.loads(completed.stdout.strip().splitlines()[-1])
+            eager_modules.update(timings["eager_modules"])
+            for name in samples:
+                if name != "process":
+                    samples[name].append(timings[name])
+        metrics = _timings(samples.pop("process"))
+        for name, values in samples.items():
+            metrics[f"{name}_median_seconds"] = round(statistics.median(values), 6)
+        metrics["eager_modules"] = sorted(eager_modules)
+        self._add("startup", "create_app", {}, metrics)
+        
+        if importlib.util.find_spec("gunicorn") is None:
+            logger.warning("gunicorn is not installed, skipping the server boot benchmark")
+            return
+        from .loadtest import start_server, stop_server, worker_memory
+        
+        for preload in (False, True):
+            boots, memory = [], []
+            for _ in range(self.repeat):
+                workdir = tempfile.mkdtemp(prefix="gptcheck-startup-")
+                start = time.perf_counter()
+                process, _ = start_server(STARTUP_SERVER_WORKERS, STARTUP_SERVER_THREADS, workdir, {},
+                                          ["--preload"] if preload else [], app="app:create_app()")
+                boots.append(time.perf_counter() - start)
+                memory.append(worker_memory(process.pid))
+                stop_server(process)
+            self._add("startup", "gunicorn_boot",
+                      {"preload": preload, "workers": STARTUP_SERVER_WORKERS, "threads": STARTUP_SERVER_THREADS},
+                      dict(_timings(boots),
+                           worker_pss_bytes=int(statistics.median(m["pss_bytes"] for m in memory)),
+                           worker_private_bytes=int(statistics.median(m["private_bytes"] for m in memory))))
+
+def _metadata(args: argparse.Namespace, fake_config) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5,
+                                cwd=REPO_ROOT).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "schema": RESULT_SCHEMA_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "suites": args.suites,
+        "fakes": fake_config.to_dict()
+    }
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Pair up the numeric metrics of two result files.
+    
+    Args:
+        baseline: Earlier results
+        current: New results
+    
+    Returns:
+        One row per metric present in both, with the relative change
+    """
+    def key(result: Dict[str, Any]) -> str:
+        return json.dumps([result["suite"], result["name"], result["params"]], sort_keys=True)
+    
+    earlier = {key(result): result for result in baseline.get("results", [])}
+    rows = []
+    for result in current.get("results", []):
+        match = earlier.get(key(result))
+        if match is None:
+            continue
+        for metric, value in result["metrics"].items():
+            old = match["metrics"].get(metric)
+            if isinstance(value, (int, float)) and isinstance(old, (int, float)):
+                rows.append({"suite": result["suite"], "name": result["name"], "params": result["params"],
+                             "metric": metric, "baseline": old, "current": value,
+                             "change": round((value - old) / old, 4) if old else None})
+    return rows
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run GPTCheck's offline benchmarks against fake backends.")
+    parser.add_argument("suites", nargs="*", help=f"Suites to run: {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--durations", type=int, nargs="+", default=list(DEFAULT_DURATIONS),
+                        help="Synthetic transcript lengths in minutes")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=list(DEFAULT_CONCURRENCY),
+                        help="Concurrent submissions for the throughput suite")
+    parser.add_argument("--throughput-minutes", type=int, default=30, help="Transcript length for the throughput suite")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per micro-benchmark")
+    parser.add_argument("--timeout", type=float, default=600, help="Maximum seconds per throughput round")
+    parser.add_argument("--quick", action="store_true", help="Short durations and fewer runs, for a smoke check")
+    parser.add_argument("--openai-latency", type=float, default=0.05)
+    parser.add_argument("--openai-seconds-per-token", type=float, default=0.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--transcript-latency", type=float, default=0.1)
+    parser.add_argument("--transcript-error-rate", type=float, default=0.0)
+    parser.add_argument("--title-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="Directory for caches and the task store (default: a new temp dir)")
+    parser.add_argument("--output", help="Write results as JSON to this file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Log each result and the app's own logs")
+    args = parser.parse_args(argv)
+    unknown = [suite for suite in args.suites if suite not in SUITES]
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(unknown)}")
+    args.suites = args.suites or list(SUITES)
+    if args.quick:
+        args.durations = [minutes for minutes in args.durations if minutes <= 60] or [1]
+        args.concurrency = [n for n in args.concurrency if n <= 4] or [1]
+        args.repeat = min(args.repeat, 3)
+    
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr)
+    if args.verbose:
+        logger.setLevel(logging.INFO)
+    _configure_environment(args.workdir or tempfile.mkdtemp(prefix="gptcheck-bench-"))
+    
+    from app import create_app
+    from .fakes import FakeBackends, FakeBackendConfig
+    
+    fake_config = FakeBackendConfig(
+        openai_latency=args.openai_latency, openai_seconds_per_token=args.openai_seconds_per_token,
+        openai_error_rate=args.openai_error_rate, transcript_latency=args.transcript_latency,
+        transcript_error_rate=args.transcript_error_rate, title_latency=args.title_latency, seed=args.seed)
+    app = create_app()
+    with app.app_context(), FakeBackends(fake_config) as fakes:
+        runner = BenchmarkRunner(fakes, args.durations, args.concurrency, args.repeat,
+                                 args.throughput_minutes, args.timeout)
+        for suite in SUITES:
+            if suite in args.suites:
+                getattr(runner, suite)()
+    
+    output = {"meta": _metadata(args, fake_config), "results": runner.results}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            output["comparison"] = compare_results(json.load(f), output)
+    
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+"""
+The Flask app with the benchmark fakes installed, for serving under gunicorn:
+
+    gunicorn --worker-class gthread "benchmarks.stub_app:create_app()"
+
+The fakes are configured through BENCH_* environment variables, see
+FakeBackendConfig.from_environ.
+"""
+from app import create_app as create_real_app
+from .fakes import FakeBackends, FakeBackendConfig
+
+_fakes = None
+
+def create_app():
+    global _fakes
+    if _fakes is None:
+        _fakes = FakeBackends(FakeBackendConfig.from_environ()).install()
+    return create_real_app()
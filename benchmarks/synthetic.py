@@ -0,0 +1,142 @@
+import re
+import json
+import random
+from typing import Dict, Any, List, Optional
+
+# Seconds of speech per caption and words per caption, roughly what YouTube auto-captions produce
+CAPTION_SECONDS = 3.0
+WORDS_PER_CAPTION = 8
+
+VOCABULARY = ("the", "ancient", "pyramid", "builders", "used", "copper", "tools", "and", "ramps", "to", "move",
+              "limestone", "blocks", "scientists", "believe", "that", "evidence", "shows", "a", "civilization",
+              "older", "than", "recorded", "history", "may", "have", "existed", "according", "some", "myths",
+              "describe", "flood", "which", "geologists", "dispute", "radiocarbon", "dating", "suggests",
+              "thousand", "years", "ago", "this", "claim", "is", "speculative", "temple", "astronomy", "aligned")
+
+# Noise found in auto-generated captions, mixed in by synthetic_segments(noisy=True)
+NON_SPEECH_MARKERS = ("[Music]", "[Applause]", "[Laughter]", "♪")
+FILLER_WORDS = ("um", "uh", "umm", "hmm")
+
+VIDEO_ID_PATTERN = re.compile(r'^m(\d{4})i(\d{5})$')
+
+def synthetic_video_id(minutes: int, index: int = 0) -> str:
+    """
+    Build an 11-character video ID that encodes the length of its synthetic transcript.
+    
+    Args:
+        minutes: Transcript length in minutes, up to 9999
+        index: Distinguishes videos of the same length, up to 99999
+    
+    Returns:
+        Video ID accepted by get_video_id
+    """
+    return f"m{minutes:04d}i{index:05d}"
+
+def synthetic_video_url(minutes: int, index: int = 0) -> str:
+    """Build a watch URL for a synthetic video."""
+    return f"https://www.youtube.com/watch?v={synthetic_video_id(minutes, index)}"
+
+def parse_synthetic_video_id(video_id: str) -> Optional[int]:
+    """
+    Get the transcript length encoded in a synthetic video ID.
+    
+    Args:
+        video_id: Video ID
+    
+    Returns:
+        Length in minutes, or None if the ID is not synthetic
+    """
+    match = VIDEO_ID_PATTERN.match(video_id)
+    return int(match.group(1)) if match else None
+
+def synthetic_segments(minutes: float, seed: Any = 0, noisy: bool = False) -> List[Dict[str, Any]]:
+    """
+    Generate caption segments shaped like a YouTube transcript.
+    
+    Captions last about CAPTION_SECONDS; about one in five ends a sentence and
+    about one in twelve is followed by a pause, so the chunker sees both kinds
+    of boundary. The same arguments always give the same transcript.
+    
+    Args:
+        minutes: Transcript length in minutes
+        seed: Random seed, e.g. the video ID so every video has its own text
+        noisy: Add non-speech markers, filler words and rolling-caption repeats
+    
+    Returns:
+        List of segments with text, start and duration
+    """
+    rng = random.Random(f"{minutes}:{seed}")
+    segments = []
+    start, end = 0.0, minutes * 60
+    previous: List[str] = []
+    while start < end:
+        words = rng.choices(VOCABULARY, k=rng.randint(WORDS_PER_CAPTION - 3, WORDS_PER_CAPTION + 3))
+        if noisy:
+            if previous and rng.random() < 0.5:
+                words = previous[-rng.randint(2, 4):] + words
+            previous = list(words)
+            for _ in range(rng.randint(0, 2)):
+                words.insert(rng.randint(0, len(words)), rng.choice(FILLER_WORDS))
+            if rng.random() < 0.05:
+                words.insert(0, rng.choice(NON_SPEECH_MARKERS))
+        text = " ".join(words)
+        if rng.random() < 0.2:
+            text = text.capitalize() + "."
+        duration = round(rng.uniform(0.6, 1.4) * CAPTION_SECONDS, 3)
+        segments.append({"text": text, "start": round(start, 3), "duration": duration})
+        start += duration + (rng.uniform(1.0, 3.0) if rng.random() < 1 / 12 else 0.0)
+    return segments
+
+def synthetic_summary(sections: int = 5, lines_per_section: int = 12, seed: int = 0) -> str:
+    """
+    Generate free-form summary text with the headings report_from_text recognizes.
+    
+    Args:
+        sections: Number of headed sections, at most the number of summary headings
+        lines_per_section: Bullet lines under each heading
+        seed: Random seed
+    
+    Returns:
+        Summary text as the model would return it
+    """
+    from services.report import REPORT_CATEGORIES
+    
+    rng = random.Random(seed)
+    lines = []
+    for heading in (["Summary"] + REPORT_CATEGORIES)[:sections]:
+        lines.append(f"## {heading}")
+        for _ in range(lines_per_section):
+            lines.append("- " + " ".join(rng.choices(VOCABULARY, k=14)).capitalize() + ".")
+    return "\n".join(lines)
+
+def synthetic_report(sections: int = 4, claims_per_section: int = 12, seed: int = 0) -> str:
+    """
+    Generate a JSON report as the model returns it for the summary prompt.
+    
+    Args:
+        sections: Number of categories, at most the number of report categories
+        claims_per_section: Claims under each category
+        seed: Random seed
+    
+    Returns:
+        JSON report text
+    """
+    from services.report import REPORT_CATEGORIES, VERDICTS
+    
+    rng = random.Random(seed)
+    
+    def sentence(words: int) -> str:
+        return " ".join(rng.choices(VOCABULARY, k=words)).capitalize() + "."
+    
+    return json.dumps({
+        "summary": sentence(40),
+        "sections": [{
+            "category": category,
+            "claims": [{
+                "claim": sentence(14),
+                "verdict": rng.choice(VERDICTS),
+                "explanation": sentence(20),
+                "timestamp": f"0:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+            } for _ in range(claims_per_section)]
+        } for category in REPORT_CATEGORIES[:sections]]
+    })
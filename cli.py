@@ -0,0 +1,54 @@
+import sys
+import json
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from services.batch import (read_video_urls, create_batch_job, run_batch_job, get_batch_job, summarize_batch_job)
+
+batch_cli = AppGroup('batch', help='Offline batch analysis of many videos.')
+
+def _api_key(api_key):
+    api_key = api_key or current_app.config.get('OPENAI_API_KEY')
+    if not api_key:
+        raise click.UsageError("An OpenAI API key is required (--api-key or OPENAI_API_KEY)")
+    return api_key
+
+@batch_cli.command('submit')
+@click.argument('source', type=click.File('r'))
+@click.option('--api-key', help='OpenAI API key, defaults to OPENAI_API_KEY')
+@click.option('--detach', is_flag=True, help='Exit once the section requests are submitted')
+def submit(source, api_key, detach):
+    """Analyze the videos listed in SOURCE (URLs or JSONL, - for stdin)."""
+    api_key = _api_key(api_key)
+    urls = read_video_urls(source)
+    if not urls:
+        raise click.UsageError("No video URLs found")
+    
+    job = create_batch_job(urls, api_key)
+    click.echo(f"Created batch job {job['id']} for {len(job['videos'])} video(s)", err=True)
+    job = run_batch_job(job['id'], api_key, wait=not detach)
+    click.echo(json.dumps(summarize_batch_job(job), indent=2))
+    if job['status'] == 'failed':
+        sys.exit(1)
+
+@batch_cli.command('run')
+@click.argument('job_id')
+@click.option('--api-key', help='OpenAI API key the job was created with, defaults to OPENAI_API_KEY')
+def run(job_id, api_key):
+    """Resume a batch job and wait for it to finish."""
+    try:
+        job = run_batch_job(job_id, _api_key(api_key))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(json.dumps(summarize_batch_job(job), indent=2))
+    if job['status'] == 'failed':
+        sys.exit(1)
+
+@batch_cli.command('status')
+@click.argument('job_id')
+def status(job_id):
+    """Show the status of a batch job."""
+    job = get_batch_job(job_id)
+    if job is None:
+        raise click.ClickException("Batch job not found")
+    click.echo(json.dumps(summarize_batch_job(job), indent=2))
@@ -7,7 +7,7 @@ load_dotenv()
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
-    CACHE_DIR = os.path.join('instance', 'cache')
+    CACHE_DIR = os.environ.get('CACHE_DIR') or os.path.join('instance', 'cache')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max upload size
     
     # Redis configuration for task queue (if needed)
@@ -19,5 +19,120 @@ class Config:
     SESSION_USE_SIGNER = True
     
     # API Rate limiting
-    RATELIMIT_DEFAULT = "200 per day;50 per hour"
-    RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://' 
\ No newline at end of file
+    RATELIMIT_DEFAULT = os.environ.get('RATELIMIT_DEFAULT') or "200 per day;50 per hour"
+    RATELIMIT_STORAGE_URL = os.environ.get('REDIS_URL') or 'memory://'
+    
+    # Token buckets for inbound limits and outbound OpenAI traffic ('sqlite', 'redis' or 'memory'),
+    # shared by all worker processes. The OpenAI limits apply per API key and model; 0 disables them.
+    RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND') or 'sqlite'
+    RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH') or os.path.join('instance', 'ratelimit.db')
+    OPENAI_RPM_LIMIT = int(os.environ.get('OPENAI_RPM_LIMIT') or 3500)
+    OPENAI_TPM_LIMIT = int(os.environ.get('OPENAI_TPM_LIMIT') or 200000)
+    
+    # OpenAI client: retries with exponential backoff and jitter, pooled connections per key
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES') or 4)
+    OPENAI_BACKOFF_BASE = float(os.environ.get('OPENAI_BACKOFF_BASE') or 1.0)
+    OPENAI_BACKOFF_MAX = float(os.environ.get('OPENAI_BACKOFF_MAX') or 30)
+    OPENAI_REQUEST_TIMEOUT = float(os.environ.get('OPENAI_REQUEST_TIMEOUT') or 120)
+    OPENAI_POOL_SIZE = int(os.environ.get('OPENAI_POOL_SIZE') or 16)
+    
+    # Model for each analysis stage, tried in order with its comma-separated fallbacks when a call
+    # times out or the model is overloaded. 'local:<model>' names a model on the OpenAI-compatible
+    # server at LOCAL_MODEL_BASE_URL (vLLM, llama.cpp, Ollama or benchmarks/fake_openai_server.py).
+    SECTION_MODEL = os.environ.get('SECTION_MODEL') or 'gpt-3.5-turbo-0125'
+    SECTION_FALLBACK_MODELS = os.environ.get('SECTION_FALLBACK_MODELS') or ''
+    MERGE_MODEL = os.environ.get('MERGE_MODEL') or SECTION_MODEL
+    MERGE_FALLBACK_MODELS = os.environ.get('MERGE_FALLBACK_MODELS') or SECTION_FALLBACK_MODELS
+    SUMMARY_MODEL = os.environ.get('SUMMARY_MODEL') or 'gpt-3.5-turbo-0125'
+    SUMMARY_FALLBACK_MODELS = os.environ.get('SUMMARY_FALLBACK_MODELS') or ''
+    # Retries on a model before moving to its fallback (the last model uses OPENAI_MAX_RETRIES)
+    MODEL_FALLBACK_RETRIES = int(os.environ.get('MODEL_FALLBACK_RETRIES') or 1)
+    LOCAL_MODEL_BASE_URL = os.environ.get('LOCAL_MODEL_BASE_URL') or 'http://localhost:8000/v1'
+    LOCAL_MODEL_API_KEY = os.environ.get('LOCAL_MODEL_API_KEY') or 'local'
+    LOCAL_MODEL_CONTEXT_WINDOW = int(os.environ.get('LOCAL_MODEL_CONTEXT_WINDOW') or 8192)
+    
+    # Section analysis concurrency
+    ANALYSIS_MAX_CONCURRENCY = int(os.environ.get('ANALYSIS_MAX_CONCURRENCY') or 8)
+    ANALYSIS_MAX_CONCURRENCY_PER_KEY = int(os.environ.get('ANALYSIS_MAX_CONCURRENCY_PER_KEY') or 4)
+    SECTION_ANALYSIS_RETRIES = int(os.environ.get('SECTION_ANALYSIS_RETRIES') or 2)
+    
+    # Transcript chunking (0 uses the model's full context budget)
+    CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS') or 0)
+    CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS') or 0)
+    CHUNK_PAUSE_SECONDS = float(os.environ.get('CHUNK_PAUSE_SECONDS') or 1.0)
+    
+    # Clean up transcripts before chunking: non-speech markers, repeated rolling captions, filler words
+    TRANSCRIPT_NORMALIZE = (os.environ.get('TRANSCRIPT_NORMALIZE') or 'true').lower() == 'true'
+    TRANSCRIPT_REMOVE_FILLER = (os.environ.get('TRANSCRIPT_REMOVE_FILLER') or 'true').lower() == 'true'
+    
+    # Tree-reduce section analyses that do not fit in one summary prompt
+    SUMMARY_TREE_REDUCE = (os.environ.get('SUMMARY_TREE_REDUCE') or 'true').lower() == 'true'
+    SUMMARY_MERGE_MAX_GROUP = int(os.environ.get('SUMMARY_MERGE_MAX_GROUP') or 0)
+    
+    # Stream the comprehensive summary to clients as it is generated
+    SUMMARY_STREAMING = (os.environ.get('SUMMARY_STREAMING') or 'true').lower() == 'true'
+    SUMMARY_STREAM_INTERVAL = float(os.environ.get('SUMMARY_STREAM_INTERVAL') or 0.5)
+    
+    # Request the summary report in JSON mode (disable for models without response_format support)
+    SUMMARY_JSON_MODE = (os.environ.get('SUMMARY_JSON_MODE') or 'true').lower() == 'true'
+    
+    # Analysis cache (in-process LRU in front of CACHE_DIR)
+    CACHE_TTL = int(os.environ.get('CACHE_TTL') or 30 * 24 * 3600)
+    CACHE_MEMORY_MAX_ENTRIES = int(os.environ.get('CACHE_MEMORY_MAX_ENTRIES') or 256)
+    CACHE_DISK_MAX_BYTES = int(os.environ.get('CACHE_DISK_MAX_BYTES') or 512 * 1024 * 1024)
+    
+    # YouTube metadata lookups
+    METADATA_CACHE_TTL = int(os.environ.get('METADATA_CACHE_TTL') or 24 * 3600)
+    YOUTUBE_HTTP_TIMEOUT = float(os.environ.get('YOUTUBE_HTTP_TIMEOUT') or 5)
+    
+    # Task store shared by all worker processes ('sqlite', 'redis' or 'memory')
+    TASK_STORE_BACKEND = os.environ.get('TASK_STORE_BACKEND') or 'sqlite'
+    TASK_STORE_PATH = os.environ.get('TASK_STORE_PATH') or os.path.join('instance', 'tasks.db')
+    TASK_RETENTION_SECONDS = int(os.environ.get('TASK_RETENTION_SECONDS') or 7 * 24 * 3600)
+    TASK_CLEANUP_INTERVAL = int(os.environ.get('TASK_CLEANUP_INTERVAL') or 3600)
+    TASK_STALE_SECONDS = int(os.environ.get('TASK_STALE_SECONDS') or 900)
+    TASK_EVENTS_POLL_INTERVAL = float(os.environ.get('TASK_EVENTS_POLL_INTERVAL') or 1.0)
+    TASK_EVENTS_MAX_DURATION = int(os.environ.get('TASK_EVENTS_MAX_DURATION') or 300)
+    
+    # Offline batch analysis ('openai' uses the Batch API, 'local' runs requests in-process)
+    BATCH_BACKEND = os.environ.get('BATCH_BACKEND') or 'openai'
+    BATCH_DIR = os.environ.get('BATCH_DIR') or os.path.join('instance', 'batches')
+    BATCH_POLL_INTERVAL = float(os.environ.get('BATCH_POLL_INTERVAL') or 60)
+    BATCH_COMPLETION_WINDOW = os.environ.get('BATCH_COMPLETION_WINDOW') or '24h'
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS') or 50000)
+    
+    # Bulk analyze API
+    BULK_MAX_URLS = int(os.environ.get('BULK_MAX_URLS') or 500)
+    BULK_MAX_QUEUED = int(os.environ.get('BULK_MAX_QUEUED') or 50)
+    BULK_DISPATCH_INTERVAL = float(os.environ.get('BULK_DISPATCH_INTERVAL') or 2.0)
+    
+    # Job scheduler (per worker process)
+    SCHEDULER_WORKERS = int(os.environ.get('SCHEDULER_WORKERS') or 4)
+    SCHEDULER_QUEUE_SIZE = int(os.environ.get('SCHEDULER_QUEUE_SIZE') or 100)
+    SCHEDULER_DRAIN_TIMEOUT = int(os.environ.get('SCHEDULER_DRAIN_TIMEOUT') or 25)
+    
+    # Discord bot (discord_bot.py); analyses in flight are limited per server
+    DISCORD_TOKEN = os.environ.get('DISCORD_TOKEN')
+    DISCORD_GUILD_MAX_ACTIVE = int(os.environ.get('DISCORD_GUILD_MAX_ACTIVE') or 3)
+    DISCORD_POLL_INTERVAL = float(os.environ.get('DISCORD_POLL_INTERVAL') or 3.0)
+    DISCORD_WATCH_TIMEOUT = int(os.environ.get('DISCORD_WATCH_TIMEOUT') or 3600)
+
+def get_setting(name, default=None):
+    """
+    Read a configuration value from the active Flask app, falling back to Config.
+    
+    Background threads run without an application context, so services use this
+    instead of reading current_app.config directly.
+    
+    Args:
+        name: Configuration key
+        default: Value returned when the key is not set
+        
+    Returns:
+        Configuration value
+    """
+    from flask import current_app, has_app_context
+    
+    if has_app_context():
+        return current_app.config.get(name, default)
+    return getattr(Config, name, default)
@@ -1,23 +0,0 @@
-import discord
-from discord.ext import commands
-import os
-
-# Use the command prefix you prefer
-bot = commands.Bot(command_prefix='!')
-
-@bot.event
-async def on_ready():
-    print(f'Logged in as {bot.user.name}')
-
-@bot.command(name='analyze', help='Analyzes a YouTube video transcript. Usage: !analyze <YouTube URL>')
-async def analyze(ctx, youtube_url: str):
-    # Assuming you have a function `process_video` that takes a YouTube URL,
-    # fetches the video title, gets the transcript, and returns an analysis.
-    # Replace this with your actual function that does the analysis.
-    result = process_video(youtube_url)
-    
-    # Send the result back to the Discord channel
-    await ctx.send(result)
-
-# Replace 'your_token_here' with your actual Discord bot token
-bot.run('your_token_here')
@@ -0,0 +1,314 @@
+"""
+Discord front-end for the video analyzer.
+
+Analyses go through the same task store, scheduler and caches as the web
+app, so a video analyzed from Discord is reused by the site and vice versa.
+Run with DISCORD_TOKEN and OPENAI_API_KEY set:
+
+    python discord_bot.py
+"""
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Set
+import discord
+from discord.ext import commands
+from config import get_setting
+from services.youtube import get_video_id
+from services.analysis import process_video
+from services.report import render_report_markdown
+from services.scheduler import Priority, QueueFullError
+from services.tasks import (TaskStatus, ACTIVE_STATUSES, get_or_create_video_analysis_task, get_task_status,
+                            enqueue_task, task_progress_callback, get_queue_position)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Discord rejects messages over 2000 characters; leave room for the page footer
+PAGE_LENGTH = 1900
+
+def split_pages(text: str, limit: int = PAGE_LENGTH) -> List[str]:
+    """
+    Split text into message-sized pages, breaking between lines where possible.
+    
+    Args:
+        text: Text to split
+        limit: Maximum characters per page
+    
+    Returns:
+        Non-empty list of pages
+    """
+    pages, page = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if page:
+                pages.append(page)
+                page = ""
+            pages.append(line[:limit])
+            line = line[limit:]
+        if page and len(page) + 1 + len(line) > limit:
+            pages.append(page)
+            page = line
+        else:
+            page = f"{page}\n{line}" if page else line
+    if page or not pages:
+        pages.append(page)
+    return pages
+
+class GuildLimiter:
+    """
+    Limit how many analyses each guild can have in flight.
+    
+    Only used from the bot's event loop, so no locking is needed. Analyses
+    of a video a guild is already waiting on do not take another slot.
+    """
+    
+    def __init__(self, max_active: int):
+        self.max_active = max_active
+        self._active: Dict[int, Set[str]] = {}
+    
+    def acquire(self, guild_id: int, task_id: str) -> bool:
+        """
+        Take a slot for a task.
+        
+        Args:
+            guild_id: Guild ID, or the user ID for direct messages
+            task_id: ID of the analysis task
+        
+        Returns:
+            False if the guild is at its limit
+        """
+        active = self._active.setdefault(guild_id, set())
+        if task_id not in active:
+            if len(active) >= self.max_active:
+                return False
+            active.add(task_id)
+        return True
+    
+    def holds(self, guild_id: int, task_id: str) -> bool:
+        """Check whether a guild already holds a slot for a task."""
+        return task_id in self._active.get(guild_id, ())
+    
+    def release(self, guild_id: int, task_id: str) -> None:
+        """Give back the slot a guild holds for a task."""
+        active = self._active.get(guild_id)
+        if active is not None:
+            active.discard(task_id)
+            if not active:
+                del self._active[guild_id]
+
+class ReportPages(discord.ui.View):
+    """Previous and next buttons for a result that spans several pages."""
+    
+    def __init__(self, pages: List[str], timeout: float = 900):
+        super().__init__(timeout=timeout)
+        self.pages = pages
+        self.index = 0
+        self.message: Optional[discord.Message] = None
+        self._update_buttons()
+    
+    def content(self) -> str:
+        return f"{self.pages[self.index]}\n\n*Page {self.index + 1}/{len(self.pages)}*"
+    
+    def _update_buttons(self) -> None:
+        self.previous_page.disabled = self.index == 0
+        self.next_page.disabled = self.index == len(self.pages) - 1
+    
+    async def _show(self, interaction: discord.Interaction, index: int) -> None:
+        self.index = max(0, min(index, len(self.pages) - 1))
+        self._update_buttons()
+        await interaction.response.edit_message(content=self.content(), view=self)
+    
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self._show(interaction, self.index - 1)
+    
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button) -> None:
+        await self._show(interaction, self.index + 1)
+    
+    async def on_timeout(self) -> None:
+        # Keep the current page but drop the buttons, which stop working after the timeout
+        if self.message is not None:
+            try:
+                await self.message.edit(view=None)
+            except discord.HTTPException:
+                pass
+
+class _Watch:
+    """Messages waiting on one analysis task, across channels and guilds."""
+    
+    def __init__(self, task_id: str, youtube_url: str):
+        self.task_id = task_id
+        self.youtube_url = youtube_url
+        self.messages: Dict[int, discord.Message] = {}  # channel ID -> status message
+        self.guilds: Set[int] = set()
+        self.follower: Optional[asyncio.Task] = None
+
+class AnalysisCog(commands.Cog):
+    """
+    The !analyze command.
+    
+    Each request is acknowledged at once and the acknowledgement is edited as
+    the task progresses. Blocking task store calls run in worker threads, so
+    the gateway heartbeat is never held up, and requests for a video that is
+    already being watched share one poller.
+    """
+    
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.limiter = GuildLimiter(get_setting('DISCORD_GUILD_MAX_ACTIVE', 3))
+        self._watches: Dict[str, _Watch] = {}
+    
+    @commands.command(name='analyze', help='Analyzes a YouTube video transcript. Usage: !analyze <YouTube URL>')
+    async def analyze(self, ctx: commands.Context, youtube_url: str) -> None:
+        api_key = get_setting('OPENAI_API_KEY')
+        if not api_key:
+            await ctx.reply("The bot has no OpenAI API key configured.", mention_author=False)
+            return
+        if get_video_id(youtube_url) is None:
+            await ctx.reply("That does not look like a YouTube video URL.", mention_author=False)
+            return
+        
+        try:
+            task_id = await asyncio.to_thread(get_or_create_video_analysis_task, youtube_url, api_key)
+        except Exception as e:
+            logger.error(f"Could not create analysis task for {youtube_url}: {e}")
+            await ctx.reply("Could not start the analysis, please try again later.", mention_author=False)
+            return
+        
+        watch = self._watches.get(task_id)
+        if watch is not None and ctx.channel.id in watch.messages:
+            await ctx.reply(f"This video is already being analyzed: {watch.messages[ctx.channel.id].jump_url}",
+                            mention_author=False)
+            return
+        
+        guild_id = ctx.guild.id if ctx.guild else ctx.author.id
+        # The slot may already be held by this guild's watch of the video in another channel
+        held = self.limiter.holds(guild_id, task_id)
+        if not self.limiter.acquire(guild_id, task_id):
+            await ctx.reply(f"This server already has {self.limiter.max_active} analyses running, "
+                            "please wait for one to finish.", mention_author=False)
+            return
+        
+        try:
+            status = await asyncio.to_thread(self._submit, task_id, youtube_url, api_key)
+        except QueueFullError:
+            if not held:
+                self.limiter.release(guild_id, task_id)
+            await ctx.reply("The analyzer is busy right now, please try again in a minute.", mention_author=False)
+            return
+        except Exception as e:
+            if not held:
+                self.limiter.release(guild_id, task_id)
+            logger.error(f"Could not queue task {task_id}: {e}")
+            await ctx.reply("Could not start the analysis, please try again later.", mention_author=False)
+            return
+        
+        message = await ctx.reply(self._progress_text(youtube_url, status), mention_author=False)
+        # Another request for the same video may have started following it while this one was replying
+        watch = self._watches.get(task_id)
+        if watch is None:
+            watch = self._watches[task_id] = _Watch(task_id, youtube_url)
+            watch.follower = asyncio.create_task(self._follow(watch))
+        watch.messages[ctx.channel.id] = message
+        watch.guilds.add(guild_id)
+    
+    @staticmethod
+    def _submit(task_id: str, youtube_url: str, api_key: str) -> Dict[str, Any]:
+        """Queue the task unless it is already queued, running or done; runs in a worker thread."""
+        status = get_task_status(task_id)
+        if status['status'] == TaskStatus.PENDING:
+            enqueue_task(task_id, process_video, youtube_url, api_key,
+                         priority=Priority.DISCORD,
+                         progress_callback=task_progress_callback(task_id))
+            status = get_task_status(task_id)
+        if status['status'] == TaskStatus.QUEUED:
+            status['queue_position'] = get_queue_position(task_id)
+        return status
+    
+    @staticmethod
+    def _progress_text(youtube_url: str, status: Dict[str, Any]) -> str:
+        if status['status'] in (TaskStatus.PENDING, TaskStatus.QUEUED):
+            position = status.get('queue_position')
+            return f"Queued analysis of <{youtube_url}>" + (f" (position {position})" if position else "") + "."
+        if status['status'] == TaskStatus.PROCESSING:
+            text = f"Analyzing <{youtube_url}>: {status.get('progress') or 0}%"
+            return text + (f" - {status['message']}" if status.get('message') else "")
+        return f"Finishing analysis of <{youtube_url}>..."
+    
+    async def _follow(self, watch: _Watch) -> None:
+        """Poll a task and edit its status messages until it finishes."""
+        interval = get_setting('DISCORD_POLL_INTERVAL', 3.0)
+        deadline = time.monotonic() + get_setting('DISCORD_WATCH_TIMEOUT', 3600)
+        last_text = None
+        try:
+            while True:
+                await asyncio.sleep(interval)
+                status = await asyncio.to_thread(get_task_status, watch.task_id)
+                if status['status'] not in ACTIVE_STATUSES:
+                    await self._finish(watch, status)
+                    return
+                if time.monotonic() >= deadline:
+                    await self._edit_all(watch, f"Still analyzing <{watch.youtube_url}>, "
+                                                "run the command again later for the result.")
+                    return
+                
+                # Only changed progress is sent, which keeps edits well under Discord's rate limits
+                text = self._progress_text(watch.youtube_url, status)
+                if text != last_text:
+                    await self._edit_all(watch, text)
+                    last_text = text
+        except Exception as e:
+            logger.error(f"Following task {watch.task_id} failed: {e}")
+        finally:
+            self._watches.pop(watch.task_id, None)
+            for guild_id in watch.guilds:
+                self.limiter.release(guild_id, watch.task_id)
+    
+    async def _edit_all(self, watch: _Watch, content: str, pages: Optional[List[str]] = None) -> None:
+        for message in list(watch.messages.values()):
+            try:
+                if pages and len(pages) > 1:
+                    view = ReportPages(pages)
+                    view.message = message
+                    await message.edit(content=view.content(), view=view)
+                else:
+                    await message.edit(content=content)
+            except discord.HTTPException as e:
+                logger.warning(f"Could not edit status message {message.id}: {e}")
+    
+    async def _finish(self, watch: _Watch, status: Dict[str, Any]) -> None:
+        if status['status'] == TaskStatus.COMPLETED:
+            result = status.get('result')
+            if isinstance(result, dict):
+                text = render_report_markdown(result['report'], result.get('video_id'))
+                text = f"**{result.get('title') or 'Analysis'}**\n\n{text}"
+            else:
+                text = str(result or "The analysis finished without a result.")
+            pages = split_pages(text)
+            await self._edit_all(watch, pages[0], pages)
+        elif status['status'] == TaskStatus.CANCELLED:
+            await self._edit_all(watch, f"The analysis of <{watch.youtube_url}> was cancelled.")
+        else:
+            error = status.get('error') or "the task was lost"
+            await self._edit_all(watch, f"The analysis of <{watch.youtube_url}> failed: {error}")
+
+class AnalysisBot(commands.Bot):
+    def __init__(self):
+        intents = discord.Intents.default()
+        intents.message_content = True
+        super().__init__(command_prefix='!', intents=intents)
+    
+    async def setup_hook(self) -> None:
+        await self.add_cog(AnalysisCog(self))
+    
+    async def on_ready(self) -> None:
+        logger.info(f"Logged in as {self.user.name}")
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    token = get_setting('DISCORD_TOKEN')
+    if not token:
+        raise SystemExit("Set DISCORD_TOKEN to run the Discord bot")
+    AnalysisBot().run(token)
@@ -0,0 +1,21 @@
+"""
+Gunicorn server hooks, loaded automatically when gunicorn starts in this directory.
+
+With --preload the app is created once in the master process and warmed up
+there before the workers are forked, so new workers start serving without
+importing the clients or loading the tokenizer themselves.
+"""
+import gc
+import time
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from app import warm_up
+    
+    start = time.perf_counter()
+    warm_up(server.app.wsgi())
+    # Keep the collector from touching the preloaded objects in the workers,
+    # which would copy the shared pages it writes to
+    gc.freeze()
+    server.log.info(f"Warmed up the preloaded app in {time.perf_counter() - start:.2f}s")
@@ -1,13 +1,46 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from services.youtube import get_youtube_video_title, get_video_id
 from services.analysis import process_video
-from services.tasks import get_or_create_video_analysis_task, get_task_status, run_task_in_thread
+from services.cache import get_cache_stats
+from services.report import report_data, report_html
+from services.tasks import (get_or_create_video_analysis_task, get_task_status, enqueue_task, task_progress_callback,
+                           task_partial_callback, get_queue_position, cancel_task, get_scheduler_stats,
+                           wait_for_task_update, ACTIVE_STATUSES)
+from services.scheduler import Priority, QueueFullError
+from services.rate_limit import get_rate_limiter, inbound_buckets
+from services.batch import read_video_urls, create_batch_job, start_batch_job, get_batch_job, summarize_batch_job
+from services.jobs import (create_bulk_analysis_job, get_bulk_analysis_job, bulk_job_version,
+                           summarize_bulk_analysis_job)
 import os
 import json
+import math
 import hashlib
+import logging
+import time
+
+# Set up logging
+logger = logging.getLogger(__name__)
 
 api_bp = Blueprint('api', __name__)
 
+def _rate_limited_response():
+    """
+    Apply RATELIMIT_DEFAULT to the client making the current request.
+    
+    Returns:
+        A 429 response if the client is over its limit, otherwise None
+    """
+    try:
+        wait = get_rate_limiter().try_acquire(inbound_buckets(request.remote_addr or 'unknown'))
+    except Exception as e:
+        logger.warning(f"Rate limiter unavailable, allowing request: {e}")
+        return None
+    if not wait:
+        return None
+    response = jsonify({'error': 'Rate limit exceeded, please try again later'})
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response, 429
+
 @api_bp.route('/analyze', methods=['POST'])
 def analyze_video():
     """API endpoint for video analysis"""
@@ -25,6 +58,10 @@ def analyze_video():
     if not api_key:
         return jsonify({'error': 'OpenAI API key is required'}), 400
     
+    limited = _rate_limited_response()
+    if limited:
+        return limited
+    
     try:
         # Get or create a task for this video analysis
         task_id = get_or_create_video_analysis_task(youtube_url, api_key)
@@ -32,24 +69,153 @@ def analyze_video():
         # Get the current task status
         task_status = get_task_status(task_id)
         
-        # If the task is not already running or completed, start it
+        # If the task is not already queued, running or completed, queue it
+        queue_position = None
         if task_status['status'] == 'pending':
-            # Start the task in a background thread
-            run_task_in_thread(task_id, process_video, youtube_url, api_key)
+            queue_position = enqueue_task(task_id, process_video, youtube_url, api_key,
+                                          priority=Priority.API,
+                                          progress_callback=task_progress_callback(task_id),
+                                          partial_callback=task_partial_callback(task_id))
+            task_status = get_task_status(task_id)
+        elif task_status['status'] == 'queued':
+            queue_position = get_queue_position(task_id)
         
         # Return the task ID and status
         return jsonify({
             'task_id': task_id,
             'status': task_status['status'],
-            'progress': task_status.get('progress', 0)
+            'progress': task_status.get('progress', 0),
+            'queue_position': queue_position
         })
     
+    except QueueFullError as e:
+        response = jsonify({'error': str(e), 'queue_depth': e.queue_depth})
+        response.headers['Retry-After'] = '30'
+        return response, 429
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api_bp.route('/analyze/bulk', methods=['POST'])
+def analyze_bulk():
+    """
+    Analyze many videos with one request.
+    
+    Duplicate videos are analyzed once, and videos that are already cached or
+    being analyzed reuse their existing task. Poll /api/jobs/<job_id> for the
+    aggregated progress.
+    """
+    data = request.get_json(silent=True)
+    
+    if not isinstance(data, dict):
+        return jsonify({'error': 'No data provided'}), 400
+    
+    urls = data.get('urls')
+    api_key = data.get('api_key') or current_app.config.get('OPENAI_API_KEY')
+    
+    if not isinstance(urls, list) or not urls:
+        return jsonify({'error': 'A list of YouTube URLs is required'}), 400
+    
+    max_urls = current_app.config.get('BULK_MAX_URLS', 500)
+    if len(urls) > max_urls:
+        return jsonify({'error': f'At most {max_urls} URLs can be submitted at once'}), 400
+    
+    if not api_key:
+        return jsonify({'error': 'OpenAI API key is required'}), 400
+    
+    limited = _rate_limited_response()
+    if limited:
+        return limited
+    
+    try:
+        job = create_bulk_analysis_job([str(url) for url in urls], api_key)
+        return jsonify(summarize_bulk_analysis_job(get_bulk_analysis_job(job['id']))), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    Get the aggregated status of a bulk job with one page of per-video statuses.
+    
+    Supports If-None-Match, so polls of an unchanged job get an empty 304.
+    """
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 100, type=int), 1), 500)
+    
+    job = get_bulk_analysis_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    # The ETag only needs task statuses, so unchanged polls never load results
+    etag = bulk_job_version(job, page, per_page)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(summarize_bulk_analysis_job(job, page, per_page))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@api_bp.route('/batch', methods=['POST'])
+def create_batch():
+    """
+    Start an offline batch analysis of many videos.
+    
+    Accepts JSON with a urls list, or a plain or JSONL body with one video per
+    line. Section analyses are run through the discounted batch backend, so
+    results arrive within BATCH_COMPLETION_WINDOW rather than immediately.
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        urls = data.get('urls')
+        if not isinstance(urls, list):
+            return jsonify({'error': 'A list of YouTube URLs is required'}), 400
+        urls = [str(url) for url in urls]
+        api_key = data.get('api_key')
+    else:
+        try:
+            urls = read_video_urls(request.get_data(as_text=True).splitlines())
+        except ValueError:
+            return jsonify({'error': 'Invalid JSONL body'}), 400
+        api_key = request.headers.get('X-OpenAI-Key')
+    api_key = api_key or current_app.config.get('OPENAI_API_KEY')
+    
+    if not urls:
+        return jsonify({'error': 'At least one YouTube URL is required'}), 400
+    
+    max_urls = current_app.config.get('BULK_MAX_URLS', 500)
+    if len(urls) > max_urls:
+        return jsonify({'error': f'At most {max_urls} URLs can be submitted at once'}), 400
+    
+    if not api_key:
+        return jsonify({'error': 'OpenAI API key is required'}), 400
+    
+    limited = _rate_limited_response()
+    if limited:
+        return limited
+    
+    job = create_batch_job(urls, api_key)
+    start_batch_job(job['id'], api_key)
+    return jsonify(summarize_batch_job(job)), 202
+
+@api_bp.route('/batch/<job_id>', methods=['GET'])
+def get_batch(job_id):
+    """Get the status of a batch analysis job"""
+    job = get_batch_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Batch job not found'}), 404
+    return jsonify(summarize_batch_job(job))
+
 @api_bp.route('/tasks/<task_id>', methods=['GET'])
 def get_task(task_id):
-    """Get the status of a specific task"""
+    """
+    Get the status of a specific task.
+    
+    A completed task's result is its structured report; pass format=html
+    for the rendered HTML instead.
+    """
     task_status = get_task_status(task_id)
     
     if task_status['status'] == 'not_found':
@@ -57,11 +223,12 @@ def get_task(task_id):
     
     # If the task is completed, include the result
     if task_status['status'] == 'completed' and task_status.get('result'):
+        result = task_status['result']
         return jsonify({
             'task_id': task_id,
             'status': task_status['status'],
             'progress': task_status.get('progress', 100),
-            'result': task_status['result'],
+            'result': report_html(result) if request.args.get('format') == 'html' else report_data(result),
             'created_at': task_status.get('created_at'),
             'updated_at': task_status.get('updated_at')
         })
@@ -71,15 +238,95 @@ def get_task(task_id):
         'task_id': task_id,
         'status': task_status['status'],
         'progress': task_status.get('progress', 0),
+        'message': task_status.get('message'),
+        'partial_result': task_status.get('partial_result'),
         'error': task_status.get('error'),
         'created_at': task_status.get('created_at'),
         'updated_at': task_status.get('updated_at')
     })
 
+@api_bp.route('/tasks/<task_id>/events', methods=['GET'])
+def task_events(task_id):
+    """Stream task status and progress as Server-Sent Events"""
+    task_status = get_task_status(task_id)
+    
+    if task_status['status'] == 'not_found':
+        return jsonify({'error': 'Task not found'}), 404
+    
+    max_duration = current_app.config.get('TASK_EVENTS_MAX_DURATION', 300)
+    
+    def generate():
+        # Ask EventSource clients to reconnect quickly when the stream is closed below
+        yield "retry: 2000\n\n"
+        
+        status = task_status
+        last_partial_result = None
+        deadline = time.time() + max_duration
+        while True:
+            event = {
+                'task_id': task_id,
+                'status': status['status'],
+                'progress': status.get('progress', 0),
+                'message': status.get('message'),
+                'error': status.get('error'),
+                'updated_at': status.get('updated_at')
+            }
+            yield f"event: progress\ndata: {json.dumps(event)}\n\n"
+            
+            # Partial summary HTML is only sent when it has changed
+            if status.get('partial_result') and status['partial_result'] != last_partial_result:
+                last_partial_result = status['partial_result']
+                yield f"event: summary\ndata: {json.dumps({'html': last_partial_result})}\n\n"
+            
+            if status['status'] not in ACTIVE_STATUSES:
+                return
+            
+            last_updated_at = status.get('updated_at')
+            while True:
+                if time.time() >= deadline:
+                    return
+                status = wait_for_task_update(task_id, last_updated_at, timeout=15)
+                if status['status'] == 'not_found' or status.get('updated_at') != last_updated_at:
+                    break
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@api_bp.route('/tasks/<task_id>/cancel', methods=['POST'])
+def cancel(task_id):
+    """
+    Cancel a queued or running task.
+    
+    Needs the API key the task was created with, as JSON api_key or the
+    X-OpenAI-Key header.
+    """
+    data = request.get_json(silent=True) or {}
+    api_key = (data.get('api_key') if isinstance(data, dict) else None) or request.headers.get('X-OpenAI-Key')
+    api_key = api_key or current_app.config.get('OPENAI_API_KEY')
+    task_status = get_task_status(task_id)
+    
+    if task_status['status'] == 'not_found':
+        return jsonify({'error': 'Task not found'}), 404
+    
+    if not api_key:
+        return jsonify({'error': 'OpenAI API key is required'}), 400
+    
+    try:
+        if not cancel_task(task_id, api_key):
+            return jsonify({'error': f"Task already {task_status['status']}"}), 409
+    except PermissionError as e:
+        return jsonify({'error': str(e)}), 403
+    
+    return jsonify({'task_id': task_id, 'status': 'cancelled'})
+
 @api_bp.route('/status', methods=['GET'])
 def api_status():
     """API status endpoint"""
     return jsonify({
         'status': 'online',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'cache': get_cache_stats(),
+        'scheduler': get_scheduler_stats()
     }) 
\ No newline at end of file
@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, Markup, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, current_app, session, Response
 from werkzeug.utils import secure_filename
 from services.youtube import get_youtube_video_title, get_video_id
 from services.analysis import process_video
-from services.tasks import get_or_create_video_analysis_task, get_task_status, run_task_in_thread
+from services.tasks import get_or_create_video_analysis_task, get_task_status, enqueue_task, task_progress_callback, task_partial_callback
+from services.scheduler import Priority, QueueFullError
+from services.metrics import render_metrics
+from services.cache import get_cache, make_cache_key
+from services.report import report_html
 import os
 
 main_bp = Blueprint('main', __name__)
@@ -32,10 +36,12 @@ def analyze_video():
             # Get the current task status
             task_status = get_task_status(task_id)
             
-            # If the task is not already running or completed, start it
+            # If the task is not already queued, running or completed, queue it
             if task_status['status'] == 'pending':
-                # Start the task in a background thread
-                run_task_in_thread(task_id, process_video, youtube_url, api_key)
+                enqueue_task(task_id, process_video, youtube_url, api_key,
+                             priority=Priority.INTERACTIVE,
+                             progress_callback=task_progress_callback(task_id),
+                             partial_callback=task_partial_callback(task_id))
             
             # Store task ID in session for progress tracking
             session['current_task_id'] = task_id
@@ -43,12 +49,48 @@ def analyze_video():
             # Redirect to the waiting page
             return redirect(url_for('main.task_status', task_id=task_id))
             
+        except QueueFullError:
+            flash('The analyzer is busy right now, please try again in a minute', 'error')
+            return redirect(url_for('main.index'))
         except Exception as e:
             flash(f'Error analyzing video: {str(e)}', 'error')
             return redirect(url_for('main.index'))
             
     return redirect(url_for('main.index'))
 
+def _result_page(task_id: str, task_status: dict, youtube_url: str) -> str:
+    """
+    Render the results page of a completed task.
+    
+    The report HTML is rendered when the analysis finishes, and the page
+    around it is rendered on the first view and served from the page cache
+    afterwards.
+    
+    Args:
+        task_id: The ID of the task
+        task_status: Status of the completed task
+        youtube_url: URL of the analyzed video
+        
+    Returns:
+        Page HTML
+    """
+    cache = get_cache('pages')
+    cache_key = make_cache_key('result_page', task_id, task_status.get('updated_at'))
+    cached = cache.get(cache_key)
+    if cached:
+        return cached['html']
+    
+    result = task_status['result']
+    video_title = result.get('title') if isinstance(result, dict) else None
+    if not video_title:
+        video_title = get_youtube_video_title(youtube_url) if youtube_url else "Unknown Video"
+    page = render_template('result.html',
+                           result=report_html(result),
+                           video_title=video_title,
+                           video_url=youtube_url)
+    cache.set(cache_key, {'html': page})
+    return page
+
 @main_bp.route('/tasks/<task_id>', methods=['GET'])
 def task_status(task_id):
     """Show the task status and progress page"""
@@ -62,18 +104,12 @@ def task_status(task_id):
         
         # Get video info
         youtube_url = task_status['params'].get('youtube_url')
-        video_id = get_video_id(youtube_url) if youtube_url else None
-        video_title = get_youtube_video_title(youtube_url) if youtube_url else "Unknown Video"
         
         # If the task is completed, show the results
         if task_status['status'] == 'completed' and task_status.get('result'):
-            # Make HTML content safe
-            safe_result = Markup(task_status['result'])
-            
-            return render_template('result.html', 
-                                  result=safe_result, 
-                                  video_title=video_title,
-                                  video_url=youtube_url)
+            return _result_page(task_id, task_status, youtube_url)
+        
+        video_title = get_youtube_video_title(youtube_url) if youtube_url else "Unknown Video"
         
         # If the task is still processing, show the waiting page
         return render_template('processing.html',
@@ -85,4 +121,9 @@ def task_status(task_id):
     
     except Exception as e:
         flash(f'Error checking task status: {str(e)}', 'error')
-        return redirect(url_for('main.index')) 
\ No newline at end of file
+        return redirect(url_for('main.index')) 
+
+@main_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Expose this worker process's metrics in the Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
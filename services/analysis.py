@@ -1,82 +1,421 @@
-import openai
 import logging
-from typing import List, Dict, Any, Optional
-from .youtube import get_video_id, get_youtube_video_title, get_transcript, split_transcript_with_timestamps
+from typing import List, Dict, Any, Optional, Callable, Union
+from .youtube import get_video_id, get_youtube_video_title, get_transcript
 import asyncio
 import os
 import json
 import hashlib
-from flask import current_app
+import threading
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import get_setting
+from .cache import get_cache, make_cache_key, content_hash
+from .transcripts import Transcript
+from .models import SECTION, MERGE, SUMMARY, chat_completion, stage_model, stage_context_window, models_key
+from .metrics import stage, TRANSCRIPT_TOKENS_SAVED
+from .scheduler import TaskCancelled
+from .normalization import NORMALIZATION_VERSION, normalize_transcript
+from .report import REPORT_SCHEMA, parse_report, parse_partial_report, render_report_html, format_timestamp
+from .chunking import chunk_transcript, count_tokens, section_token_budget
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-def process_video(youtube_url: str, api_key: str) -> str:
+# Bump when the matching prompt template changes so cached results are invalidated
+SECTION_PROMPT_VERSION = "1"
+SUMMARY_PROMPT_VERSION = "2"
+MERGE_PROMPT_VERSION = "2"
+# Completion tokens reserved for each section and summary response, at most half the model's context
+MAX_OUTPUT_TOKENS = 4096
+
+SECTION_ANALYSIS_FAILED = "Analysis failed."
+SUMMARY_FAILED_HTML = "<h2>Error</h2><p>Summary generation failed.</p>"
+_REPORT_SCHEMA_JSON = json.dumps(REPORT_SCHEMA, separators=(',', ':'))
+
+# Concurrency limits shared by every analysis running in this process
+_slots_lock = threading.Lock()
+_global_slots: Optional[threading.BoundedSemaphore] = None
+_key_slots: Dict[str, threading.BoundedSemaphore] = {}
+
+def _get_section_slots(api_key: str):
+    """
+    Get the global and per-API-key semaphores limiting concurrent OpenAI calls.
+    
+    Callers take the per-key slot first, so a call waiting on a busy key does not
+    hold a global slot that other keys could use.
+    
+    Args:
+        api_key: OpenAI API key
+        
+    Returns:
+        Tuple of (global semaphore, per-key semaphore)
+    """
+    global _global_slots
+    key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+    
+    with _slots_lock:
+        if _global_slots is None:
+            _global_slots = threading.BoundedSemaphore(get_setting('ANALYSIS_MAX_CONCURRENCY', 8))
+        if key_hash not in _key_slots:
+            _key_slots[key_hash] = threading.BoundedSemaphore(get_setting('ANALYSIS_MAX_CONCURRENCY_PER_KEY', 4))
+        return _global_slots, _key_slots[key_hash]
+
+def section_cache_key(section: str) -> str:
+    """
+    Build the cache key for a single section analysis.
+    
+    Args:
+        section: Transcript text section
+        
+    Returns:
+        Cache key
+    """
+    return make_cache_key('section', content_hash(section), models_key(), SECTION_PROMPT_VERSION)
+
+def _load_cached_sections(sections: List[str], results: List[Optional[str]]) -> None:
+    """
+    Fill missing section results from the section cache in place.
+    
+    Args:
+        sections: Transcript text sections
+        results: Section results, None for sections still to analyze
+    """
+    cache = get_cache('sections')
+    for i, section in enumerate(sections):
+        if results[i] is None:
+            cached_data = cache.get(section_cache_key(section))
+            if cached_data:
+                results[i] = cached_data['analysis']
+
+def _store_cached_section(section: str, analysis: str) -> None:
+    """
+    Store a successful section analysis in the section cache.
+    
+    Args:
+        section: Transcript text section
+        analysis: Analysis text
+    """
+    get_cache('sections').set(section_cache_key(section), {'analysis': analysis})
+
+def analyze_sections(sections: List[str], api_key: str,
+                     results: Optional[List[Optional[str]]] = None,
+                     on_section_done: Optional[Callable[[int, int], None]] = None) -> List[Optional[str]]:
+    """
+    Analyze transcript sections concurrently, keeping results in section order.
+    
+    Sections already in the section cache are not sent to OpenAI again, and
+    sections whose analysis fails are retried up to SECTION_ANALYSIS_RETRIES times.
+    Passing the list returned by a previous call as ``results`` only re-runs the
+    sections that are still missing.
+    
+    Args:
+        sections: Transcript text sections
+        api_key: OpenAI API key
+        results: Optional previous results; sections with a non-None entry are skipped
+        on_section_done: Optional callback receiving (finished sections, total sections)
+        
+    Returns:
+        List of analysis texts in section order, None for sections that failed
+    """
+    total = len(sections)
+    results = list(results) if results is not None else [None] * total
+    global_slots, key_slots = _get_section_slots(api_key)
+    
+    _load_cached_sections(sections, results)
+    if on_section_done and any(result is not None for result in results):
+        on_section_done(sum(1 for result in results if result is not None), total)
+    
+    def run_section(index: int) -> Optional[str]:
+        with key_slots, global_slots:
+            analysis = analyze_and_summarize_section(sections[index], api_key)
+        if analysis == SECTION_ANALYSIS_FAILED:
+            return None
+        _store_cached_section(sections[index], analysis)
+        return analysis
+    
+    retries = get_setting('SECTION_ANALYSIS_RETRIES', 2)
+    for attempt in range(retries + 1):
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            break
+        if attempt:
+            logger.info(f"Retrying {len(pending)} failed section(s), attempt {attempt}")
+        
+        max_workers = min(len(pending), get_setting('ANALYSIS_MAX_CONCURRENCY_PER_KEY', 4))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Each section runs in a copy of this context, so its OpenAI spans reach the task's trace
+            futures = {executor.submit(contextvars.copy_context().run, run_section, i): i for i in pending}
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.error(f"Section {index + 1} analysis raised: {e}")
+                
+                if results[index] is not None and on_section_done:
+                    finished = sum(1 for result in results if result is not None)
+                    on_section_done(finished, total)
+    
+    return results
+
+def analysis_cache_key(video_id: str, transcript_data: Transcript) -> str:
+    """
+    Build the cache key for a video's analysis.
+    
+    The key covers the transcript content, normalization settings, model and
+    prompt version, so a changed transcript, cleanup rule, model or prompt
+    template never serves a stale analysis.
+    
+    Args:
+        video_id: YouTube video ID
+        transcript_data: The video's transcript
+        
+    Returns:
+        Cache key
+    """
+    transcript_hash = transcript_data.content_hash()
+    return make_cache_key('analysis', video_id, transcript_hash, _normalization_key(), models_key(),
+                          SECTION_PROMPT_VERSION, SUMMARY_PROMPT_VERSION)
+
+def _normalization_key() -> str:
+    if not get_setting('TRANSCRIPT_NORMALIZE', True):
+        return "raw"
+    filler = "filler" if get_setting('TRANSCRIPT_REMOVE_FILLER', True) else "keep-filler"
+    return f"normalized-{NORMALIZATION_VERSION}-{filler}"
+
+def prepare_transcript(transcript_data: Transcript) -> Transcript:
+    """
+    Apply the configured transcript normalization before the transcript is split.
+    
+    The tokens saved are recorded on the 'normalize' span and in the
+    transcript tokens saved counter.
+    
+    Args:
+        transcript_data: Transcript as fetched
+        
+    Returns:
+        Normalized transcript, or the transcript unchanged if normalization is
+        disabled or would leave nothing to analyze
+    """
+    if not get_setting('TRANSCRIPT_NORMALIZE', True):
+        return transcript_data
+    with stage('normalize') as span:
+        normalized, stats = normalize_transcript(transcript_data, stage_model(SECTION),
+                                                 get_setting('TRANSCRIPT_REMOVE_FILLER', True))
+        span.update(stats)
+    if not len(normalized):
+        return transcript_data
+    TRANSCRIPT_TOKENS_SAVED.inc(stats['tokens_saved'])
+    logger.info(f"Normalized transcript from {stats['tokens_before']} to {stats['tokens_after']} tokens "
+                f"({stats['captions_before']} to {stats['captions_after']} captions)")
+    return normalized
+
+def _load_cached_analysis(cache_key: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a cached analysis.
+    
+    Args:
+        cache_key: Key from analysis_cache_key
+        
+    Returns:
+        Cached analysis record or None if not cached
+    """
+    cached_data = get_cache('analysis').get(cache_key)
+    return cached_data if cached_data and 'report' in cached_data else None
+
+def _store_cached_analysis(cache_key: str, record: Dict[str, Any]) -> None:
+    """
+    Store a video's analysis in the cache.
+    
+    Args:
+        cache_key: Key from analysis_cache_key
+        record: Analysis record from build_analysis_record
+    """
+    get_cache('analysis').set(cache_key, record)
+
+def build_analysis_record(video_id: str, video_title: str, report: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build the stored result of an analysis, rendering its HTML once.
+    
+    Args:
+        video_id: YouTube video ID
+        video_title: Title of the video
+        report: Structured report from the summary
+        
+    Returns:
+        Dictionary with title, video_id, report and html
+    """
+    return {
+        'title': video_title,
+        'video_id': video_id,
+        'report': report,
+        'html': render_report_html(report, video_id)
+    }
+
+def label_section_analyses(parts: List[Dict[str, Any]], analyses: List[str]) -> List[str]:
+    """
+    Prefix each section analysis with the time range of its section.
+    
+    The ranges let the summary attach a timestamp to every claim.
+    
+    Args:
+        parts: Sections from split_transcript_into_sections
+        analyses: Analysis text of each section
+        
+    Returns:
+        Labelled analyses in section order
+    """
+    return [f"[{format_timestamp(part['start_time'])}-{format_timestamp(part['end_time'])}]\n{analysis}"
+            for part, analysis in zip(parts, analyses)]
+
+def process_video(youtube_url: str, api_key: str,
+                  progress_callback: Optional[Callable[..., None]] = None,
+                  partial_callback: Optional[Callable[[str], None]] = None) -> Union[Dict[str, Any], str]:
     """
     Process a YouTube video for analysis.
     
     Args:
         youtube_url: YouTube video URL
         api_key: OpenAI API key
+        progress_callback: Optional callback receiving a progress percentage (0-100) and a status message
+        partial_callback: Optional callback receiving the partial summary HTML while it streams
         
     Returns:
-        HTML-formatted analysis result
+        Analysis record from build_analysis_record, or an error message if the analysis failed
     """
+    def report(progress: int, message: str):
+        if progress_callback:
+            progress_callback(progress, message)
+    
+    def report_section(done: int, total: int):
+        report(30 + 50 * done // total, f"Analyzed section {done} of {total}")
+    
     video_id = get_video_id(youtube_url)
     if video_id is None:
         return "Failed to extract video ID."
     
-    video_title = get_youtube_video_title(youtube_url)
-    if video_title is None:
-        video_title = "Unknown Title"
-
-    # Check if we have a cached result
-    if current_app:
-        cache_dir = current_app.config.get('CACHE_DIR')
-        if cache_dir:
-            cache_key = hashlib.md5(video_id.encode('utf-8')).hexdigest()
-            cache_file = os.path.join(cache_dir, f"{cache_key}.json")
-            
-            if os.path.exists(cache_file):
-                with open(cache_file, 'r') as f:
-                    cached_data = json.load(f)
-                    if 'analysis' in cached_data:
-                        logger.info(f"Using cached analysis for video {video_id}")
-                        return cached_data['analysis']
-
-    transcript_data = get_transcript(video_id)
+    with stage('transcript'):
+        transcript_data = get_transcript(video_id)
     if not transcript_data:
         return "Failed to retrieve transcript."
+    report(10, "Fetched transcript")
+
+    # Check if we have a cached result
+    cache_key = analysis_cache_key(video_id, transcript_data)
+    with stage('cache_lookup'):
+        cached = _load_cached_analysis(cache_key)
+    if cached is not None:
+        logger.info(f"Using cached analysis for video {video_id}")
+        return cached
+    
+    with stage('title'):
+        video_title = get_youtube_video_title(youtube_url)
+    if video_title is None:
+        video_title = "Unknown Title"
 
-    transcript_parts_with_timestamps = split_transcript_with_timestamps(transcript_data)
+    transcript_data = prepare_transcript(transcript_data)
+    with stage('split'):
+        transcript_parts_with_timestamps = split_transcript_into_sections(transcript_data)
+    report(30, f"Split transcript into {len(transcript_parts_with_timestamps)} sections")
     
-    # Process each transcript part
-    analyses = []
-    for part in transcript_parts_with_timestamps:
-        section = part['text']
-        analysis_result = analyze_and_summarize_section(section, api_key)
-        analyses.append(analysis_result)
+    # Analyze the transcript parts concurrently, reporting progress as each finishes
+    sections = [part['text'] for part in transcript_parts_with_timestamps]
+    with stage('sections', sections=len(sections)):
+        results = analyze_sections(sections, api_key, on_section_done=report_section)
+    analyses = [result if result is not None else SECTION_ANALYSIS_FAILED for result in results]
 
     if not analyses:
         return "No analyses were generated."
+    report(80, "Generating comprehensive summary")
 
     # Generate a comprehensive summary from all analyses
-    comprehensive_summary = generate_comprehensive_summary(analyses, video_title, api_key)
-    
-    # Cache result if possible
-    if current_app and cache_dir:
-        try:
-            os.makedirs(cache_dir, exist_ok=True)
-            with open(cache_file, 'w') as f:
-                json.dump({
-                    'title': video_title,
-                    'video_id': video_id,
-                    'analysis': comprehensive_summary
-                }, f)
-        except Exception as e:
-            logger.error(f"Error caching analysis: {e}")
-    
-    return comprehensive_summary
+    analyses = label_section_analyses(transcript_parts_with_timestamps, analyses)
+    with stage('summary'):
+        summary_report = generate_comprehensive_summary(analyses, video_title, api_key, partial_callback, video_id)
+    
+    # A failed summary is never cached
+    if summary_report is None:
+        return SUMMARY_FAILED_HTML
+    with stage('render'):
+        record = build_analysis_record(video_id, video_title, summary_report)
+    _store_cached_analysis(cache_key, record)
+    
+    return record
+
+def create_section_prompt(section: str) -> str:
+    """
+    Create a prompt for analyzing a single transcript section.
+    
+    Args:
+        section: Transcript text section
+        
+    Returns:
+        Section analysis prompt text
+    """
+    return ("Please analyze the following text and provide a structured response with the following headings: "
+            "Historical Accuracy, Scientific Accuracy, Speculative Claims, and Religious/Mythological References.\n\n"
+            "Text: \"" + section + "\"\n\n"
+            "Response:")
+
+def split_transcript_into_sections(transcript_data: Transcript) -> List[Dict[str, Any]]:
+    """
+    Split a transcript into sections that fill the section model's context.
+    
+    The token budget is the smallest context window of the section model and
+    its fallbacks, less the section prompt template and the completion tokens
+    reserved by _max_output_tokens, optionally capped by CHUNK_MAX_TOKENS.
+    
+    Args:
+        transcript_data: The video's transcript
+        
+    Returns:
+        List of sections with text, start and end timestamps and token counts
+    """
+    model = stage_model(SECTION)
+    prompt_tokens = count_tokens(create_section_prompt(""), model)
+    budget = section_token_budget(model, prompt_tokens, _max_output_tokens(SECTION),
+                                  limit=get_setting('CHUNK_MAX_TOKENS'),
+                                  context_window=stage_context_window(SECTION))
+    return chunk_transcript(
+        transcript_data,
+        model,
+        max_tokens=budget,
+        overlap_tokens=get_setting('CHUNK_OVERLAP_TOKENS', 0),
+        pause_seconds=get_setting('CHUNK_PAUSE_SECONDS', 1.0)
+    )
+
+def _max_output_tokens(model_stage: str) -> int:
+    """Completion tokens reserved for a stage's responses."""
+    return min(MAX_OUTPUT_TOKENS, stage_context_window(model_stage) // 2)
+
+def _completion_params(prompt: str, model_stage: str = SECTION, json_output: bool = False) -> Dict[str, Any]:
+    """
+    Build the chat completion parameters shared by section, merge and summary requests.
+    
+    Args:
+        prompt: System prompt text
+        model_stage: SECTION, MERGE or SUMMARY, selects the model
+        json_output: Ask for a JSON object response, unless SUMMARY_JSON_MODE is disabled
+            for models without JSON mode
+        
+    Returns:
+        Keyword arguments for models.chat_completion, with the stage's primary model
+    """
+    params = {
+        'model': stage_model(model_stage),
+        'messages': [
+            {"role": "system", "content": prompt}
+        ],
+        'temperature': 0.5,
+        'max_tokens': _max_output_tokens(model_stage),
+        'top_p': 1.0,
+        'frequency_penalty': 0.0,
+        'presence_penalty': 0.0
+    }
+    if json_output and get_setting('SUMMARY_JSON_MODE', True):
+        params['response_format'] = {'type': 'json_object'}
+    return params
 
 def analyze_and_summarize_section(section: str, api_key: str) -> str:
     """
@@ -90,29 +429,11 @@ def analyze_and_summarize_section(section: str, api_key: str) -> str:
         Analysis text
     """
     try:
-        # Use the provided API key for this request
-        openai.api_key = api_key
-        
-        analysis_prompt = ("Please analyze the following text and provide a structured response with the following headings: "
-                           "Historical Accuracy, Scientific Accuracy, Speculative Claims, and Religious/Mythological References.\n\n"
-                           "Text: \"" + section + "\"\n\n"
-                           "Response:")
-        
-        analysis_response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {"role": "system", "content": analysis_prompt}
-            ],
-            temperature=0.5,
-            max_tokens=4096,
-            top_p=1.0,
-            frequency_penalty=0.0,
-            presence_penalty=0.0
-        )
+        analysis_response = chat_completion(SECTION, api_key, **_completion_params(create_section_prompt(section)))
         return analysis_response.choices[0].message['content']
     except Exception as e:
         logger.error(f"Error in section analysis: {e}")
-        return "Analysis failed."
+        return SECTION_ANALYSIS_FAILED
 
 def create_summary_prompt(analysis_results: List[str], video_title: str) -> str:
     """
@@ -125,89 +446,257 @@ def create_summary_prompt(analysis_results: List[str], video_title: str) -> str:
     Returns:
         Summary prompt text
     """
-    prompt = (f"Based on the following section analyses for the video titled '{video_title}', please create a comprehensive summary that includes key findings "
-              "under the headings of Historical Accuracy, Scientific Accuracy, Speculative Claims, and "
-              "Religious/Mythological References.\n\n")
+    prompt = (f"Based on the following section analyses for the video titled '{video_title}', please create a comprehensive "
+              "fact-check report as a JSON object matching this JSON schema:\n"
+              f"{_REPORT_SCHEMA_JSON}\n\n"
+              "Give a short overall summary, then list every distinct claim under its category with a verdict, a one "
+              "or two sentence explanation, and the start of the time range it comes from. The time ranges in "
+              "brackets give the part of the video each analysis, or each claim in it, covers.\n\n")
+    
+    for i, result in enumerate(analysis_results, start=1):
+        prompt += f"Section {i} Analysis:\n{result}\n\n"
+    
+    prompt += "Please integrate all key points from the above analyses into the JSON report."
+    return prompt
+
+def create_merge_prompt(analysis_results: List[str], video_title: str) -> str:
+    """
+    Create a prompt for merging several section analyses into one intermediate analysis.
+    
+    Args:
+        analysis_results: Consecutive section analyses to merge
+        video_title: Title of the video
+        
+    Returns:
+        Merge prompt text
+    """
+    prompt = (f"The following are analyses of consecutive sections of the video titled '{video_title}'. "
+              "Merge them into a single analysis of the combined sections with the headings "
+              "Historical Accuracy, Scientific Accuracy, Speculative Claims, and Religious/Mythological References. "
+              "Keep every distinct claim and finding with the time range it comes from, and drop repetition.\n\n")
     
     for i, result in enumerate(analysis_results, start=1):
         prompt += f"Section {i} Analysis:\n{result}\n\n"
     
-    prompt += "Please integrate all key points from the above analyses into a final structured summary."
+    prompt += "Merged analysis:"
     return prompt
 
-def generate_comprehensive_summary(analysis_results: List[str], video_title: str, api_key: str) -> str:
+def _prompt_token_budget(model_stage: str) -> int:
+    """Tokens available for a summary or merge prompt after reserving the completion."""
+    return stage_context_window(model_stage) - _max_output_tokens(model_stage) - 64
+
+def plan_merge_groups(analysis_results: List[str], video_title: str) -> Optional[List[List[str]]]:
     """
-    Generate a comprehensive summary from all section analyses.
+    Group analyses for one level of the summary tree-reduce.
+    
+    Consecutive analyses are packed greedily into groups whose merge prompt
+    fits the merge model's context.
+    
+    Args:
+        analysis_results: Section or intermediate analyses
+        video_title: Title of the video
+        
+    Returns:
+        Groups of analyses to merge, or None if the summary prompt already fits
+    """
+    if (not get_setting('SUMMARY_TREE_REDUCE', True)
+            or count_tokens(create_summary_prompt(analysis_results, video_title),
+                            stage_model(SUMMARY)) <= _prompt_token_budget(SUMMARY)):
+        return None
+    
+    model, budget = stage_model(MERGE), _prompt_token_budget(MERGE)
+    overhead = count_tokens(create_merge_prompt([], video_title), model)
+    max_group = get_setting('SUMMARY_MERGE_MAX_GROUP', 0)
+    groups, group, group_tokens = [], [], overhead
+    for result in analysis_results:
+        tokens = count_tokens(f"Section {len(group) + 1} Analysis:\n{result}\n\n", model)
+        if group and (group_tokens + tokens > budget or (max_group and len(group) >= max_group)):
+            groups.append(group)
+            group, group_tokens = [], overhead
+        group.append(result)
+        group_tokens += tokens
+    groups.append(group)
+    return groups
+
+def merge_cache_key(analysis_results: List[str], video_title: str) -> str:
+    """
+    Build the cache key for an intermediate merge.
+    
+    Args:
+        analysis_results: Analyses merged together
+        video_title: Title of the video
+        
+    Returns:
+        Cache key
+    """
+    return make_cache_key('merge', content_hash("\x1e".join(analysis_results)), video_title,
+                          models_key(), MERGE_PROMPT_VERSION)
+
+def merge_analyses(analysis_results: List[str], video_title: str, api_key: str) -> Optional[str]:
+    """
+    Merge several analyses into one using OpenAI.
+    
+    Args:
+        analysis_results: Consecutive analyses to merge
+        video_title: Title of the video
+        api_key: OpenAI API key
+        
+    Returns:
+        Merged analysis text or None if the request fails
+    """
+    try:
+        merge_response = chat_completion(
+            MERGE, api_key, **_completion_params(create_merge_prompt(analysis_results, video_title), MERGE))
+        return merge_response.choices[0].message['content']
+    except Exception as e:
+        logger.error(f"Error merging analyses: {e}")
+        return None
+
+def _load_cached_merges(groups: List[List[str]], video_title: str, merged: List[Optional[str]]) -> None:
+    """Fill merged results from the merge cache in place; single-analysis groups pass through."""
+    cache = get_cache('merges')
+    for i, group in enumerate(groups):
+        if len(group) == 1:
+            merged[i] = group[0]
+        elif merged[i] is None:
+            cached_data = cache.get(merge_cache_key(group, video_title))
+            if cached_data:
+                merged[i] = cached_data['analysis']
+
+def _store_cached_merge(group: List[str], video_title: str, analysis: str) -> None:
+    """Store a successful merge in the merge cache."""
+    get_cache('merges').set(merge_cache_key(group, video_title), {'analysis': analysis})
+
+def reduce_analyses(analysis_results: List[str], video_title: str, api_key: str) -> List[str]:
+    """
+    Tree-reduce analyses until they fit in a single summary prompt.
+    
+    Each level merges groups of consecutive analyses in parallel, so the number
+    of levels grows logarithmically with the number of sections. Merges are
+    cached, so a retried job only re-runs the merges that did not finish.
+    
+    Args:
+        analysis_results: Section analyses in order
+        video_title: Title of the video
+        api_key: OpenAI API key
+        
+    Returns:
+        Analyses whose summary prompt fits the model's context
+        
+    Raises:
+        RuntimeError: If a merge keeps failing or the analyses cannot be reduced further
+    """
+    global_slots, key_slots = _get_section_slots(api_key)
+    retries = get_setting('SECTION_ANALYSIS_RETRIES', 2)
+    
+    def run_merge(group: List[str]) -> Optional[str]:
+        with key_slots, global_slots:
+            merged = merge_analyses(group, video_title, api_key)
+        if merged is not None:
+            _store_cached_merge(group, video_title, merged)
+        return merged
+    
+    level = 0
+    while True:
+        groups = plan_merge_groups(analysis_results, video_title)
+        if groups is None:
+            return analysis_results
+        if len(groups) == len(analysis_results):
+            raise RuntimeError("Section analyses are too long to merge further")
+        level += 1
+        logger.info(f"Merging {len(analysis_results)} analyses into {len(groups)} (level {level})")
+        
+        merged = [None] * len(groups)
+        _load_cached_merges(groups, video_title, merged)
+        for attempt in range(retries + 1):
+            pending = [i for i, result in enumerate(merged) if result is None]
+            if not pending:
+                break
+            max_workers = min(len(pending), get_setting('ANALYSIS_MAX_CONCURRENCY_PER_KEY', 4))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(contextvars.copy_context().run, run_merge, groups[i]) for i in pending]
+                for i, future in zip(pending, futures):
+                    merged[i] = future.result()
+        if any(result is None for result in merged):
+            raise RuntimeError(f"Merging analyses failed at level {level}")
+        analysis_results = merged
+
+def generate_comprehensive_summary(analysis_results: List[str], video_title: str, api_key: str,
+                                   partial_callback: Optional[Callable[[str], None]] = None,
+                                   video_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Generate a comprehensive summary report from all section analyses.
+    
+    Analyses too long for one prompt are first tree-reduced with reduce_analyses.
+    The model is asked for a JSON report; a response that does not parse is
+    read as free-form text by parse_report rather than requested again.
+    When partial_callback is given and SUMMARY_STREAMING is enabled, the
+    completion is streamed and the callback receives the HTML of the report
+    received so far.
     
     Args:
         analysis_results: List of section analysis results
         video_title: Title of the video
         api_key: OpenAI API key
+        partial_callback: Optional callback receiving partial HTML
+        video_id: Optional YouTube video ID for timestamp links in partial HTML
         
     Returns:
-        HTML-formatted comprehensive summary
+        Structured report, or None if the summary could not be generated
     """
-    summary_prompt = create_summary_prompt(analysis_results, video_title)
     try:
-        # Use the provided API key for this request
-        openai.api_key = api_key
-        
-        summary_response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo-0125",
-            messages=[
-                {"role": "system", "content": summary_prompt}
-            ],
-            temperature=0.5,
-            max_tokens=4096,
-            top_p=1.0,
-            frequency_penalty=0.0,
-            presence_penalty=0.0
-        )
-        
-        content = summary_response.choices[0].message['content']
-        
-        # Format the content into HTML
-        html_content = ""
-        sections = ["Summary", "Historical Accuracy", "Scientific Accuracy", "Speculative Claims", "Religious/Mythological References"]
-        section_contents = {section: "" for section in sections}
-        
-        # Initialize variables to keep track of the current section being processed
-        current_section = None
-        for line in content.split('\n'):
-            # Check if the line starts with one of the section headings
-            for section in sections:
-                if line.startswith(section) or line.startswith("## " + section) or line.startswith("# " + section):
-                    current_section = section
-                    break
-            
-            if current_section and not any(line.startswith(section) or line.startswith("## " + section) or line.startswith("# " + section) for section in sections):
-                # Append the line to the appropriate section
-                section_contents[current_section] += line + '\n'
-        
-        # Construct the HTML content using section headings and their contents
-        for section in sections:
-            if section_contents[section].strip():
-                html_content += f"<div class='analysis-section'><h2>{section}</h2><div class='section-content'>{section_contents[section]}</div></div>"
-        
-        return html_content
+        with stage('reduce'):
+            analysis_results = reduce_analyses(analysis_results, video_title, api_key)
+        summary_params = _completion_params(create_summary_prompt(analysis_results, video_title), SUMMARY,
+                                            json_output=True)
+        
+        if partial_callback is None or not get_setting('SUMMARY_STREAMING', True):
+            summary_response = chat_completion(SUMMARY, api_key, **summary_params)
+            with stage('format'):
+                return parse_report(summary_response.choices[0].message['content'], video_title)
+        
+        received = ""
+        interval, last_partial = get_setting('SUMMARY_STREAM_INTERVAL', 0.5), 0.0
+        for chunk in chat_completion(SUMMARY, api_key, stream=True, **summary_params):
+            if chunk is None:
+                # The model failed mid-stream and a fallback model starts over
+                received, last_partial = "", 0.0
+                continue
+            text = chunk.choices[0].delta.get('content')
+            if text:
+                received += text
+                # Parsing is throttled so long summaries are not re-parsed per token
+                now = time.monotonic()
+                if now - last_partial >= interval:
+                    partial = parse_partial_report(received, video_title)
+                    if partial and (partial['summary'] or partial['sections']):
+                        partial_callback(render_report_html(partial, video_id))
+                        last_partial = now
+        with stage('format'):
+            return parse_report(received, video_title)
 
+    except TaskCancelled:
+        raise
     except Exception as e:
         logger.error(f"Error generating comprehensive summary: {e}")
-        return "<h2>Error</h2><p>Summary generation failed.</p>"
+        return None
 
-# Async version for future implementation
-async def process_video_async(youtube_url: str, api_key: str) -> str:
+async def process_video_async(youtube_url: str, api_key: str,
+                              progress_callback: Optional[Callable[..., None]] = None,
+                              partial_callback: Optional[Callable[[str], None]] = None) -> Union[Dict[str, Any], str]:
     """
-    Process a YouTube video for analysis asynchronously.
+    Process a YouTube video for analysis without blocking the event loop.
     
-    This is a placeholder for future async implementation.
+    Runs process_video in the default executor, so callers on an event loop
+    share the threaded pipeline and its concurrency limits.
     
     Args:
         youtube_url: YouTube video URL
         api_key: OpenAI API key
+        progress_callback: Optional callback receiving a progress percentage (0-100) and a status message
+        partial_callback: Optional callback receiving the partial summary HTML while it streams
         
     Returns:
-        HTML-formatted analysis result
+        Analysis record from build_analysis_record, or an error message if the analysis failed
     """
-    # This is a placeholder for future async implementation
-    return process_video(youtube_url, api_key) 
\ No newline at end of file
+    return await asyncio.to_thread(process_video, youtube_url, api_key, progress_callback, partial_callback)
@@ -0,0 +1,514 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from flask import current_app, has_app_context
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Iterable, Iterator
+from config import get_setting
+from .cache import get_cache
+from .youtube import get_video_id, get_transcript
+from .openai_client import get_openai_client
+from .models import SECTION, LocalBackend, chat_completion, get_backend, stage_models
+from .analysis import (process_video, analysis_cache_key, section_cache_key, split_transcript_into_sections,
+                       create_section_prompt, prepare_transcript, _completion_params, _load_cached_analysis)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+# Remote batch statuses after which the batch will not change any more
+FINISHED_BATCH_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+class BatchJobStatus:
+    """Batch job status values, in the order a job moves through them"""
+    PREPARING = "preparing"
+    SUBMITTING = "submitting"
+    WAITING = "waiting"
+    SUMMARIZING = "summarizing"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+def read_video_urls(lines: Iterable[str]) -> List[str]:
+    """
+    Read video URLs from a plain list or JSONL.
+    
+    Each non-empty line is either a URL, a JSON string, or a JSON object with a
+    youtube_url or url field. Lines starting with # are ignored.
+    
+    Args:
+        lines: Input lines
+    
+    Returns:
+        URLs in input order
+    """
+    urls = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line[0] in '{"':
+            value = json.loads(line)
+            if isinstance(value, dict):
+                value = value.get('youtube_url') or value.get('url')
+            if value:
+                urls.append(str(value))
+        else:
+            urls.append(line)
+    return urls
+
+class BatchBackend:
+    """Runs a JSONL file of chat completion requests in the OpenAI Batch format"""
+    
+    def submit(self, input_path: str) -> str:
+        """
+        Submit a JSONL input file.
+        
+        Args:
+            input_path: Path of the input file
+        
+        Returns:
+            Batch ID
+        """
+        raise NotImplementedError
+    
+    def poll(self, batch_id: str) -> Dict[str, Any]:
+        """
+        Get the state of a batch.
+        
+        Args:
+            batch_id: Batch ID
+        
+        Returns:
+            Batch object with at least status, output_file_id and error_file_id
+        """
+        raise NotImplementedError
+    
+    def results(self, batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """
+        Read the output and error lines of a finished batch.
+        
+        Args:
+            batch: Batch object returned by poll
+        
+        Returns:
+            Iterator of result lines with custom_id, response and error
+        """
+        raise NotImplementedError
+
+class OpenAIBatchBackend(BatchBackend):
+    """The OpenAI Batch API, billed at the discounted batch rate"""
+    
+    def __init__(self, api_key: str):
+        import openai
+        
+        self.client = get_openai_client(api_key)
+        self.base_url = openai.api_base.rstrip('/')
+    
+    def _request(self, method: str, path: str, **kwargs) -> Any:
+        response = self.client.session.request(
+            method, f"{self.base_url}{path}",
+            headers={"Authorization": f"Bearer {self.client.api_key}"},
+            timeout=get_setting('OPENAI_REQUEST_TIMEOUT', 120),
+            **kwargs
+        )
+        response.raise_for_status()
+        return response
+    
+    def submit(self, input_path: str) -> str:
+        with open(input_path, 'rb') as f:
+            uploaded = self._request("POST", "/files", data={"purpose": "batch"},
+                                     files={"file": (os.path.basename(input_path), f)}).json()
+        batch = self._request("POST", "/batches", json={
+            "input_file_id": uploaded["id"],
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": get_setting('BATCH_COMPLETION_WINDOW', '24h')
+        }).json()
+        return batch["id"]
+    
+    def poll(self, batch_id: str) -> Dict[str, Any]:
+        return self._request("GET", f"/batches/{batch_id}").json()
+    
+    def results(self, batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if file_id:
+                content = self._request("GET", f"/files/{file_id}/content").text
+                for line in content.splitlines():
+                    if line.strip():
+                        yield json.loads(line)
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Local stand-in for the Batch API.
+    
+    Runs each request of a submitted file through the section model and its
+    fallbacks in a background thread and writes results in the Batch API
+    output format, so the batch workflow can be exercised without it.
+    """
+    
+    _running = set()
+    _running_lock = threading.Lock()
+    
+    def __init__(self, api_key: str, directory: str):
+        self.api_key = api_key
+        self.directory = directory
+    
+    def _path(self, batch_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{batch_id}{suffix}")
+    
+    def submit(self, input_path: str) -> str:
+        batch_id = f"local_batch_{uuid.uuid4().hex}"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(input_path, 'rb') as src, open(self._path(batch_id, '.input.jsonl'), 'wb') as dst:
+            dst.write(src.read())
+        _write_json(self._path(batch_id, '.json'), {"id": batch_id, "status": "in_progress"})
+        self._start(batch_id)
+        return batch_id
+    
+    def poll(self, batch_id: str) -> Dict[str, Any]:
+        with open(self._path(batch_id, '.json')) as f:
+            batch = json.load(f)
+        # Resume batches whose thread died with an earlier process
+        if batch["status"] == "in_progress":
+            self._start(batch_id)
+        return batch
+    
+    def results(self, batch: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        path = self._path(batch["id"], '.output.jsonl')
+        # A batch that failed before writing output has no results, like one without output_file_id
+        if not os.path.exists(path):
+            return
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    
+    def _start(self, batch_id: str) -> None:
+        with self._running_lock:
+            if batch_id in self._running:
+                return
+            self._running.add(batch_id)
+        threading.Thread(target=self._run, args=(batch_id,), name=f"local-batch-{batch_id}", daemon=True).start()
+    
+    def _run_request(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        result = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"], "response": None, "error": None}
+        try:
+            response = chat_completion(SECTION, self.api_key, **request["body"])
+            result["response"] = {"status_code": 200, "body": response.to_dict_recursive()}
+        except Exception as e:
+            result["error"] = {"code": e.__class__.__name__, "message": str(e)}
+        return result
+    
+    def _run(self, batch_id: str) -> None:
+        try:
+            with open(self._path(batch_id, '.input.jsonl')) as f:
+                requests = [json.loads(line) for line in f if line.strip()]
+            with ThreadPoolExecutor(max_workers=get_setting('ANALYSIS_MAX_CONCURRENCY_PER_KEY', 4)) as executor:
+                results = list(executor.map(self._run_request, requests))
+            with open(self._path(batch_id, '.output.jsonl'), 'w') as f:
+                for result in results:
+                    f.write(json.dumps(result) + "\n")
+            failed = sum(1 for result in results if result["error"])
+            _write_json(self._path(batch_id, '.json'), {
+                "id": batch_id,
+                "status": "completed",
+                "request_counts": {"total": len(results), "completed": len(results) - failed, "failed": failed}
+            })
+        except Exception as e:
+            logger.error(f"Local batch {batch_id} failed: {e}")
+            _write_json(self._path(batch_id, '.json'), {"id": batch_id, "status": "failed", "error": str(e)})
+        finally:
+            with self._running_lock:
+                self._running.discard(batch_id)
+
+def get_batch_backend(api_key: str) -> BatchBackend:
+    """
+    Get the batch backend configured by BATCH_BACKEND ('openai' or 'local').
+    
+    Args:
+        api_key: OpenAI API key
+    
+    Returns:
+        BatchBackend instance
+    """
+    backend = get_setting('BATCH_BACKEND', 'openai')
+    if backend == 'openai':
+        if isinstance(get_backend(stage_models(SECTION)[0]), LocalBackend):
+            raise ValueError("The OpenAI Batch API cannot run a local section model, use BATCH_BACKEND=local")
+        return OpenAIBatchBackend(api_key)
+    if backend == 'local':
+        return LocalBatchBackend(api_key, os.path.join(get_setting('BATCH_DIR'), 'local'))
+    raise ValueError(f"Unknown batch backend: {backend}")
+
+def _write_json(path: str, data: Dict[str, Any]) -> None:
+    """Write a JSON file atomically."""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _job_dir(job_id: str) -> str:
+    return os.path.join(get_setting('BATCH_DIR'), job_id)
+
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+def get_batch_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Load a batch job.
+    
+    Args:
+        job_id: Batch job ID
+    
+    Returns:
+        Job dictionary or None if it does not exist
+    """
+    # Job IDs become directory names, so only accept the hex IDs we create
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(os.path.join(_job_dir(job_id), 'job.json')) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _save_job(job: Dict[str, Any]) -> None:
+    job["updated_at"] = time.time()
+    _write_json(os.path.join(_job_dir(job["id"]), 'job.json'), job)
+
+def summarize_batch_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the public view of a batch job, without its request bookkeeping.
+    
+    Args:
+        job: Job dictionary
+    
+    Returns:
+        Job status with per-video status counts
+    """
+    counts = {}
+    for video in job["videos"]:
+        counts[video["status"]] = counts.get(video["status"], 0) + 1
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "error": job.get("error"),
+        "section_requests": len(job.get("requests", {})),
+        "batches": [{"id": batch.get("remote_id"), "status": batch.get("status")} for batch in job.get("batches", [])],
+        "video_counts": counts,
+        "videos": [{key: video.get(key) for key in ("youtube_url", "video_id", "status", "error")}
+                   for video in job["videos"]]
+    }
+
+def create_batch_job(urls: List[str], api_key: str) -> Dict[str, Any]:
+    """
+    Create a batch job for a list of videos. Nothing is fetched until the job runs.
+    
+    Args:
+        urls: YouTube video URLs; repeated videos are analyzed once
+        api_key: OpenAI API key, only its hash is stored
+    
+    Returns:
+        Job dictionary
+    """
+    videos, seen = [], set()
+    for url in urls:
+        video_id = get_video_id(url)
+        if video_id in seen:
+            continue
+        if video_id:
+            seen.add(video_id)
+        videos.append({
+            "youtube_url": url,
+            "video_id": video_id,
+            "status": "pending" if video_id else "failed",
+            "error": None if video_id else "Invalid YouTube URL"
+        })
+    
+    job_id = uuid.uuid4().hex
+    os.makedirs(_job_dir(job_id), exist_ok=True)
+    now = time.time()
+    job = {
+        "id": job_id,
+        "status": BatchJobStatus.PREPARING,
+        "created_at": now,
+        "updated_at": now,
+        "key_hash": _key_hash(api_key),
+        "backend": get_setting('BATCH_BACKEND', 'openai'),
+        "videos": videos,
+        "requests": {},
+        "batches": [],
+        "error": None
+    }
+    _save_job(job)
+    return job
+
+def _prepare(job: Dict[str, Any]) -> None:
+    """Fetch transcripts, split them and write the section requests that are not cached yet."""
+    section_cache = get_cache('sections')
+    lines = []
+    job["requests"] = {}
+    for video in job["videos"]:
+        if video["status"] != "pending":
+            continue
+        transcript = get_transcript(video["video_id"])
+        if not transcript:
+            video.update(status="failed", error="Failed to retrieve transcript.")
+            continue
+        video["analysis_key"] = analysis_cache_key(video["video_id"], transcript)
+        if _load_cached_analysis(video["analysis_key"]) is not None:
+            video["status"] = "cached"
+            continue
+        
+        for index, section in enumerate(split_transcript_into_sections(prepare_transcript(transcript))):
+            key = section_cache_key(section['text'])
+            if section_cache.get(key):
+                continue
+            custom_id = f"{video['video_id']}-{index}"
+            job["requests"][custom_id] = key
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": BATCH_ENDPOINT,
+                "body": _completion_params(create_section_prompt(section['text']))
+            }))
+    
+    # The Batch API caps the number of requests per file
+    per_batch = get_setting('BATCH_MAX_REQUESTS', 50000)
+    job["batches"] = []
+    for start in range(0, len(lines), per_batch):
+        input_path = os.path.join(_job_dir(job["id"]), f"input-{len(job['batches'])}.jsonl")
+        with open(input_path, 'w') as f:
+            f.write("\n".join(lines[start:start + per_batch]) + "\n")
+        job["batches"].append({"input": input_path, "remote_id": None, "status": None, "collected": False})
+    job["status"] = BatchJobStatus.SUBMITTING
+
+def _collect(backend: BatchBackend, job: Dict[str, Any], batch: Dict[str, Any], remote: Dict[str, Any]) -> None:
+    """Store the section analyses of a finished batch in the section cache."""
+    section_cache = get_cache('sections')
+    stored = failed = 0
+    for line in backend.results(remote):
+        key = job["requests"].get(line.get("custom_id"))
+        response = line.get("response") or {}
+        if key and response.get("status_code") == 200:
+            analysis = response["body"]["choices"][0]["message"]["content"]
+            # Same entry format as analysis._store_cached_section
+            section_cache.set(key, {'analysis': analysis})
+            stored += 1
+        else:
+            failed += 1
+    batch["collected"] = True
+    logger.info(f"Batch job {job['id']}: stored {stored} section analyses from {batch['remote_id']}, {failed} failed")
+
+def run_batch_job(job_id: str, api_key: str, wait: bool = True) -> Dict[str, Any]:
+    """
+    Run a batch job to completion, resuming from whatever stage it reached.
+    
+    Section analyses go through the batch backend and land in the section
+    cache. Each video is then summarized one at a time with process_video,
+    which finds its sections cached, analyzes any the batch missed and caches
+    the final analysis as usual.
+    
+    Args:
+        job_id: Batch job ID
+        api_key: OpenAI API key the job was created with
+        wait: If False, return once the section requests are submitted
+    
+    Returns:
+        Job dictionary
+    
+    Raises:
+        ValueError: If the job does not exist or the key does not match
+    """
+    job = get_batch_job(job_id)
+    if job is None:
+        raise ValueError("Batch job not found")
+    if job["key_hash"] != _key_hash(api_key):
+        raise ValueError("API key does not match the batch job")
+    if job["status"] == BatchJobStatus.FAILED and job.get("failed_stage"):
+        # Retry from the stage that failed
+        job.update(status=job.pop("failed_stage"), error=None)
+    
+    try:
+        backend = get_batch_backend(api_key)
+        if job["status"] == BatchJobStatus.PREPARING:
+            _prepare(job)
+            _save_job(job)
+        
+        if job["status"] == BatchJobStatus.SUBMITTING:
+            for batch in job["batches"]:
+                if batch["remote_id"] is None:
+                    batch["remote_id"] = backend.submit(batch["input"])
+                    batch["status"] = "submitted"
+                    _save_job(job)
+            job["status"] = BatchJobStatus.WAITING
+            _save_job(job)
+        if not wait:
+            return job
+        
+        if job["status"] == BatchJobStatus.WAITING:
+            interval = get_setting('BATCH_POLL_INTERVAL', 60)
+            while not all(batch["collected"] for batch in job["batches"]):
+                for batch in job["batches"]:
+                    if batch["collected"]:
+                        continue
+                    remote = backend.poll(batch["remote_id"])
+                    if remote["status"] != batch["status"]:
+                        batch["status"] = remote["status"]
+                        _save_job(job)
+                    if remote["status"] in FINISHED_BATCH_STATUSES:
+                        # Partial output of expired or cancelled batches is still worth keeping
+                        _collect(backend, job, batch, remote)
+                        _save_job(job)
+                if not all(batch["collected"] for batch in job["batches"]):
+                    time.sleep(interval)
+            job["status"] = BatchJobStatus.SUMMARIZING
+            _save_job(job)
+        
+        if job["status"] == BatchJobStatus.SUMMARIZING:
+            for video in job["videos"]:
+                if video["status"] != "pending":
+                    continue
+                process_video(video["youtube_url"], api_key)
+                # process_video only caches successful analyses
+                if _load_cached_analysis(video["analysis_key"]) is not None:
+                    video["status"] = "completed"
+                else:
+                    video.update(status="failed", error="Analysis failed.")
+                _save_job(job)
+            job["status"] = BatchJobStatus.COMPLETED
+            _save_job(job)
+    except Exception as e:
+        logger.error(f"Batch job {job_id} failed: {e}")
+        job.update(status=BatchJobStatus.FAILED, failed_stage=job["status"], error=str(e))
+        _save_job(job)
+    
+    return job
+
+def start_batch_job(job_id: str, api_key: str) -> None:
+    """
+    Run a batch job in a background thread.
+    
+    Batch jobs run outside the job scheduler, so they never take interactive
+    worker slots.
+    
+    Args:
+        job_id: Batch job ID
+        api_key: OpenAI API key the job was created with
+    """
+    # Carry the Flask app into the thread so services see its config
+    app = current_app._get_current_object() if has_app_context() else None
+    
+    def run():
+        if app is not None:
+            with app.app_context():
+                run_batch_job(job_id, api_key)
+        else:
+            run_batch_job(job_id, api_key)
+    
+    threading.Thread(target=run, name=f"batch-job-{job_id}", daemon=True).start()
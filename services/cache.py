@@ -0,0 +1,306 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from config import get_setting
+from .metrics import register_collector
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+def make_cache_key(*parts: Any) -> str:
+    """
+    Build a content-addressed cache key from its parts.
+    
+    Args:
+        *parts: Values identifying the cached content (IDs, hashes, model names, versions)
+    
+    Returns:
+        Hex digest usable as a cache key and file name
+    """
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def content_hash(text: str) -> str:
+    """
+    Hash text content for use in cache keys.
+    
+    Args:
+        text: Content to hash
+    
+    Returns:
+        Hex digest of the content
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def directory_bytes(directory: str, suffix: str) -> int:
+    """
+    Get the total size of the files with the given suffix in a directory.
+    
+    Args:
+        directory: Directory to scan
+        suffix: File name suffix, e.g. '.json'
+    
+    Returns:
+        Size in bytes, 0 if the directory does not exist
+    """
+    total = 0
+    try:
+        for entry in os.scandir(directory):
+            if entry.name.endswith(suffix):
+                total += entry.stat().st_size
+    except FileNotFoundError:
+        pass
+    return total
+
+def prune_directory(directory: str, suffix: str, max_bytes: int, ttl: float) -> Tuple[int, int]:
+    """
+    Delete expired files, then the oldest ones until the directory is at 90% of its budget.
+    
+    Args:
+        directory: Directory holding one file per entry
+        suffix: File name suffix of the entries, e.g. '.json'
+        max_bytes: Size budget of the directory
+        ttl: Entry lifetime in seconds, measured from the file's modification time
+    
+    Returns:
+        Tuple of (files removed, bytes left)
+    """
+    now = time.time()
+    files = []
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffix):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+    
+    total = sum(size for _, size, _ in files)
+    target = max_bytes * 0.9
+    removed = 0
+    for mtime, size, path in files:
+        if total <= target and now - mtime < ttl:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed, total
+
+class TieredCache:
+    """
+    Two-tier cache with an in-process LRU in front of a JSON file store.
+    
+    Entries expire after ``ttl`` seconds in both tiers. The memory tier holds at
+    most ``memory_max_entries`` entries and the disk tier is pruned, oldest
+    first, once it grows past ``disk_max_bytes``.
+    """
+    
+    def __init__(self, directory: Optional[str], ttl: int, memory_max_entries: int, disk_max_bytes: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None
+        self.stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0
+        }
+    
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up an entry, promoting disk hits into the memory tier.
+        
+        Args:
+            key: Cache key
+        
+        Returns:
+            Cached value or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+                self.stats["evictions"] += 1
+        
+        entry = self._read_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry[1]
+    
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """
+        Store an entry in both tiers.
+        
+        Args:
+            key: Cache key
+            value: JSON-serializable value
+        """
+        entry = (time.time(), value)
+        with self._lock:
+            self.stats["sets"] += 1
+            self._remember(key, entry)
+        self._write_disk(key, entry)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get hit/miss counters for this cache.
+        
+        Returns:
+            Dictionary of counters plus the current memory tier size and hit ratio
+        """
+        with self._lock:
+            stats = dict(self.stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+    
+    def _remember(self, key: str, entry: tuple) -> None:
+        """Insert an entry into the memory tier, evicting the least recently used. Caller holds the lock."""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+    
+    def _read_disk(self, key: str, now: float) -> Optional[tuple]:
+        """Read an entry from the disk tier, deleting it if it has expired."""
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.error(f"Error reading cache entry {key}: {e}")
+            return None
+        
+        if now - data.get('stored_at', 0) >= self.ttl:
+            self._remove_file(path)
+            with self._lock:
+                self.stats["evictions"] += 1
+            return None
+        return data['stored_at'], data['value']
+    
+    def _write_disk(self, key: str, entry: tuple) -> None:
+        """Write an entry to the disk tier atomically and prune the tier if it is over budget."""
+        if not self.directory:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump({'key': key, 'stored_at': entry[0], 'value': entry[1]}, f)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Error writing cache entry {key}: {e}")
+            self._remove_file(tmp_path)
+            return
+        
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = directory_bytes(self.directory, '.json')
+            else:
+                self._disk_bytes += size
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._prune_disk()
+    
+    def _prune_disk(self) -> None:
+        """Delete expired entries, then the oldest ones until the tier is at 90% of its budget."""
+        removed, total = prune_directory(self.directory, '.json', self.disk_max_bytes, self.ttl)
+        with self._lock:
+            self._disk_bytes = total
+            self.stats["evictions"] += removed
+        if removed:
+            logger.info(f"Pruned {removed} cache entries from {self.directory}")
+    
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Named caches shared by the whole process
+_caches: Dict[str, TieredCache] = {}
+_caches_lock = threading.Lock()
+
+def get_cache(name: str, ttl: Optional[int] = None) -> TieredCache:
+    """
+    Get the process-wide cache with the given name, creating it from settings on first use.
+    
+    Each named cache stores its files in its own subdirectory of CACHE_DIR.
+    
+    Args:
+        name: Cache name (e.g. 'analysis')
+        ttl: Entry lifetime in seconds, defaults to CACHE_TTL; only used when the cache is created
+    
+    Returns:
+        Shared TieredCache instance
+    """
+    with _caches_lock:
+        if name not in _caches:
+            cache_dir = get_setting('CACHE_DIR')
+            _caches[name] = TieredCache(
+                directory=os.path.join(cache_dir, name) if cache_dir else None,
+                ttl=ttl if ttl is not None else get_setting('CACHE_TTL', 30 * 24 * 3600),
+                memory_max_entries=get_setting('CACHE_MEMORY_MAX_ENTRIES', 256),
+                disk_max_bytes=get_setting('CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024)
+            )
+        return _caches[name]
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Get hit/miss counters for every cache created in this process.
+    
+    Returns:
+        Dictionary mapping cache names to their stats
+    """
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.get_stats() for name, cache in caches.items()}
+
+def _collect_cache_lookups() -> Dict[tuple, float]:
+    lookups = {}
+    for name, stats in get_cache_stats().items():
+        lookups[(name, "memory_hit")] = stats["memory_hits"]
+        lookups[(name, "disk_hit")] = stats["disk_hits"]
+        lookups[(name, "miss")] = stats["misses"]
+    return lookups
+
+register_collector("gptcheck_cache_lookups_total", "Cache lookups by result", ("cache", "result"),
+                   _collect_cache_lookups, metric_type="counter")
+register_collector("gptcheck_cache_hit_ratio", "Share of cache lookups that were hits", ("cache",),
+                   lambda: {(name, ): stats["hit_ratio"] for name, stats in get_cache_stats().items()})
+register_collector("gptcheck_cache_evictions_total", "Entries evicted or expired from the cache", ("cache",),
+                   lambda: {(name, ): stats["evictions"] for name, stats in get_cache_stats().items()},
+                   metric_type="counter")
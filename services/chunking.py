@@ -0,0 +1,234 @@
+import re
+import logging
+import functools
+from array import array
+from itertools import accumulate
+from typing import Dict, Any, List, Optional
+from .transcripts import Transcript
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Context windows in tokens (prompt plus completion) of the models we call
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-3.5-turbo-0125": 16385,
+    "gpt-3.5-turbo-1106": 16385,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-3.5-turbo": 16385,
+    "gpt-4": 8192,
+    "gpt-4-turbo": 128000,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000
+}
+DEFAULT_CONTEXT_WINDOW = 4096
+
+# Rough characters per token, used only when tiktoken is unavailable
+FALLBACK_CHARS_PER_TOKEN = 3.5
+
+SENTENCE_END_PATTERN = re.compile(r'[.!?…]["\')\]]*$')
+
+@functools.lru_cache(maxsize=None)
+def _get_encoding(model: str):
+    """Get the tiktoken encoding for a model, or None if tiktoken is unavailable."""
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken is not installed, estimating token counts from text length")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The encoding files are downloaded on first use, which fails offline
+        logger.warning(f"Could not load tokenizer for {model}, estimating token counts: {e}")
+        return None
+
+def count_tokens(text: str, model: str) -> int:
+    """
+    Count the tokens a text uses with the given model's tokenizer.
+    
+    Args:
+        text: Text to count
+        model: OpenAI model name
+    
+    Returns:
+        Token count (estimated if tiktoken is unavailable)
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return int(len(text) / FALLBACK_CHARS_PER_TOKEN) + 1
+    return len(encoding.encode_ordinary(text))
+
+def get_context_window(model: str) -> int:
+    """
+    Get the context window of a model in tokens.
+    
+    Args:
+        model: OpenAI model name
+    
+    Returns:
+        Context window size, DEFAULT_CONTEXT_WINDOW for unknown models
+    """
+    return MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+
+def _caption_tokens(transcript: Transcript, model: str) -> array:
+    """Count the tokens of every caption, including the space joining it to the previous one."""
+    encoding = _get_encoding(model)
+    texts = [" " + transcript.text(index) for index in range(len(transcript))]
+    if encoding is None:
+        return array('q', (int(len(text) / FALLBACK_CHARS_PER_TOKEN) + 1 for text in texts))
+    return array('q', (len(tokens) for tokens in encoding.encode_ordinary_batch(texts)))
+
+def _split_oversized_captions(transcript: Transcript, tokens: array, model: str, max_tokens: int) -> Transcript:
+    """
+    Split every caption longer than ``max_tokens`` at word boundaries into pieces that fit.
+    
+    Each piece gets a share of the caption's time proportional to its length.
+    """
+    encoding = _get_encoding(model)
+    segments = []
+    for index in range(len(transcript)):
+        text = transcript.text(index)
+        start, duration = transcript.starts[index], transcript.durations[index]
+        if tokens[index] <= max_tokens:
+            segments.append({"text": text, "start": start, "duration": duration})
+            continue
+        
+        # Whitespace-separated words tokenize independently, so their counts add up
+        words = text.split()
+        if encoding is None:
+            word_tokens = [int((len(word) + 1) / FALLBACK_CHARS_PER_TOKEN) + 1 for word in words]
+        else:
+            word_tokens = [len(ids) for ids in encoding.encode_ordinary_batch([" " + word for word in words])]
+        pieces, piece, piece_tokens = [], [], 0
+        for word, word_count in zip(words, word_tokens):
+            if piece and piece_tokens + word_count > max_tokens:
+                pieces.append(" ".join(piece))
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += word_count
+        pieces.append(" ".join(piece))
+        
+        total_chars = sum(len(piece) for piece in pieces)
+        offset = 0
+        for piece in pieces:
+            segments.append({
+                "text": piece,
+                "start": start + duration * offset / total_chars,
+                "duration": duration * len(piece) / total_chars
+            })
+            offset += len(piece)
+    return Transcript.from_segments(segments)
+
+def _boundary_score(transcript: Transcript, index: int, pause_seconds: float) -> int:
+    """
+    Score the boundary after caption ``index``: 2 for a sentence end, 1 for a pause, 0 otherwise.
+    """
+    if SENTENCE_END_PATTERN.search(transcript.text(index).rstrip()):
+        return 2
+    if index + 1 < len(transcript):
+        gap = transcript.starts[index + 1] - (transcript.starts[index] + transcript.durations[index])
+        if gap >= pause_seconds:
+            return 1
+    return 0
+
+def chunk_transcript(transcript: Transcript, model: str, max_tokens: int, overlap_tokens: int = 0,
+                     pause_seconds: float = 1.0, boundary_window: float = 0.2) -> List[Dict[str, Any]]:
+    """
+    Split a transcript into chunks that fill the model's token budget.
+    
+    Chunks are packed greedily up to ``max_tokens``, then cut back to the best
+    boundary within the last ``boundary_window`` of the budget: a sentence end
+    if there is one, otherwise a pause between captions, otherwise the caption
+    that would have overflowed. Captions that alone exceed the budget are split
+    into word runs first. Each chunk after the first repeats about
+    ``overlap_tokens`` of the previous chunk's captions.
+    
+    Args:
+        transcript: Transcript to split
+        model: OpenAI model name, selects the tokenizer
+        max_tokens: Maximum tokens of transcript text per chunk
+        overlap_tokens: Tokens of context repeated at the start of each following chunk
+        pause_seconds: Minimum silence between captions that counts as a pause
+        boundary_window: Fraction of the budget searched backwards for a boundary
+    
+    Returns:
+        List of chunks with text, start_time, end_time and tokens
+    """
+    count = len(transcript)
+    if not count:
+        return []
+    
+    tokens = _caption_tokens(transcript, model)
+    if max(tokens) > max_tokens:
+        transcript = _split_oversized_captions(transcript, tokens, model, max_tokens)
+        tokens = _caption_tokens(transcript, model)
+        count = len(transcript)
+    
+    # prefix[i] is the token count of captions 0..i-1, so any run is one subtraction
+    prefix = array('q', [0])
+    prefix.extend(accumulate(tokens))
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    
+    chunks = []
+    first = 0
+    while first < count:
+        # Greedy fill: last is the end (exclusive) of the longest run within budget
+        last = first + 1
+        while last < count and prefix[last + 1] - prefix[first] <= max_tokens:
+            last += 1
+        
+        if last < count:
+            best, best_score = last, 0
+            floor = prefix[last] - max_tokens * boundary_window
+            index = last - 1
+            while index > first and prefix[index + 1] >= floor:
+                score = _boundary_score(transcript, index, pause_seconds)
+                if score > best_score:
+                    best, best_score = index + 1, score
+                    if score == 2:
+                        break
+                index -= 1
+            last = best
+        
+        end = last - 1
+        chunks.append({
+            "text": transcript.text_range(first, last),
+            "start_time": transcript.starts[first],
+            "end_time": transcript.starts[end] + transcript.durations[end],
+            "tokens": prefix[last] - prefix[first]
+        })
+        if last >= count:
+            break
+        
+        # Step back over whole captions for the overlap, always moving forward
+        next_first = last
+        while next_first - 1 > first and prefix[last] - prefix[next_first - 1] <= overlap_tokens:
+            next_first -= 1
+        first = next_first
+    
+    return chunks
+
+def section_token_budget(model: str, prompt_tokens: int, max_output_tokens: int,
+                         limit: Optional[int] = None, margin: int = 64,
+                         context_window: Optional[int] = None) -> int:
+    """
+    Work out how many transcript tokens fit in one section request.
+    
+    Args:
+        model: OpenAI model name
+        prompt_tokens: Tokens used by the prompt template around the transcript text
+        max_output_tokens: Tokens reserved for the completion
+        limit: Optional configured cap on the budget
+        margin: Tokens kept free for message framing and counting error
+        context_window: Context window to fit, defaults to the model's
+    
+    Returns:
+        Token budget for the transcript text of each section
+    """
+    budget = (context_window or get_context_window(model)) - max_output_tokens - prompt_tokens - margin
+    if limit:
+        budget = min(budget, limit)
+    return max(budget, 256)
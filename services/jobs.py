@@ -0,0 +1,252 @@
+import math
+import time
+import hashlib
+import logging
+import threading
+from flask import current_app, has_app_context
+from typing import Dict, Any, Optional, List, Tuple
+from config import get_setting
+from .scheduler import Priority, QueueFullError
+from .youtube import get_video_id
+from .analysis import process_video
+from .report import report_data
+from .tasks import (TaskStatus, ACTIVE_STATUSES, create_task, get_task_status, get_task_statuses,
+                    get_or_create_video_analysis_task, enqueue_task, touch_pending_tasks,
+                    task_progress_callback, task_partial_callback, get_scheduler_stats)
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+BULK_JOB_TYPE = 'bulk_analysis'
+
+def create_bulk_analysis_job(urls: List[str], api_key: str) -> Dict[str, Any]:
+    """
+    Create a job that analyzes many videos and start feeding it to the scheduler.
+    
+    URLs are deduplicated on the video ID, and each video shares its task with
+    any other submission of the same video, so cached and in-flight analyses
+    are reused instead of run again. URLs without a video ID are kept in the
+    job as invalid items.
+    
+    Args:
+        urls: YouTube video URLs
+        api_key: OpenAI API key
+    
+    Returns:
+        Job record
+    """
+    items, seen = [], set()
+    for url in urls:
+        video_id = get_video_id(url)
+        key = video_id or url
+        if key in seen:
+            continue
+        seen.add(key)
+        if video_id is None:
+            items.append({'youtube_url': url, 'video_id': None, 'task_id': None,
+                          'error': "Could not extract a video ID from the URL"})
+            continue
+        items.append({'youtube_url': url, 'video_id': video_id,
+                      'task_id': get_or_create_video_analysis_task(url, api_key), 'error': None})
+    
+    # The job record never runs itself, so it is created finished and cleaned up with other old tasks
+    job_id = create_task(BULK_JOB_TYPE, {
+        'items': items,
+        'submitted': len(urls),
+        'api_key': api_key[:10] + '...'  # Store partial API key for reference
+    }, status=TaskStatus.COMPLETED)
+    logger.info(f"Created bulk job {job_id} with {len(items)} videos from {len(urls)} URLs")
+    
+    start_bulk_dispatch(job_id, items, api_key)
+    return get_task_status(job_id)
+
+def _dispatch_pending(items: List[Dict[str, Any]], api_key: str) -> List[str]:
+    """
+    Queue as many pending tasks of a bulk job as BULK_MAX_QUEUED allows.
+    
+    Args:
+        items: Job items
+        api_key: OpenAI API key
+    
+    Returns:
+        IDs of the tasks that are still pending
+    """
+    tasks = get_task_statuses([item['task_id'] for item in items if item['task_id']])
+    pending = [item for item in items if tasks.get(item['task_id'], {}).get('status') == TaskStatus.PENDING]
+    free = get_setting('BULK_MAX_QUEUED', 50) - get_scheduler_stats()['queue_depth']
+    
+    while pending and free > 0:
+        item = pending[0]
+        task_id = item['task_id']
+        try:
+            enqueue_task(task_id, process_video, item['youtube_url'], api_key,
+                         priority=Priority.BULK,
+                         progress_callback=task_progress_callback(task_id),
+                         partial_callback=task_partial_callback(task_id))
+        except QueueFullError:
+            break
+        pending.pop(0)
+        free -= 1
+    return [item['task_id'] for item in pending]
+
+def start_bulk_dispatch(job_id: str, items: List[Dict[str, Any]], api_key: str) -> None:
+    """
+    Feed the pending tasks of a bulk job to the scheduler from a background thread.
+    
+    Only BULK_MAX_QUEUED tasks are queued at a time, so a large job neither
+    fills the queue for interactive requests nor fails with QueueFullError.
+    Tasks left waiting are refreshed on every round so they are not mistaken
+    for lost tasks.
+    
+    Args:
+        job_id: Bulk job ID
+        items: Job items
+        api_key: OpenAI API key
+    """
+    # Carry the Flask app into the thread so services see its config
+    app = current_app._get_current_object() if has_app_context() else None
+    
+    def dispatch():
+        while True:
+            try:
+                pending = _dispatch_pending(items, api_key)
+            except Exception as e:
+                logger.error(f"Error dispatching bulk job {job_id}: {e}")
+                pending = [item['task_id'] for item in items if item['task_id']]
+            if not pending:
+                logger.info(f"All tasks of bulk job {job_id} are queued")
+                return
+            touch_pending_tasks(pending)
+            time.sleep(get_setting('BULK_DISPATCH_INTERVAL', 2.0))
+    
+    def run():
+        if app is not None:
+            with app.app_context():
+                dispatch()
+        else:
+            dispatch()
+    
+    threading.Thread(target=run, name=f"bulk-job-{job_id}", daemon=True).start()
+
+def get_bulk_analysis_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get a bulk job with the current status of each of its tasks.
+    
+    Only the status, progress and updated_at of the tasks are read, which is
+    enough for bulk_job_version and the job's counts; results are left out.
+    
+    Args:
+        job_id: Bulk job ID
+    
+    Returns:
+        Job record with a tasks mapping of task ID to task, or None if not found
+    """
+    job = get_task_status(job_id)
+    if job['status'] == 'not_found' or job.get('type') != BULK_JOB_TYPE:
+        return None
+    job['tasks'] = get_task_statuses([item['task_id'] for item in job['params']['items'] if item['task_id']],
+                                     ['status', 'progress', 'updated_at'])
+    return job
+
+def bulk_job_version(job: Dict[str, Any], page: int, per_page: int) -> str:
+    """
+    Build an ETag for one page of a bulk job's status.
+    
+    It changes whenever any task of the job changes, because the counts and
+    progress cover the whole job, so it can be checked before the page is built.
+    
+    Args:
+        job: Job from get_bulk_analysis_job
+        page: 1-based page number
+        per_page: Items per page
+    
+    Returns:
+        ETag value
+    """
+    digest = hashlib.sha256(f"{job['id']}:{page}:{per_page}".encode('utf-8'))
+    for item in job['params']['items']:
+        task = job['tasks'].get(item['task_id']) or {}
+        digest.update(f"|{item['task_id']}:{task.get('status')}:{task.get('updated_at')}".encode('utf-8'))
+    return digest.hexdigest()[:32]
+
+def _item_progress(item: Dict[str, Any], task: Optional[Dict[str, Any]]) -> Tuple[str, int]:
+    """Get the status and progress percentage of one video of a bulk job."""
+    if item['task_id'] is None:
+        return 'invalid', 0
+    if task is None:
+        # Old finished tasks are removed by the task store cleanup
+        return 'expired', 100
+    return task['status'], 100 if task['status'] not in ACTIVE_STATUSES else task.get('progress') or 0
+
+def _item_status(item: Dict[str, Any], task: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the status of one video of a bulk job from its whole task."""
+    state, progress = _item_progress(item, task)
+    status = {
+        'youtube_url': item['youtube_url'],
+        'video_id': item['video_id'],
+        'task_id': item['task_id'],
+        'status': state,
+        'progress': progress
+    }
+    if item['task_id'] is None:
+        status['error'] = item['error']
+    elif task is None:
+        status['error'] = "Task no longer exists"
+    else:
+        status.update({
+            'message': task.get('message'),
+            'error': task.get('error')
+        })
+        if task['status'] == TaskStatus.COMPLETED:
+            status['result'] = report_data(task.get('result'))
+    return status
+
+def summarize_bulk_analysis_job(job: Dict[str, Any], page: int = 1, per_page: int = 100) -> Dict[str, Any]:
+    """
+    Build the aggregated status of a bulk job with one page of per-video statuses.
+    
+    The counts and progress come from the task statuses already on the job;
+    whole tasks, with their results, are only read for the requested page.
+    
+    Args:
+        job: Job from get_bulk_analysis_job
+        page: 1-based page number
+        per_page: Items per page
+    
+    Returns:
+        Dictionary with overall status, progress, counts by status and the page of items
+    """
+    items = job['params']['items']
+    counts: Dict[str, int] = {}
+    progress_total = 0
+    for item in items:
+        status, progress = _item_progress(item, job['tasks'].get(item['task_id']))
+        counts[status] = counts.get(status, 0) + 1
+        progress_total += progress
+    
+    valid = len(items) - counts.get('invalid', 0)
+    if any(counts.get(status) for status in ACTIVE_STATUSES):
+        overall = 'processing'
+    elif valid and counts.get(TaskStatus.COMPLETED, 0) == valid:
+        overall = 'completed'
+    elif counts.get(TaskStatus.COMPLETED):
+        overall = 'partial'
+    else:
+        overall = 'failed'
+    
+    start = (page - 1) * per_page
+    page_items = items[start:start + per_page]
+    tasks = get_task_statuses([item['task_id'] for item in page_items if item['task_id']])
+    return {
+        'job_id': job['id'],
+        'status': overall,
+        'progress': round(progress_total / valid) if valid else 100,
+        'submitted': job['params'].get('submitted', len(items)),
+        'total': len(items),
+        'counts': counts,
+        'created_at': job.get('created_at'),
+        'page': page,
+        'per_page': per_page,
+        'pages': math.ceil(len(items) / per_page),
+        'items': [_item_status(item, tasks.get(item['task_id'])) for item in page_items]
+    }
@@ -0,0 +1,283 @@
+import json
+import time
+import bisect
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Tuple, Iterator, Callable
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets in seconds, from cache hits up to long summaries
+DEFAULT_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+# USD per 1K tokens as (prompt, completion); models not listed are counted without cost
+MODEL_PRICES = {
+    "gpt-3.5-turbo-0125": (0.0005, 0.0015),
+    "gpt-3.5-turbo-1106": (0.001, 0.002),
+    "gpt-3.5-turbo-16k": (0.003, 0.004),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4o-mini": (0.00015, 0.0006)
+}
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A named metric with a fixed set of label names, in the Prometheus text format"""
+    
+    type = "untyped"
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._lock = threading.Lock()
+    
+    def render(self) -> List[str]:
+        """Render the metric's HELP, TYPE and sample lines."""
+        return [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"] + self._samples()
+    
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Monotonically increasing value per label set"""
+    
+    type = "counter"
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._values: Dict[LabelValues, float] = {}
+    
+    def inc(self, amount: float = 1, *label_values: str) -> None:
+        """
+        Increase the counter.
+        
+        Args:
+            amount: Amount to add, must not be negative
+            *label_values: Values of the metric's labels, in order
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+class Histogram(Metric):
+    """Distribution of observed values per label set, in cumulative buckets"""
+    
+    type = "histogram"
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[LabelValues, List[float]] = {}  # bucket counts, then sum and count
+    
+    def observe(self, value: float, *label_values: str) -> None:
+        """
+        Record one observation.
+        
+        Args:
+            value: Observed value
+            *label_values: Values of the metric's labels, in order
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = self._values[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+    
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(state)) for key, state in self._values.items())
+        lines = []
+        for key, state in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}")
+        return lines
+
+class CollectedMetric(Metric):
+    """Values read from a callback when the metrics are rendered, e.g. from existing stats"""
+    
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...],
+                 collect: Callable[[], Dict[LabelValues, float]], metric_type: str = "gauge"):
+        super().__init__(name, description, labels)
+        self.type = metric_type
+        self._collect = collect
+    
+    def _samples(self) -> List[str]:
+        try:
+            values = sorted(self._collect().items())
+        except Exception as e:
+            logger.warning(f"Could not collect {self.name}: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+STAGE_DURATION = Histogram(
+    "gptcheck_stage_duration_seconds", "Time spent in each stage of a video analysis", ("stage",))
+OPENAI_REQUEST_DURATION = Histogram(
+    "gptcheck_openai_request_duration_seconds", "Duration of OpenAI requests including retries", ("model", "outcome"))
+OPENAI_RETRIES = Counter(
+    "gptcheck_openai_retries_total", "OpenAI requests retried after a transient error", ("model",))
+OPENAI_TOKENS = Counter(
+    "gptcheck_openai_tokens_total", "Tokens used by OpenAI requests", ("model", "type"))
+OPENAI_COST = Counter(
+    "gptcheck_openai_cost_usd_total", "Estimated cost of OpenAI requests in USD", ("model",))
+TASK_DURATION = Histogram(
+    "gptcheck_task_duration_seconds", "Time tasks spent running, by final status", ("type", "status"))
+MODEL_FALLBACKS = Counter(
+    "gptcheck_model_fallbacks_total", "Calls moved to a fallback model after the stage's model failed",
+    ("stage", "model"))
+TRANSCRIPT_TOKENS_SAVED = Counter(
+    "gptcheck_transcript_tokens_saved_total", "Prompt tokens removed by transcript normalization")
+
+_metrics: List[Metric] = [STAGE_DURATION, OPENAI_REQUEST_DURATION, OPENAI_RETRIES, OPENAI_TOKENS, OPENAI_COST,
+                          TASK_DURATION, MODEL_FALLBACKS, TRANSCRIPT_TOKENS_SAVED]
+_metrics_lock = threading.Lock()
+
+def register_collector(name: str, description: str, labels: Tuple[str, ...],
+                       collect: Callable[[], Dict[LabelValues, float]], metric_type: str = "gauge") -> None:
+    """
+    Add a metric whose values are read when the metrics are rendered.
+    
+    Args:
+        name: Metric name
+        description: HELP text
+        labels: Label names
+        collect: Callback returning a mapping of label values to the current value
+        metric_type: 'gauge', or 'counter' for totals kept elsewhere
+    """
+    with _metrics_lock:
+        if not any(metric.name == name for metric in _metrics):
+            _metrics.append(CollectedMetric(name, description, labels, collect, metric_type))
+
+def render_metrics() -> str:
+    """
+    Render every metric of this process in the Prometheus text exposition format.
+    
+    Returns:
+        Metrics text
+    """
+    with _metrics_lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def record_openai_usage(model: str, prompt_tokens: int, completion_tokens: int) -> None:
+    """
+    Count the tokens and estimated cost of one OpenAI request.
+    
+    Args:
+        model: Model name
+        prompt_tokens: Prompt tokens used
+        completion_tokens: Completion tokens generated
+    """
+    OPENAI_TOKENS.inc(prompt_tokens, model, "prompt")
+    OPENAI_TOKENS.inc(completion_tokens, model, "completion")
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    OPENAI_COST.inc((prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000, model)
+
+# Spans of the task running in the current context, None outside of tasks
+_current_spans: contextvars.ContextVar[Optional[List[Dict[str, Any]]]] = contextvars.ContextVar(
+    "gptcheck_task_spans", default=None)
+
+def _add_span(name: str, started_at: float, duration: float, attributes: Dict[str, Any]) -> None:
+    spans = _current_spans.get()
+    if spans is not None:
+        spans.append({"name": name, "start": round(started_at, 6), "duration": round(duration, 6), **attributes})
+
+@contextmanager
+def stage(name: str, **attributes) -> Iterator[Dict[str, Any]]:
+    """
+    Time a stage of an analysis into the stage histogram and the current task's spans.
+    
+    Args:
+        name: Stage name, e.g. 'transcript' or 'summary'
+        **attributes: Extra fields recorded on the span
+    
+    Yields:
+        The span's attributes, which the stage can add results to
+    """
+    started_at, start = time.time(), time.perf_counter()
+    try:
+        yield attributes
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_DURATION.observe(duration, name)
+        _add_span(name, started_at, duration, attributes)
+
+def record_openai_request(model: str, outcome: str, started_at: float, duration: float,
+                          attempts: int, **attributes) -> None:
+    """
+    Record the duration of one OpenAI request in the histogram and the current task's spans.
+    
+    Args:
+        model: Model name
+        outcome: 'ok' or 'error'
+        started_at: Wall clock time the request started
+        duration: Seconds the request took, including retries
+        attempts: Number of attempts made
+        **attributes: Extra fields recorded on the span
+    """
+    OPENAI_REQUEST_DURATION.observe(duration, model, outcome)
+    _add_span("openai", started_at, duration,
+              {"model": model, "outcome": outcome, "attempts": attempts, **attributes})
+
+@contextmanager
+def task_spans(task_id: str, task_type: str) -> Iterator[Dict[str, Any]]:
+    """
+    Collect the spans of a task and log them as one JSON line when it finishes.
+    
+    Worker threads and asyncio tasks started from inside inherit the collector
+    when they copy the current context.
+    
+    Args:
+        task_id: The ID of the task
+        task_type: Type of task, used as a metric label
+    
+    Yields:
+        Record whose 'status' the caller sets to the task's final status
+    """
+    record = {"event": "task_spans", "task_id": task_id, "type": task_type, "status": "failed",
+              "start": round(time.time(), 6), "spans": []}
+    token = _current_spans.set(record["spans"])
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _current_spans.reset(token)
+        record["duration"] = round(time.perf_counter() - start, 6)
+        TASK_DURATION.observe(record["duration"], task_type, record["status"])
+        logger.info(json.dumps(record))
@@ -0,0 +1,185 @@
+import logging
+from typing import Any, Dict, Iterator, List
+from config import get_setting
+from .openai_client import OpenAIClient, get_openai_client, is_retryable
+from .chunking import get_context_window
+from .metrics import MODEL_FALLBACKS
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Analysis stages that can each run on their own model
+SECTION = "section"
+MERGE = "merge"
+SUMMARY = "summary"
+STAGES = (SECTION, MERGE, SUMMARY)
+
+LOCAL_PREFIX = "local:"
+
+class ModelBackend:
+    """Sends chat completions for the models of one API"""
+    
+    def client(self, api_key: str) -> OpenAIClient:
+        """
+        Get the client for a request.
+        
+        Args:
+            api_key: The user's OpenAI API key
+        
+        Returns:
+            OpenAIClient
+        """
+        raise NotImplementedError
+    
+    def context_window(self, model: str) -> int:
+        """Get the context window of a model in tokens."""
+        raise NotImplementedError
+
+class OpenAIBackend(ModelBackend):
+    """The OpenAI API, billed to the user's key"""
+    
+    def client(self, api_key: str) -> OpenAIClient:
+        return get_openai_client(api_key)
+    
+    def context_window(self, model: str) -> int:
+        return get_context_window(model)
+
+class LocalBackend(ModelBackend):
+    """
+    An OpenAI-compatible server, such as vLLM, llama.cpp or Ollama.
+    
+    Requests use LOCAL_MODEL_API_KEY rather than the user's key and are not
+    paced by the OpenAI rate limits.
+    """
+    
+    def __init__(self, base_url: str, api_key: str, context_window: int):
+        self.base_url = base_url
+        self.api_key = api_key
+        self._context_window = context_window
+    
+    def client(self, api_key: str) -> OpenAIClient:
+        return get_openai_client(self.api_key, self.base_url)
+    
+    def context_window(self, model: str) -> int:
+        return self._context_window
+
+def get_backend(spec: str) -> ModelBackend:
+    """
+    Get the backend serving a model.
+    
+    Args:
+        spec: Model name, prefixed with 'local:' for the local server
+    
+    Returns:
+        ModelBackend instance
+    """
+    if spec.startswith(LOCAL_PREFIX):
+        return LocalBackend(get_setting('LOCAL_MODEL_BASE_URL', 'http://localhost:8000/v1'),
+                            get_setting('LOCAL_MODEL_API_KEY', 'local'),
+                            get_setting('LOCAL_MODEL_CONTEXT_WINDOW', 8192))
+    return OpenAIBackend()
+
+def model_name(spec: str) -> str:
+    """Get the model name sent to the backend, without the 'local:' prefix."""
+    return spec[len(LOCAL_PREFIX):] if spec.startswith(LOCAL_PREFIX) else spec
+
+def stage_models(stage: str) -> List[str]:
+    """
+    Get the models configured for a stage, the primary one first and then its fallbacks.
+    
+    Args:
+        stage: SECTION, MERGE or SUMMARY
+    
+    Returns:
+        Model specs in the order they are tried
+    """
+    setting = stage.upper()
+    models = [get_setting(f'{setting}_MODEL') or 'gpt-3.5-turbo-0125']
+    for spec in (get_setting(f'{setting}_FALLBACK_MODELS') or '').split(','):
+        spec = spec.strip()
+        if spec and spec not in models:
+            models.append(spec)
+    return models
+
+def stage_model(stage: str) -> str:
+    """Get the name of a stage's primary model, e.g. to select the tokenizer."""
+    return model_name(stage_models(stage)[0])
+
+def stage_context_window(stage: str) -> int:
+    """
+    Get the context window a stage's prompts must fit.
+    
+    Prompts are sized once, so they must fit every model the stage may fall back to.
+    
+    Args:
+        stage: SECTION, MERGE or SUMMARY
+    
+    Returns:
+        Smallest context window of the stage's models
+    """
+    return min(get_backend(spec).context_window(model_name(spec)) for spec in stage_models(stage))
+
+def models_key() -> str:
+    """Describe the configured models of every stage, for cache keys."""
+    return ";".join(f"{stage}={','.join(stage_models(stage))}" for stage in STAGES)
+
+def _attempts(stage: str):
+    """Yield (spec, backend, max_retries, is_last) for each model of a stage."""
+    models = stage_models(stage)
+    for index, spec in enumerate(models):
+        last = index == len(models) - 1
+        yield spec, get_backend(spec), None if last else get_setting('MODEL_FALLBACK_RETRIES', 1), last
+
+def chat_completion(stage: str, api_key: str, **params) -> Any:
+    """
+    Create a chat completion with a stage's model, falling back to the next one
+    when a model keeps timing out or is overloaded.
+    
+    Args:
+        stage: SECTION, MERGE or SUMMARY
+        api_key: The user's OpenAI API key
+        **params: Arguments for OpenAIClient.chat_completion; the model is set per attempt
+    
+    Returns:
+        Completion response, or a chunk iterator when stream=True (see _stream_with_fallback)
+    """
+    if params.get('stream'):
+        return _stream_with_fallback(stage, api_key, params)
+    for spec, backend, max_retries, last in _attempts(stage):
+        try:
+            return backend.client(api_key).chat_completion(max_retries=max_retries,
+                                                           **dict(params, model=model_name(spec)))
+        except Exception as e:
+            if last or not is_retryable(e):
+                raise
+            _record_fallback(stage, spec, e)
+
+def _stream_with_fallback(stage: str, api_key: str, params: Dict[str, Any]) -> Iterator[Any]:
+    """
+    Stream a chat completion, falling back to the next model on errors raised
+    while opening or reading the stream.
+    
+    A model that fails after some chunks were yielded is replaced by the next
+    model's completion from the start, preceded by None so the caller can
+    discard what it received.
+    """
+    discard = False
+    for spec, backend, max_retries, last in _attempts(stage):
+        try:
+            chunks = backend.client(api_key).chat_completion(max_retries=max_retries,
+                                                             **dict(params, model=model_name(spec)))
+            if discard:
+                yield None
+                discard = False
+            for chunk in chunks:
+                discard = True
+                yield chunk
+            return
+        except Exception as e:
+            if last or not is_retryable(e):
+                raise
+            _record_fallback(stage, spec, e)
+
+def _record_fallback(stage: str, spec: str, error: Exception) -> None:
+    MODEL_FALLBACKS.inc(1, stage, model_name(spec))
+    logger.warning(f"{stage} model {spec} failed ({error.__class__.__name__}), falling back")
@@ -0,0 +1,96 @@
+import re
+import logging
+from typing import Dict, Any, List, Tuple
+from .transcripts import Transcript
+from .chunking import count_tokens
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Bump when the cleanup rules change so analyses of normalized transcripts are redone
+NORMALIZATION_VERSION = "2"
+
+# Sound descriptions in auto-generated captions: [Music], [Applause], (laughter), ♪ ... ♪
+NON_SPEECH_PATTERN = re.compile(
+    r'\[[^\]]{0,40}\]|\((?:[a-z ]{0,20})(?:music|applause|laughter|laughs|inaudible|silence)[a-z ]{0,20}\)|[♪♫]+',
+    re.IGNORECASE)
+# Only words that are never content; "mm" is left alone as it is also the unit
+FILLER_PATTERN = re.compile(r'\b(?:u+m+|u+h+|e+r+m+|h+m+)\b[,.]?', re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# Rolling captions repeat the end of the previous caption; shorter repeats are kept unless
+# they make up the whole caption, so legitimate repeated words survive
+OVERLAP_MIN_WORDS = 2
+OVERLAP_MAX_WORDS = 40
+
+def _word_key(word: str) -> str:
+    return word.strip('.,!?;:"\'').lower()
+
+def _overlap(previous: List[str], current: List[str]) -> int:
+    """Number of leading words of current that repeat the trailing words of previous."""
+    for size in range(min(len(previous), len(current), OVERLAP_MAX_WORDS), 0, -1):
+        if previous[-size:] == current[:size]:
+            if size >= OVERLAP_MIN_WORDS or size == len(current):
+                return size
+            break
+    return 0
+
+def clean_caption(text: str, remove_filler: bool = True) -> str:
+    """
+    Remove non-speech markers, optionally filler words, and redundant whitespace from one caption.
+    
+    Args:
+        text: Caption text
+        remove_filler: Whether to drop filler words such as "um" and "uh"
+    
+    Returns:
+        Cleaned caption, empty if nothing spoken is left
+    """
+    text = NON_SPEECH_PATTERN.sub(' ', text)
+    if remove_filler:
+        text = FILLER_PATTERN.sub(' ', text)
+    return WHITESPACE_PATTERN.sub(' ', text).strip()
+
+def normalize_transcript(transcript: Transcript, model: str,
+                         remove_filler: bool = True) -> Tuple[Transcript, Dict[str, Any]]:
+    """
+    Clean up a transcript before it is split into sections.
+    
+    Non-speech markers, filler words and stray whitespace are removed, and text
+    a caption repeats from the end of the previous one is dropped. Every caption
+    that still has text keeps its original start and duration, so sections and
+    claims link back to the same video times; captions left empty are dropped.
+    
+    Args:
+        transcript: Transcript as fetched
+        model: OpenAI model name, selects the tokenizer for the savings
+        remove_filler: Whether to drop filler words such as "um" and "uh"
+    
+    Returns:
+        Normalized transcript and a dictionary with captions_before, captions_after,
+        tokens_before, tokens_after and tokens_saved
+    """
+    segments = []
+    previous_words: List[str] = []
+    for index in range(len(transcript)):
+        text = clean_caption(transcript.text(index), remove_filler)
+        words = text.split(' ') if text else []
+        keys = [_word_key(word) for word in words]
+        skip = _overlap(previous_words, keys)
+        if keys:
+            # Compare the next caption with this one as spoken, not as trimmed
+            previous_words = keys
+        if skip < len(words):
+            segments.append({'text': ' '.join(words[skip:]), 'start': transcript.starts[index],
+                             'duration': transcript.durations[index]})
+    normalized = Transcript.from_segments(segments)
+    
+    tokens_before = count_tokens(transcript.text_range(0, len(transcript)), model)
+    tokens_after = count_tokens(normalized.text_range(0, len(normalized)), model)
+    stats = {
+        'captions_before': len(transcript),
+        'captions_after': len(normalized),
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'tokens_saved': max(tokens_before - tokens_after, 0)
+    }
+    return normalized, stats
@@ -0,0 +1,344 @@
+import re
+import time
+import random
+import hashlib
+import logging
+import threading
+import functools
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List
+from config import get_setting
+from .rate_limit import get_rate_limiter, openai_buckets, BucketRequest
+from .metrics import OPENAI_RETRIES, record_openai_request, record_openai_usage
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DURATION_PART_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+MAX_CLIENTS = 256
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse an x-ratelimit-reset-* header value such as "6m0s" or "20ms".
+    
+    Args:
+        value: Header value
+    
+    Returns:
+        Duration in seconds, or None if the value is missing or malformed
+    """
+    if not value:
+        return None
+    parts = DURATION_PART_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+@functools.lru_cache(maxsize=None)
+def _retryable_errors() -> tuple:
+    """Errors worth retrying: rate limits, overloaded or failing servers, network trouble."""
+    import openai
+    
+    return (
+        openai.error.RateLimitError,
+        openai.error.ServiceUnavailableError,
+        openai.error.APIError,
+        openai.error.Timeout,
+        openai.error.APIConnectionError,
+        openai.error.TryAgain
+    )
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether an OpenAI error is transient."""
+    import openai
+    
+    if not isinstance(error, _retryable_errors()):
+        return False
+    # An exhausted quota is reported as a 429 but never clears by waiting
+    if isinstance(error, openai.error.RateLimitError) and error.code == 'insufficient_quota':
+        return False
+    if type(error) is openai.error.APIError and error.http_status is not None and error.http_status < 500:
+        return False
+    return True
+
+def _estimate_tokens(params: Dict[str, Any]) -> int:
+    """Rough token cost of a request as counted against TPM limits: prompt plus max_tokens."""
+    prompt_chars = sum(len(message.get('content') or '') for message in params.get('messages', []))
+    return prompt_chars // 4 + params.get('max_tokens', 0)
+
+class OpenAIClient:
+    """
+    OpenAI access for one API key.
+    
+    Holds a pooled HTTP session for the key, retries transient failures with
+    exponential backoff and full jitter, and paces requests using the shared
+    RPM/TPM token buckets and the x-ratelimit-* headers of earlier responses,
+    so calls wait for capacity instead of failing with 429s.
+    
+    With api_base set the client talks to an OpenAI-compatible server instead,
+    such as a local model server, and skips the shared OpenAI buckets.
+    """
+    
+    def __init__(self, api_key: str, api_base: Optional[str] = None):
+        import requests
+        
+        self.api_key = api_key
+        self.api_base = api_base
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=get_setting('OPENAI_POOL_SIZE', 16), max_retries=2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.hooks['response'].append(self._on_response)
+        
+        self._lock = threading.Lock()
+        self._remaining_requests: Optional[int] = None
+        self._remaining_tokens: Optional[int] = None
+        self._requests_reset_at = 0.0
+        self._tokens_reset_at = 0.0
+        self._blocked_until = 0.0
+    
+    def chat_completion(self, max_retries: Optional[int] = None, **params) -> Any:
+        """
+        Create a chat completion with this client's key, retrying transient errors.
+        
+        Args:
+            max_retries: Retries after the first attempt, defaults to OPENAI_MAX_RETRIES
+            **params: Arguments for openai.ChatCompletion.create
+        
+        Returns:
+            Completion response, or a chunk iterator when stream=True
+        """
+        import openai
+        
+        _install_session_router()
+        model = params.get('model', '')
+        started_at, start = time.time(), time.perf_counter()
+        if max_retries is None:
+            max_retries = get_setting('OPENAI_MAX_RETRIES', 4)
+        for attempt in range(max_retries + 1):
+            self._wait_for_capacity(params)
+            time.sleep(self._reserve(params))
+            try:
+                response = openai.ChatCompletion.create(
+                    api_key=self.api_key,
+                    request_timeout=get_setting('OPENAI_REQUEST_TIMEOUT', 120),
+                    **self._server_params(),
+                    **params
+                )
+            except Exception as e:
+                if attempt == max_retries or not is_retryable(e):
+                    record_openai_request(model, 'error', started_at, time.perf_counter() - start, attempt + 1,
+                                          error=e.__class__.__name__)
+                    raise
+                OPENAI_RETRIES.inc(1, model)
+                delay = self._backoff(e, attempt)
+                logger.warning(f"OpenAI request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            else:
+                if params.get('stream'):
+                    return self._track_stream(response, params, started_at, start, attempt + 1)
+                self._record_usage(response, params)
+                record_openai_request(model, 'ok', started_at, time.perf_counter() - start, attempt + 1)
+                return response
+    
+    def get_rate_limit_state(self) -> Dict[str, Any]:
+        """
+        Get the rate limit state last reported by OpenAI for this key.
+        
+        Returns:
+            Dictionary with remaining requests and tokens and seconds until they reset
+        """
+        now = time.time()
+        with self._lock:
+            return {
+                "remaining_requests": self._remaining_requests,
+                "remaining_tokens": self._remaining_tokens,
+                "requests_reset_in": round(max(0.0, self._requests_reset_at - now), 3),
+                "tokens_reset_in": round(max(0.0, self._tokens_reset_at - now), 3),
+                "blocked_for": round(max(0.0, self._blocked_until - now), 3)
+            }
+    
+    @staticmethod
+    def _record_usage(response: Any, params: Dict[str, Any]) -> None:
+        """Count the tokens reported in a completion's usage, estimating them when it has none."""
+        usage = response.get('usage') if hasattr(response, 'get') else None
+        if usage:
+            record_openai_usage(params.get('model', ''), usage.get('prompt_tokens', 0),
+                                usage.get('completion_tokens', 0))
+        else:
+            record_openai_usage(params.get('model', ''), _estimate_tokens(params) - params.get('max_tokens', 0), 0)
+    
+    def _track_stream(self, chunks, params: Dict[str, Any], started_at: float, start: float, attempts: int):
+        """
+        Pass a streamed completion through, recording it once the stream ends.
+        
+        Streamed responses carry no usage, so the prompt is estimated and each
+        content chunk is counted as one completion token.
+        """
+        model = params.get('model', '')
+        completion_tokens, outcome = 0, 'error'
+        try:
+            for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.get('content'):
+                    completion_tokens += 1
+                yield chunk
+            outcome = 'ok'
+        finally:
+            record_openai_usage(model, _estimate_tokens(params) - params.get('max_tokens', 0), completion_tokens)
+            record_openai_request(model, outcome, started_at, time.perf_counter() - start, attempts, stream=True)
+    
+    def close(self) -> None:
+        """Close the pooled HTTP session."""
+        self.session.close()
+    
+    def _server_params(self) -> Dict[str, Any]:
+        return {'api_base': self.api_base} if self.api_base else {}
+    
+    def _capacity_buckets(self, params: Dict[str, Any]) -> List[BucketRequest]:
+        """Get the rate limit buckets a request takes from; none for servers other than OpenAI."""
+        if self.api_base:
+            return []
+        return openai_buckets(self.api_key, params.get('model', ''), _estimate_tokens(params))
+    
+    def _wait_for_capacity(self, params: Dict[str, Any]) -> None:
+        """
+        Wait for this key's RPM and TPM buckets, shared by every worker process.
+        
+        A broken limiter store must not stop analyses, so its errors only log a warning.
+        """
+        buckets = self._capacity_buckets(params)
+        if not buckets:
+            return
+        try:
+            get_rate_limiter().acquire(buckets)
+        except Exception as e:
+            logger.warning(f"Rate limiter unavailable, sending without waiting: {e}")
+    
+    def _reserve(self, params: Dict[str, Any]) -> float:
+        """
+        Account for a request about to be sent and work out how long to wait first.
+        
+        Returns:
+            Seconds to wait before sending
+        """
+        tokens = _estimate_tokens(params)
+        now = time.time()
+        with self._lock:
+            wait = self._blocked_until - now
+            if self._remaining_requests is not None:
+                if self._remaining_requests <= 0:
+                    wait = max(wait, self._requests_reset_at - now)
+                self._remaining_requests -= 1
+            if self._remaining_tokens is not None:
+                if self._remaining_tokens < tokens:
+                    wait = max(wait, self._tokens_reset_at - now)
+                self._remaining_tokens -= tokens
+        return min(max(wait, 0.0), get_setting('OPENAI_BACKOFF_MAX', 30))
+    
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        """
+        Work out the delay before retrying, blocking other requests on this key for that long.
+        
+        Honours Retry-After when the server sends it, otherwise uses exponential
+        backoff with full jitter.
+        """
+        import openai
+        
+        headers = getattr(error, 'headers', None) or {}
+        retry_after = headers.get('retry-after')
+        try:
+            delay = float(retry_after) if retry_after else None
+        except ValueError:
+            delay = None
+        if delay is None:
+            cap = min(get_setting('OPENAI_BACKOFF_MAX', 30), get_setting('OPENAI_BACKOFF_BASE', 1.0) * 2 ** attempt)
+            delay = random.uniform(0, cap)
+        if isinstance(error, openai.error.RateLimitError):
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.time() + delay)
+        return delay
+    
+    def _record_rate_limits(self, headers) -> None:
+        """Update the pacing state from x-ratelimit-* response headers."""
+        remaining_requests = headers.get('x-ratelimit-remaining-requests')
+        remaining_tokens = headers.get('x-ratelimit-remaining-tokens')
+        if remaining_requests is None and remaining_tokens is None:
+            return
+        now = time.time()
+        requests_reset = parse_reset_duration(headers.get('x-ratelimit-reset-requests'))
+        tokens_reset = parse_reset_duration(headers.get('x-ratelimit-reset-tokens'))
+        with self._lock:
+            try:
+                if remaining_requests is not None:
+                    self._remaining_requests = int(remaining_requests)
+                if remaining_tokens is not None:
+                    self._remaining_tokens = int(remaining_tokens)
+            except ValueError:
+                return
+            if requests_reset is not None:
+                self._requests_reset_at = now + requests_reset
+            if tokens_reset is not None:
+                self._tokens_reset_at = now + tokens_reset
+    
+    def _on_response(self, response: "requests.Response", *args, **kwargs) -> None:
+        self._record_rate_limits(response.headers)
+
+_clients: "OrderedDict[str, OpenAIClient]" = OrderedDict()
+_clients_lock = threading.Lock()
+_router_installed = False
+
+def _install_session_router() -> None:
+    """
+    Install a session as openai.requestssession that routes requests by API key.
+    
+    openai keeps one session per thread, so short-lived worker threads would
+    each open new connections. The installed session sends every OpenAI
+    request through the pooled session of the API key in its Authorization
+    header. Requests to other servers, such as a local model server with a
+    placeholder key, are sent by the installed session itself so they never
+    create OpenAI clients or touch their pacing state.
+    """
+    global _router_installed
+    if _router_installed:
+        return
+    import openai
+    import requests
+    
+    class KeyRoutingSession(requests.Session):
+        def request(self, method, url, headers=None, **kwargs):
+            if not url.startswith(openai.api_base):
+                return super().request(method, url, headers=headers, **kwargs)
+            authorization = (headers or {}).get('Authorization', '')
+            api_key = authorization[len('Bearer '):] if authorization.startswith('Bearer ') else authorization
+            return get_openai_client(api_key).session.request(method, url, headers=headers, **kwargs)
+    
+    openai.requestssession = KeyRoutingSession()
+    _router_installed = True
+
+def get_openai_client(api_key: str, api_base: Optional[str] = None) -> OpenAIClient:
+    """
+    Get the shared client for an API key, creating it on first use.
+    
+    Clients are keyed by a hash of the key and server, and the least recently
+    used ones are closed once more than MAX_CLIENTS are in use.
+    
+    Args:
+        api_key: OpenAI API key
+        api_base: Base URL of an OpenAI-compatible server, None for OpenAI
+    
+    Returns:
+        OpenAIClient for the key
+    """
+    key_hash = hashlib.sha256(f"{api_base or ''}\x1e{api_key}".encode('utf-8')).hexdigest()
+    with _clients_lock:
+        client = _clients.get(key_hash)
+        if client is None:
+            client = _clients[key_hash] = OpenAIClient(api_key, api_base)
+            while len(_clients) > MAX_CLIENTS:
+                _, evicted = _clients.popitem(last=False)
+                evicted.close()
+        else:
+            _clients.move_to_end(key_hash)
+        return client
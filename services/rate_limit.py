@@ -0,0 +1,283 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+from config import get_setting
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# A bucket request: (bucket key, tokens wanted, bucket capacity, refill rate per second)
+BucketRequest = Tuple[str, float, float, float]
+
+RATE_LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*(?:per|/)\s*(\d+)?\s*(second|minute|hour|day)s?\s*$')
+PERIOD_SECONDS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+class RateLimitExceeded(Exception):
+    """Raised when a rate limit does not free up in time"""
+    def __init__(self, retry_after: float):
+        super().__init__("Rate limit exceeded, please try again later")
+        self.retry_after = retry_after
+
+def parse_rate_limits(spec: Optional[str]) -> List[Tuple[int, int]]:
+    """
+    Parse a limit string in the RATELIMIT_DEFAULT format, e.g. "200 per day;50 per hour".
+    
+    Args:
+        spec: Semicolon-separated limits
+    
+    Returns:
+        List of (amount, period in seconds)
+    
+    Raises:
+        ValueError: If a limit cannot be parsed
+    """
+    limits = []
+    for part in (spec or "").split(';'):
+        if not part.strip():
+            continue
+        match = RATE_LIMIT_PATTERN.match(part.lower())
+        if not match:
+            raise ValueError(f"Invalid rate limit: {part!r}")
+        amount, multiplier, unit = match.groups()
+        limits.append((int(amount), int(multiplier or 1) * PERIOD_SECONDS[unit]))
+    return limits
+
+def _refill(tokens: float, updated_at: float, now: float, capacity: float, rate: float) -> float:
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+class RateLimiter:
+    """
+    Token buckets that all take from the same state.
+    
+    try_acquire takes from several buckets at once: either every bucket has
+    enough tokens and all are charged, or none is and the caller is told how
+    long to wait.
+    """
+    
+    def try_acquire(self, requests: List[BucketRequest]) -> float:
+        """
+        Take tokens from every bucket, or from none.
+        
+        Args:
+            requests: Buckets and the tokens wanted from each
+        
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they are likely available
+        """
+        raise NotImplementedError
+    
+    def acquire(self, requests: List[BucketRequest], timeout: Optional[float] = None) -> None:
+        """
+        Block until the tokens can be taken from every bucket.
+        
+        Args:
+            requests: Buckets and the tokens wanted from each
+            timeout: Maximum seconds to wait, or None to wait as long as needed
+        
+        Raises:
+            RateLimitExceeded: If the timeout would be exceeded
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        while True:
+            wait = self.try_acquire(requests)
+            if wait <= 0:
+                return
+            if deadline is not None and time.time() + wait > deadline:
+                raise RateLimitExceeded(wait)
+            time.sleep(wait)
+    
+class MemoryRateLimiter(RateLimiter):
+    """Buckets held in this process only"""
+    
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+    
+    def try_acquire(self, requests: List[BucketRequest]) -> float:
+        now = time.time()
+        with self._lock:
+            levels, wait = {}, 0.0
+            for key, amount, capacity, rate in requests:
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                levels[key] = _refill(tokens, updated_at, now, capacity, rate)
+                if levels[key] < amount:
+                    wait = max(wait, (amount - levels[key]) / rate)
+            if wait:
+                return wait
+            for key, amount, _, _ in requests:
+                self._buckets[key] = (levels[key] - amount, now)
+            return 0.0
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    Buckets in a local SQLite database in WAL mode, shared by every worker
+    process on the host.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+    
+    def try_acquire(self, requests: List[BucketRequest]) -> float:
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front, so workers cannot both spend the same tokens
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            levels, wait = {}, 0.0
+            for key, amount, capacity, rate in requests:
+                row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                levels[key] = _refill(tokens, updated_at, now, capacity, rate)
+                if levels[key] < amount:
+                    wait = max(wait, (amount - levels[key]) / rate)
+            if not wait:
+                conn.executemany("INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                                 [(key, levels[key] - amount, now) for key, amount, _, _ in requests])
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+class RedisRateLimiter(RateLimiter):
+    """Buckets in Redis, for workers spread over several hosts"""
+    
+    _PREFIX = "gptcheck:bucket:"
+    
+    # KEYS are the buckets, ARGV is the current time followed by (amount, capacity, rate)
+    # for each bucket. Returns 0 when every bucket was charged, otherwise the wait in seconds.
+    _ACQUIRE_SCRIPT = """
+        local now = tonumber(ARGV[1])
+        local levels = {}
+        local wait = 0
+        for i, key in ipairs(KEYS) do
+            local amount = tonumber(ARGV[i * 3 - 1])
+            local capacity = tonumber(ARGV[i * 3])
+            local rate = tonumber(ARGV[i * 3 + 1])
+            local state = redis.call('HMGET', key, 'tokens', 'updated_at')
+            local tokens = tonumber(state[1]) or capacity
+            local updated_at = tonumber(state[2]) or now
+            local level = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+            levels[i] = level
+            if level < amount then
+                wait = math.max(wait, (amount - level) / rate)
+            end
+        end
+        if wait > 0 then
+            return tostring(wait)
+        end
+        for i, key in ipairs(KEYS) do
+            local capacity = tonumber(ARGV[i * 3])
+            local rate = tonumber(ARGV[i * 3 + 1])
+            redis.call('HSET', key, 'tokens', levels[i] - tonumber(ARGV[i * 3 - 1]), 'updated_at', now)
+            redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+        end
+        return '0'
+    """
+    
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis rate limiter needs the 'redis' package: pip install redis")
+        self._redis = redis.Redis.from_url(url)
+        self._acquire = self._redis.register_script(self._ACQUIRE_SCRIPT)
+    
+    def try_acquire(self, requests: List[BucketRequest]) -> float:
+        keys = [self._PREFIX + key for key, _, _, _ in requests]
+        args = [time.time()]
+        for _, amount, capacity, rate in requests:
+            args.extend([amount, capacity, rate])
+        # The wait is returned as a string because Lua numbers are truncated to integers on the way out
+        return float(self._acquire(keys=keys, args=args))
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """
+    Get the process-wide rate limiter configured by RATE_LIMIT_BACKEND.
+    
+    Supported backends are 'sqlite' (default), 'redis' and 'memory'.
+    
+    Returns:
+        Shared RateLimiter instance
+    """
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            backend = get_setting('RATE_LIMIT_BACKEND', 'sqlite')
+            if backend == 'sqlite':
+                _limiter = SQLiteRateLimiter(get_setting('RATE_LIMIT_PATH', os.path.join('instance', 'ratelimit.db')))
+            elif backend == 'redis':
+                _limiter = RedisRateLimiter(get_setting('REDIS_URL'))
+            elif backend == 'memory':
+                _limiter = MemoryRateLimiter()
+            else:
+                raise ValueError(f"Unknown rate limiter backend: {backend}")
+            logger.info(f"Using {backend} rate limiter")
+        return _limiter
+
+def openai_buckets(api_key: str, model: str, tokens: int) -> List[BucketRequest]:
+    """
+    Build the RPM and TPM bucket requests for one OpenAI call.
+    
+    Args:
+        api_key: OpenAI API key
+        model: Model name
+        tokens: Estimated tokens the call counts against the TPM limit
+    
+    Returns:
+        Bucket requests; empty if both limits are disabled
+    """
+    key_hash = hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]
+    buckets = []
+    rpm = get_setting('OPENAI_RPM_LIMIT', 0)
+    tpm = get_setting('OPENAI_TPM_LIMIT', 0)
+    if rpm:
+        buckets.append((f"openai:rpm:{key_hash}:{model}", 1, rpm, rpm / 60))
+    if tpm:
+        # A call larger than the whole bucket could never run, so it waits for a full bucket instead
+        buckets.append((f"openai:tpm:{key_hash}:{model}", min(tokens, tpm), tpm, tpm / 60))
+    return buckets
+
+def inbound_buckets(identity: str, spec: Optional[str] = None) -> List[BucketRequest]:
+    """
+    Build the bucket requests for one inbound API request.
+    
+    Args:
+        identity: Client identity, e.g. the remote address
+        spec: Limits in the RATELIMIT_DEFAULT format, defaults to RATELIMIT_DEFAULT
+    
+    Returns:
+        Bucket requests, one per configured limit
+    """
+    limits = parse_rate_limits(spec if spec is not None else get_setting('RATELIMIT_DEFAULT'))
+    return [(f"inbound:{identity}:{amount}/{period}", 1, amount, amount / period) for amount, period in limits]
@@ -0,0 +1,402 @@
+import re
+import json
+import html
+import logging
+from typing import List, Dict, Any, Optional, Union
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+REPORT_CATEGORIES = ["Historical Accuracy", "Scientific Accuracy", "Speculative Claims",
+                     "Religious/Mythological References"]
+VERDICTS = ["accurate", "inaccurate", "misleading", "disputed", "speculative", "unverifiable", "mythological"]
+DEFAULT_VERDICT = "unverifiable"
+
+# Bootstrap badge colour for each verdict
+VERDICT_BADGES = {
+    "accurate": "success",
+    "inaccurate": "danger",
+    "misleading": "warning",
+    "disputed": "warning",
+    "speculative": "info",
+    "unverifiable": "secondary",
+    "mythological": "primary"
+}
+
+# JSON schema of the report requested from the model
+REPORT_SCHEMA = {
+    "type": "object",
+    "required": ["summary", "sections"],
+    "properties": {
+        "summary": {"type": "string"},
+        "sections": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["category", "claims"],
+                "properties": {
+                    "category": {"type": "string", "enum": REPORT_CATEGORIES},
+                    "claims": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "required": ["claim", "verdict"],
+                            "properties": {
+                                "claim": {"type": "string"},
+                                "verdict": {"type": "string", "enum": VERDICTS},
+                                "explanation": {"type": "string"},
+                                "timestamp": {"type": "string", "description": "HH:MM:SS where the claim is made"}
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+_CATEGORY_LOOKUP = {category.lower(): category for category in REPORT_CATEGORIES}
+# One alternation, so each line of a free-form summary is matched once against every heading
+_HEADING_PATTERN = re.compile(
+    r"^\s*(?:#{1,6}\s*)?(?:\*\*)?(summary|" + "|".join(re.escape(c.lower()) for c in REPORT_CATEGORIES)
+    + r")(?:\*\*)?\s*:?\s*(?:\*\*)?\s*(.*)$", re.IGNORECASE)
+_MARKDOWN_HEADING_PATTERN = re.compile(r"^\s*#{1,6}\s+(.+?)\s*#*\s*$")
+_BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+_TIMESTAMP_PATTERN = re.compile(r"(?:(\d+):)?(\d{1,2}):(\d{2})")
+
+def format_timestamp(seconds: float) -> str:
+    """
+    Format a transcript offset as H:MM:SS, or M:SS under an hour.
+    
+    Args:
+        seconds: Offset from the start of the video
+    
+    Returns:
+        Formatted timestamp
+    """
+    minutes, secs = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+def parse_timestamp(value: Union[str, int, float, None]) -> Optional[int]:
+    """
+    Parse a timestamp given by the model.
+    
+    Args:
+        value: Seconds, or a string containing H:MM:SS or M:SS
+    
+    Returns:
+        Offset in seconds, or None if the value holds no timestamp
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if value >= 0 else None
+    match = _TIMESTAMP_PATTERN.search(str(value))
+    if not match:
+        return None
+    hours, minutes, secs = match.groups()
+    return int(hours or 0) * 3600 + int(minutes) * 60 + int(secs)
+
+def _claim(value: Any) -> Optional[Dict[str, Any]]:
+    """Normalize one claim; plain strings become unrated claims."""
+    if isinstance(value, dict):
+        text = str(value.get("claim") or value.get("text") or "").strip()
+        verdict = str(value.get("verdict") or "").strip().lower()
+        explanation = str(value.get("explanation") or "").strip()
+        timestamp = parse_timestamp(value.get("timestamp"))
+    else:
+        text, verdict, explanation, timestamp = str(value or "").strip(), "", "", None
+    if not text:
+        return None
+    return {
+        "claim": text,
+        "verdict": verdict if verdict in VERDICT_BADGES else DEFAULT_VERDICT,
+        "explanation": explanation,
+        "timestamp": timestamp
+    }
+
+def normalize_report(data: Dict[str, Any], video_title: str) -> Dict[str, Any]:
+    """
+    Bring a parsed report into the canonical shape.
+    
+    Sections are kept in category order with repeated categories merged.
+    Categories outside REPORT_CATEGORIES and unknown verdicts are kept rather
+    than dropped, under their own name and DEFAULT_VERDICT respectively.
+    
+    Args:
+        data: Report as decoded from the model response
+        video_title: Title of the video
+    
+    Returns:
+        Report with title, summary, sections of claims and notes
+    """
+    sections: Dict[str, List[Dict[str, Any]]] = {}
+    for section in data.get("sections") or []:
+        if not isinstance(section, dict):
+            continue
+        name = str(section.get("category") or section.get("heading") or "Other").strip()
+        category = _CATEGORY_LOOKUP.get(name.lower(), name)
+        claims = section.get("claims") or []
+        if not isinstance(claims, list):
+            claims = [claims]
+        sections.setdefault(category, []).extend(claim for claim in map(_claim, claims) if claim)
+    
+    order = {category: i for i, category in enumerate(REPORT_CATEGORIES)}
+    notes = data.get("notes") or []
+    return {
+        "title": video_title,
+        "summary": str(data.get("summary") or "").strip(),
+        "sections": [{"category": category, "claims": claims}
+                     for category, claims in sorted(sections.items(), key=lambda item: order.get(item[0], len(order)))
+                     if claims],
+        "notes": [str(note) for note in (notes if isinstance(notes, list) else [notes]) if str(note).strip()]
+    }
+
+def report_from_text(text: str, video_title: str) -> Dict[str, Any]:
+    """
+    Build a report from a free-form, heading-structured summary in one pass.
+    
+    Used when the model did not return valid JSON. Lines under a known heading
+    become unrated claims, lines before the first heading or under a Summary
+    heading become the summary, and lines under any other heading are kept as
+    a section of their own.
+    
+    Args:
+        text: Summary text returned by the model
+        video_title: Title of the video
+    
+    Returns:
+        Report in the shape returned by normalize_report
+    """
+    summary, sections, current = [], {}, None
+    for line in text.splitlines():
+        heading = _HEADING_PATTERN.match(line)
+        if heading:
+            name, rest = heading.group(1).lower(), heading.group(2).strip()
+            current = None if name == "summary" else _CATEGORY_LOOKUP[name]
+            line = rest
+        else:
+            other = _MARKDOWN_HEADING_PATTERN.match(line)
+            if other:
+                current, line = other.group(1).strip("*: "), ""
+        
+        line = _BULLET_PATTERN.sub("", line).strip()
+        if not line:
+            continue
+        if current is None:
+            summary.append(line)
+        else:
+            sections.setdefault(current, []).append(line)
+    
+    return normalize_report({
+        "summary": "\n".join(summary),
+        "sections": [{"category": category, "claims": claims} for category, claims in sections.items()]
+    }, video_title)
+
+def _decode_object(text: str) -> Optional[Dict[str, Any]]:
+    """Decode the JSON object in text, tolerating code fences and prose around it."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        try:
+            data = json.loads(text[start:end + 1])
+        except ValueError:
+            return None
+    return data if isinstance(data, dict) else None
+
+def parse_report(text: str, video_title: str) -> Dict[str, Any]:
+    """
+    Parse the model's summary response into a report.
+    
+    Never raises: a response that is not valid JSON is parsed as a free-form
+    summary with report_from_text, so a malformed response still produces a
+    result instead of another model call.
+    
+    Args:
+        text: Summary text returned by the model
+        video_title: Title of the video
+    
+    Returns:
+        Report in the shape returned by normalize_report
+    """
+    data = _decode_object(text)
+    if data is not None and ("sections" in data or "summary" in data):
+        return normalize_report(data, video_title)
+    logger.warning(f"Summary for '{video_title}' is not a JSON report, parsing it as text")
+    return report_from_text(text, video_title)
+
+def _close_json(text: str) -> str:
+    """Close the strings, arrays and objects left open in a truncated JSON document."""
+    stack, in_string, escaped = [], False, False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+    
+    if in_string:
+        text = (text[:-1] if escaped else text) + '"'
+    text = text.rstrip()
+    if text.endswith(":"):
+        text += " null"
+    elif text.endswith(","):
+        text = text[:-1]
+    return text + "".join(reversed(stack))
+
+def parse_partial_report(text: str, video_title: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a JSON report that is still streaming in.
+    
+    The truncated document is closed and decoded; if it ends inside an object
+    key, it is cut back to the last complete member instead.
+    
+    Args:
+        text: Summary text received so far
+        video_title: Title of the video
+    
+    Returns:
+        Report of the complete parts, or None if nothing can be decoded yet
+    """
+    start = text.find("{")
+    if start == -1:
+        return None
+    text = text[start:]
+    end = len(text)
+    for _ in range(4):
+        try:
+            data = json.loads(_close_json(text[:end]))
+        except ValueError:
+            end = max(text.rfind(",", 0, end), text.rfind("{", 0, end - 1), text.rfind("[", 0, end - 1))
+            if end <= 0:
+                return None
+            if text[end] != ",":
+                end += 1
+            continue
+        return normalize_report(data, video_title) if isinstance(data, dict) else None
+    return None
+
+def render_report_html(report: Dict[str, Any], video_id: Optional[str] = None) -> str:
+    """
+    Render a report as HTML in a single pass over its sections and claims.
+    
+    All model text is escaped. Claim timestamps link into the video when its
+    ID is given.
+    
+    Args:
+        report: Report from parse_report
+        video_id: Optional YouTube video ID for timestamp links
+    
+    Returns:
+        HTML-formatted report
+    """
+    escape = html.escape
+    parts = []
+    if report.get("summary"):
+        parts.append(f"<div class='analysis-section'><h2>Summary</h2>"
+                     f"<div class='section-content'>{escape(report['summary'])}</div></div>")
+    
+    for section in report.get("sections", []):
+        parts.append(f"<div class='analysis-section'><h2>{escape(section['category'])}</h2><ul class='claims'>")
+        for claim in section["claims"]:
+            verdict = claim["verdict"]
+            parts.append(f"<li class='claim'><span class='badge text-bg-{VERDICT_BADGES.get(verdict, 'secondary')} "
+                         f"me-2'>{escape(verdict.capitalize())}</span>{escape(claim['claim'])}")
+            if claim.get("timestamp") is not None:
+                label = format_timestamp(claim["timestamp"])
+                if video_id:
+                    parts.append(f" <a class='claim-timestamp' href='https://www.youtube.com/watch?v={escape(video_id)}"
+                                 f"&amp;t={claim['timestamp']}s' target='_blank' rel='noopener'>{label}</a>")
+                else:
+                    parts.append(f" <span class='claim-timestamp'>{label}</span>")
+            if claim.get("explanation"):
+                parts.append(f"<div class='claim-explanation'>{escape(claim['explanation'])}</div>")
+            parts.append("</li>")
+        parts.append("</ul></div>")
+    
+    if report.get("notes"):
+        parts.append("<div class='analysis-section'><h2>Notes</h2><div class='section-content'>")
+        parts.append(escape("\n".join(report["notes"])))
+        parts.append("</div></div>")
+    return "".join(parts)
+
+_MARKDOWN_SPECIAL = re.compile(r"([\\*_~`|>\[\]])")
+
+def render_report_markdown(report: Dict[str, Any], video_id: Optional[str] = None) -> str:
+    """
+    Render a report as chat markdown, e.g. for Discord.
+    
+    Args:
+        report: Report from parse_report
+        video_id: Optional YouTube video ID for timestamp links
+    
+    Returns:
+        Markdown text with one line per claim
+    """
+    def escape(text: str) -> str:
+        return _MARKDOWN_SPECIAL.sub(r"\\\1", text)
+    
+    lines = []
+    if report.get("summary"):
+        lines += ["**Summary**", escape(report["summary"]), ""]
+    
+    for section in report.get("sections", []):
+        lines.append(f"**{escape(section['category'])}**")
+        for claim in section["claims"]:
+            line = f"- **{claim['verdict'].capitalize()}**: {escape(claim['claim'])}"
+            if claim.get("timestamp") is not None:
+                label = format_timestamp(claim["timestamp"])
+                if video_id:
+                    # Angle brackets stop the link from unfurling into a video embed
+                    label = f"[{label}](<https://www.youtube.com/watch?v={video_id}&t={claim['timestamp']}s>)"
+                line += f" ({label})"
+            if claim.get("explanation"):
+                line += f" - {escape(claim['explanation'])}"
+            lines.append(line)
+        lines.append("")
+    
+    if report.get("notes"):
+        lines += ["**Notes**"] + [escape(note) for note in report["notes"]]
+    return "\n".join(lines).strip()
+
+def report_html(result: Any) -> str:
+    """
+    Get the HTML of a task result.
+    
+    Args:
+        result: Analysis record from process_video, or the HTML or message
+            string stored by earlier versions
+    
+    Returns:
+        Rendered HTML
+    """
+    if isinstance(result, dict):
+        return result.get("html") or ""
+    return str(result or "")
+
+def report_data(result: Any) -> Any:
+    """
+    Get the compact, JSON-serializable form of a task result for the API.
+    
+    Args:
+        result: Analysis record from process_video, or the HTML or message
+            string stored by earlier versions
+    
+    Returns:
+        The structured report, or the string result unchanged
+    """
+    if isinstance(result, dict):
+        return result.get("report")
+    return result
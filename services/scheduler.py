@@ -0,0 +1,252 @@
+import time
+import heapq
+import atexit
+import logging
+import itertools
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Callable, List, Set
+from config import get_setting
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class Priority:
+    """Job priority classes, lower values run first"""
+    INTERACTIVE = 0
+    DISCORD = 1
+    API = 2
+    BULK = 3
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+    def __init__(self, queue_depth: int):
+        super().__init__("Analysis queue is full, please try again later")
+        self.queue_depth = queue_depth
+
+class TaskCancelled(Exception):
+    """Raised inside a running task once it has been cancelled"""
+
+class JobScheduler:
+    """
+    Fixed pool of worker threads fed from a bounded priority queue.
+    
+    Jobs with the same priority run in submission order. Submitting to a full
+    queue raises QueueFullError instead of starting more threads.
+    """
+    
+    def __init__(self, workers: int, queue_size: int,
+                 heartbeat: Optional[Callable[[List[str]], None]] = None, heartbeat_interval: float = 60):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.heartbeat_interval = heartbeat_interval
+        
+        self._queue: list = []  # heap of (priority, sequence, job)
+        self._queued: Dict[str, Dict[str, Any]] = {}
+        self._running: Set[str] = set()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._accepting = True
+        self._stopped = False
+        self._active = 0
+        self._completed = 0
+        self._waits = deque(maxlen=100)
+        self._threads = []
+        
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"scheduler-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if heartbeat:
+            threading.Thread(target=self._heartbeat, name="scheduler-heartbeat", daemon=True).start()
+    
+    def submit(self, job_id: str, func: Callable, *args, priority: int = Priority.INTERACTIVE, **kwargs) -> int:
+        """
+        Queue a job.
+        
+        Args:
+            job_id: Unique job ID (the task ID)
+            func: The function to run
+            priority: Priority class, see Priority
+            *args, **kwargs: Arguments to pass to the function
+        
+        Returns:
+            1-based position of the job in the queue
+        
+        Raises:
+            QueueFullError: If the queue is at capacity
+            RuntimeError: If the scheduler is shutting down
+        """
+        with self._condition:
+            if not self._accepting:
+                raise RuntimeError("Scheduler is shutting down")
+            if len(self._queued) >= self.queue_size:
+                raise QueueFullError(len(self._queued))
+            
+            job = {
+                "id": job_id,
+                "sequence": next(self._sequence),
+                "func": func,
+                "args": args,
+                "kwargs": kwargs,
+                "priority": priority,
+                "submitted_at": time.time(),
+                "cancelled": False
+            }
+            heapq.heappush(self._queue, (priority, job["sequence"], job))
+            self._queued[job_id] = job
+            self._condition.notify()
+            return self._position(job)
+    
+    def cancel(self, job_id: str) -> bool:
+        """
+        Remove a queued job. Running jobs are not interrupted.
+        
+        Args:
+            job_id: The job ID
+        
+        Returns:
+            True if the job was still queued and has been cancelled
+        """
+        with self._condition:
+            job = self._queued.pop(job_id, None)
+            if job is None:
+                return False
+            # Left in the heap and skipped when it reaches the front
+            job["cancelled"] = True
+            return True
+    
+    def get_position(self, job_id: str) -> Optional[int]:
+        """
+        Get the 1-based queue position of a job.
+        
+        Args:
+            job_id: The job ID
+        
+        Returns:
+            Queue position, or None if the job is not queued in this process
+        """
+        with self._condition:
+            job = self._queued.get(job_id)
+            return self._position(job) if job else None
+    
+    def _position(self, job: Dict[str, Any]) -> int:
+        """Count the queued jobs that run before this one. Caller holds the lock."""
+        key = (job["priority"], job["sequence"])
+        return 1 + sum(1 for other in self._queued.values() if (other["priority"], other["sequence"]) < key)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get queue depth, worker usage and recent queue wait times.
+        
+        Returns:
+            Dictionary of scheduler statistics
+        """
+        with self._condition:
+            waits = list(self._waits)
+            return {
+                "workers": self.workers,
+                "active_workers": self._active,
+                "queue_depth": len(self._queued),
+                "queue_capacity": self.queue_size,
+                "completed_jobs": self._completed,
+                "accepting": self._accepting,
+                "avg_wait_seconds": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "max_wait_seconds": round(max(waits), 3) if waits else 0.0
+            }
+    
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop accepting jobs and wait for queued and running jobs to finish.
+        
+        Args:
+            timeout: Maximum seconds to wait before giving up on remaining jobs
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            if not self._accepting:
+                return
+            self._accepting = False
+            logger.info(f"Draining scheduler: {len(self._queued)} queued, {self._active} running")
+            while self._queued or self._active:
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    logger.warning(f"Scheduler drain timed out with {len(self._queued)} queued, "
+                                   f"{self._active} running")
+                    break
+                self._condition.wait(remaining)
+            self._stopped = True
+            self._condition.notify_all()
+    
+    def _next_job(self) -> Optional[Dict[str, Any]]:
+        """Block until a job is available. Returns None once the scheduler has stopped."""
+        with self._condition:
+            while True:
+                if self._stopped:
+                    return None
+                while self._queue:
+                    _, _, job = heapq.heappop(self._queue)
+                    if not job["cancelled"]:
+                        del self._queued[job["id"]]
+                        self._active += 1
+                        self._running.add(job["id"])
+                        self._waits.append(time.time() - job["submitted_at"])
+                        return job
+                self._condition.wait()
+    
+    def _worker(self) -> None:
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                job["func"](*job["args"], **job["kwargs"])
+            except Exception as e:
+                logger.error(f"Job {job['id']} raised: {e}")
+            finally:
+                with self._condition:
+                    self._active -= 1
+                    self._running.discard(job["id"])
+                    self._completed += 1
+                    self._condition.notify_all()
+    
+    def _heartbeat(self) -> None:
+        """Periodically report queued and running job IDs so long jobs are not mistaken for lost ones."""
+        while not self._stopped:
+            time.sleep(self.heartbeat_interval)
+            with self._condition:
+                job_ids = list(self._queued) + list(self._running)
+            if job_ids:
+                try:
+                    self.heartbeat(job_ids)
+                except Exception as e:
+                    logger.error(f"Scheduler heartbeat failed: {e}")
+
+_scheduler: Optional[JobScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler(heartbeat: Optional[Callable[[List[str]], None]] = None) -> JobScheduler:
+    """
+    Get the process-wide job scheduler, starting it on first use.
+    
+    Worker threads are started lazily so that each forked gunicorn worker
+    gets its own pool. The scheduler drains on interpreter exit.
+    
+    Args:
+        heartbeat: Callback for queued and running job IDs, only used when the scheduler is created
+    
+    Returns:
+        Shared JobScheduler instance
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = JobScheduler(
+                workers=get_setting('SCHEDULER_WORKERS', 4),
+                queue_size=get_setting('SCHEDULER_QUEUE_SIZE', 100),
+                heartbeat=heartbeat
+            )
+            drain_timeout = get_setting('SCHEDULER_DRAIN_TIMEOUT', 25)
+            atexit.register(_scheduler.shutdown, drain_timeout)
+        return _scheduler
@@ -0,0 +1,420 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, Optional, Iterator, Callable, Tuple, List
+from config import get_setting
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Statuses that are final and may be cleaned up once they are old enough
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+class TaskStore:
+    """
+    Base class for task storage backends.
+
+    Tasks are plain dictionaries with the keys id, type, params, status,
+    created_at, updated_at, progress, message, partial_result, result and error.
+    """
+
+    def create(self, task: Dict[str, Any]) -> None:
+        """Store a new task record."""
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Get a task record, or None if it does not exist."""
+        raise NotImplementedError
+
+    def get_many(self, task_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Get several task records at once, keyed by ID. Missing tasks are left out.
+
+        If fields is given only those fields and the id are read, so large
+        results need not be loaded when only the status is wanted.
+        """
+        tasks = {}
+        for task_id in task_ids:
+            task = self.get(task_id)
+            if task is not None:
+                tasks[task_id] = task if fields is None else {field: task.get(field) for field in ["id", *fields]}
+        return tasks
+
+    def update(self, task_id: str, fields: Dict[str, Any], expected_status: Optional[str] = None) -> bool:
+        """
+        Atomically update fields of an existing task.
+
+        If expected_status is given the update only applies while the task has
+        that status. Returns False if nothing was updated.
+        """
+        raise NotImplementedError
+
+    def get_or_create(self, index_key: str, task: Dict[str, Any],
+                      reusable: Callable[[Dict[str, Any]], bool]) -> Tuple[Dict[str, Any], bool]:
+        """
+        Atomically return the task indexed under index_key, or store and index a new one.
+
+        The indexed task is only returned if reusable(task) is true, otherwise
+        the new task replaces it in the index.
+
+        Returns:
+            Tuple of (task, created)
+        """
+        raise NotImplementedError
+
+    def iter_tasks(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over all stored tasks."""
+        raise NotImplementedError
+
+    def cleanup(self, max_age: float) -> int:
+        """Delete finished tasks last updated more than max_age seconds ago, and their index entries. Returns the number deleted."""
+        raise NotImplementedError
+
+class MemoryTaskStore(TaskStore):
+    """Process-local task store, only suitable for a single worker process."""
+
+    def __init__(self):
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._index: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def create(self, task: Dict[str, Any]) -> None:
+        with self._lock:
+            self._tasks[task["id"]] = dict(task)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return dict(task) if task else None
+
+    def update(self, task_id: str, fields: Dict[str, Any], expected_status: Optional[str] = None) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or (expected_status is not None and task["status"] != expected_status):
+                return False
+            task.update(fields)
+            return True
+
+    def get_or_create(self, index_key: str, task: Dict[str, Any],
+                      reusable: Callable[[Dict[str, Any]], bool]) -> Tuple[Dict[str, Any], bool]:
+        with self._lock:
+            existing = self._tasks.get(self._index.get(index_key))
+            if existing is not None and reusable(existing):
+                return dict(existing), False
+            self._tasks[task["id"]] = dict(task)
+            self._index[index_key] = task["id"]
+            return dict(task), True
+
+    def iter_tasks(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            tasks = [dict(task) for task in self._tasks.values()]
+        return iter(tasks)
+
+    def cleanup(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with self._lock:
+            expired = [task_id for task_id, task in self._tasks.items()
+                       if task["status"] in FINISHED_STATUSES and task["updated_at"] < cutoff]
+            for task_id in expired:
+                del self._tasks[task_id]
+            self._index = {key: task_id for key, task_id in self._index.items() if task_id in self._tasks}
+        return len(expired)
+
+class SQLiteTaskStore(TaskStore):
+    """
+    Task store backed by a local SQLite database in WAL mode.
+
+    Needs no server and is shared by every worker process on the host, so a
+    poll can be served by a different gunicorn worker than the one running
+    the task.
+    """
+
+    _COLUMNS = ("id", "type", "params", "status", "created_at", "updated_at", "progress", "message", "partial_result",
+                "result", "error")
+    _JSON_COLUMNS = ("params", "result")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    params TEXT,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    progress INTEGER DEFAULT 0,
+                    message TEXT,
+                    partial_result TEXT,
+                    result TEXT,
+                    error TEXT
+                )
+            """)
+            # Databases created before these columns existed
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+            for column in ("message", "partial_result"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE tasks ADD COLUMN {column} TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks (status, updated_at)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS task_index (
+                    index_key TEXT PRIMARY KEY,
+                    task_id TEXT NOT NULL
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _encode(self, column: str, value: Any) -> Any:
+        return json.dumps(value) if column in self._JSON_COLUMNS and value is not None else value
+
+    def _decode_row(self, row: tuple, columns: Tuple[str, ...] = _COLUMNS) -> Dict[str, Any]:
+        task = dict(zip(columns, row))
+        for column in self._JSON_COLUMNS:
+            if task.get(column) is not None:
+                task[column] = json.loads(task[column])
+        return task
+
+    def create(self, task: Dict[str, Any]) -> None:
+        values = [self._encode(column, task.get(column)) for column in self._COLUMNS]
+        with self._connect() as conn:
+            conn.execute(f"INSERT INTO tasks ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                         values)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connect().execute(f"SELECT {', '.join(self._COLUMNS)} FROM tasks WHERE id = ?",
+                                      (task_id,)).fetchone()
+        return self._decode_row(row) if row else None
+
+    def get_many(self, task_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        columns = self._COLUMNS if fields is None else \
+            ("id", *(column for column in fields if column in self._COLUMNS and column != "id"))
+        tasks = {}
+        conn = self._connect()
+        # Stay well below SQLite's limit on bound parameters
+        for start in range(0, len(task_ids), 500):
+            chunk = task_ids[start:start + 500]
+            rows = conn.execute(f"SELECT {', '.join(columns)} FROM tasks WHERE id IN ({', '.join('?' * len(chunk))})",
+                                chunk).fetchall()
+            for row in rows:
+                task = self._decode_row(row, columns)
+                tasks[task["id"]] = task
+        return tasks
+
+    def update(self, task_id: str, fields: Dict[str, Any], expected_status: Optional[str] = None) -> bool:
+        columns = [column for column in fields if column in self._COLUMNS and column != "id"]
+        if not columns:
+            return self.get(task_id) is not None
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        values = [self._encode(column, fields[column]) for column in columns] + [task_id]
+        query = f"UPDATE tasks SET {assignments} WHERE id = ?"
+        if expected_status is not None:
+            query += " AND status = ?"
+            values.append(expected_status)
+        with self._connect() as conn:
+            cursor = conn.execute(query, values)
+        return cursor.rowcount > 0
+
+    def get_or_create(self, index_key: str, task: Dict[str, Any],
+                      reusable: Callable[[Dict[str, Any]], bool]) -> Tuple[Dict[str, Any], bool]:
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock up front, so concurrent submits serialize here
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT {', '.join('t.' + column for column in self._COLUMNS)} FROM task_index i "
+                "JOIN tasks t ON t.id = i.task_id WHERE i.index_key = ?", (index_key,)).fetchone()
+            if row is not None:
+                existing = self._decode_row(row)
+                if reusable(existing):
+                    conn.execute("COMMIT")
+                    return existing, False
+
+            values = [self._encode(column, task.get(column)) for column in self._COLUMNS]
+            conn.execute(f"INSERT INTO tasks ({', '.join(self._COLUMNS)}) VALUES ({', '.join('?' * len(self._COLUMNS))})",
+                         values)
+            conn.execute("INSERT OR REPLACE INTO task_index (index_key, task_id) VALUES (?, ?)", (index_key, task["id"]))
+            conn.execute("COMMIT")
+            return dict(task), True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def iter_tasks(self) -> Iterator[Dict[str, Any]]:
+        rows = self._connect().execute(f"SELECT {', '.join(self._COLUMNS)} FROM tasks").fetchall()
+        return (self._decode_row(row) for row in rows)
+
+    def cleanup(self, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM tasks WHERE status IN ({', '.join('?' * len(FINISHED_STATUSES))}) AND updated_at < ?",
+                FINISHED_STATUSES + (cutoff,))
+            conn.execute("DELETE FROM task_index WHERE task_id NOT IN (SELECT id FROM tasks)")
+        return cursor.rowcount
+
+class RedisTaskStore(TaskStore):
+    """
+    Task store backed by Redis hashes, for workers spread over several hosts.
+
+    Finished tasks get a key expiry instead of needing periodic cleanup.
+    """
+
+    _PREFIX = "gptcheck:task:"
+    _INDEX_PREFIX = "gptcheck:task-index:"
+    _JSON_FIELDS = ("params", "result")
+    _FLOAT_FIELDS = ("created_at", "updated_at")
+    _INT_FIELDS = ("progress",)
+
+    # Only update tasks that still exist (and have the expected status, if one is given),
+    # so a late progress report cannot resurrect a deleted task
+    _UPDATE_SCRIPT = """
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            return 0
+        end
+        if ARGV[2] ~= '' and redis.call('HGET', KEYS[1], 'status') ~= ARGV[2] then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+        if ARGV[1] ~= '' then
+            redis.call('EXPIRE', KEYS[1], ARGV[1])
+        end
+        return 1
+    """
+
+    def __init__(self, url: str, retention: int):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("The redis task store needs the 'redis' package: pip install redis")
+        self._watch_error = redis.WatchError
+        self.retention = retention
+        self._redis = redis.Redis.from_url(url)
+        self._update = self._redis.register_script(self._UPDATE_SCRIPT)
+
+    def _encode(self, fields: Dict[str, Any]) -> Dict[str, str]:
+        encoded = {}
+        for field, value in fields.items():
+            encoded[field] = json.dumps(value) if field in self._JSON_FIELDS else ("" if value is None else str(value))
+        return encoded
+
+    def _decode(self, data: Dict[bytes, bytes]) -> Dict[str, Any]:
+        task = {}
+        for field, value in data.items():
+            field, value = field.decode(), value.decode()
+            if field in self._JSON_FIELDS:
+                task[field] = json.loads(value)
+            elif field in self._FLOAT_FIELDS:
+                task[field] = float(value)
+            elif field in self._INT_FIELDS:
+                task[field] = int(value)
+            else:
+                task[field] = value or None
+        return task
+
+    def create(self, task: Dict[str, Any]) -> None:
+        self._redis.hset(self._PREFIX + task["id"], mapping=self._encode(task))
+        if task.get("status") in FINISHED_STATUSES:
+            self._redis.expire(self._PREFIX + task["id"], self.retention)
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        data = self._redis.hgetall(self._PREFIX + task_id)
+        return self._decode(data) if data else None
+
+    def get_many(self, task_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        if fields is not None:
+            fields = ["id", *(field for field in fields if field != "id")]
+        with self._redis.pipeline(transaction=False) as pipe:
+            for task_id in task_ids:
+                if fields is None:
+                    pipe.hgetall(self._PREFIX + task_id)
+                else:
+                    pipe.hmget(self._PREFIX + task_id, fields)
+            results = pipe.execute()
+        if fields is not None:
+            # HMGET gives a list of values, None for fields the hash lacks
+            results = [{field.encode(): value for field, value in zip(fields, values) if value is not None}
+                       for values in results]
+        return {task_id: self._decode(data) for task_id, data in zip(task_ids, results) if data}
+
+    def update(self, task_id: str, fields: Dict[str, Any], expected_status: Optional[str] = None) -> bool:
+        expire = str(self.retention) if fields.get("status") in FINISHED_STATUSES else ""
+        args = [expire, expected_status or ""]
+        for field, value in self._encode(fields).items():
+            args.extend([field, value])
+        return bool(self._update(keys=[self._PREFIX + task_id], args=args))
+
+    def get_or_create(self, index_key: str, task: Dict[str, Any],
+                      reusable: Callable[[Dict[str, Any]], bool]) -> Tuple[Dict[str, Any], bool]:
+        key = self._INDEX_PREFIX + index_key
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    # Optimistic transaction: retried if another worker changes the index entry meanwhile
+                    pipe.watch(key)
+                    task_id = pipe.get(key)
+                    if task_id is not None:
+                        data = pipe.hgetall(self._PREFIX + task_id.decode())
+                        if data and reusable(self._decode(data)):
+                            pipe.unwatch()
+                            return self._decode(data), False
+                    pipe.multi()
+                    pipe.hset(self._PREFIX + task["id"], mapping=self._encode(task))
+                    pipe.set(key, task["id"], ex=self.retention)
+                    pipe.execute()
+                    return dict(task), True
+                except self._watch_error:
+                    continue
+
+    def iter_tasks(self) -> Iterator[Dict[str, Any]]:
+        for key in self._redis.scan_iter(match=self._PREFIX + "*"):
+            data = self._redis.hgetall(key)
+            if data:
+                yield self._decode(data)
+
+    def cleanup(self, max_age: float) -> int:
+        # Finished tasks expire on their own
+        return 0
+
+_store: Optional[TaskStore] = None
+_store_lock = threading.Lock()
+
+def get_task_store() -> TaskStore:
+    """
+    Get the process-wide task store configured by TASK_STORE_BACKEND.
+
+    Supported backends are 'sqlite' (default), 'redis' and 'memory'.
+
+    Returns:
+        Shared TaskStore instance
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            backend = get_setting('TASK_STORE_BACKEND', 'sqlite')
+            if backend == 'sqlite':
+                _store = SQLiteTaskStore(get_setting('TASK_STORE_PATH', os.path.join('instance', 'tasks.db')))
+            elif backend == 'redis':
+                _store = RedisTaskStore(get_setting('REDIS_URL'), get_setting('TASK_RETENTION_SECONDS', 7 * 24 * 3600))
+            elif backend == 'memory':
+                _store = MemoryTaskStore()
+            else:
+                raise ValueError(f"Unknown task store backend: {backend}")
+            logger.info(f"Using {backend} task store")
+        return _store
@@ -4,22 +4,43 @@ import logging
 import time
 import os
 import json
-from flask import current_app
+from flask import current_app, has_app_context
 import hashlib
-from typing import Dict, Any, Optional
+import uuid
+from typing import Dict, Any, Optional, Callable, List
+from config import get_setting
+from .task_store import get_task_store
+from .scheduler import get_scheduler, JobScheduler, Priority, TaskCancelled
+from .cache import make_cache_key
+from .metrics import task_spans, register_collector
+from .youtube import get_video_id
+from .analysis import SECTION_PROMPT_VERSION, SUMMARY_PROMPT_VERSION
+from .models import models_key
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# In-memory task storage
-tasks = {}
+# Time of the last cleanup of old finished tasks in this process
+_last_cleanup = 0.0
+
+# Wakes up progress streams when a task in this process is updated
+_task_updated = threading.Condition()
+
+def _notify_task_updated() -> None:
+    with _task_updated:
+        _task_updated.notify_all()
 
 class TaskStatus:
     """Task status constants"""
     PENDING = "pending"
+    QUEUED = "queued"
     PROCESSING = "processing"
     COMPLETED = "completed"
     FAILED = "failed"
+    CANCELLED = "cancelled"
+
+# Statuses of tasks that are still waiting or running
+ACTIVE_STATUSES = [TaskStatus.PENDING, TaskStatus.QUEUED, TaskStatus.PROCESSING]
 
 def get_task_status(task_id: str) -> Dict[str, Any]:
     """
@@ -31,41 +52,115 @@ def get_task_status(task_id: str) -> Dict[str, Any]:
     Returns:
         Dictionary with task status information
     """
-    if task_id in tasks:
-        return tasks[task_id]
-    return {"status": "not_found", "error": "Task not found"}
+    task = get_task_store().get(task_id)
+    if task is None:
+        return {"status": "not_found", "error": "Task not found"}
+    
+    # A task that stopped reporting was lost with its worker (e.g. on restart)
+    if _is_stale(task):
+        logger.warning(f"Task {task_id} stopped reporting progress, marking it failed")
+        update_task_status(task_id, TaskStatus.FAILED, error="Task was interrupted, please try again",
+                           expected_status=task['status'])
+        task = get_task_store().get(task_id) or task
+    return task
+
+def get_task_statuses(task_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the status of several tasks with one task store read.
+    
+    Args:
+        task_ids: IDs of the tasks
+        fields: Optional task fields to read instead of whole tasks; status and updated_at are always read
+        
+    Returns:
+        Dictionary mapping task IDs to task status information; missing tasks are left out
+    """
+    if fields is not None:
+        fields = list(dict.fromkeys([*fields, 'status', 'updated_at']))
+    tasks = get_task_store().get_many(task_ids, fields)
+    for task_id, task in tasks.items():
+        if _is_stale(task):
+            tasks[task_id] = get_task_status(task_id)
+    return tasks
+
+def touch_pending_tasks(task_ids: List[str]) -> None:
+    """
+    Refresh tasks that are waiting to be queued so the wait is not mistaken for a lost task.
+    
+    Args:
+        task_ids: IDs of the pending tasks
+    """
+    now = time.time()
+    for task_id in task_ids:
+        get_task_store().update(task_id, {"updated_at": now}, expected_status=TaskStatus.PENDING)
 
-def create_task(task_type: str, params: Dict[str, Any]) -> str:
+def _is_stale(task: Dict[str, Any]) -> bool:
+    """
+    Check whether an unfinished task has gone without updates for too long.
+    
+    Args:
+        task: Task record
+        
+    Returns:
+        True if the task should be treated as lost
+    """
+    return (task['status'] in ACTIVE_STATUSES and
+            time.time() - task['updated_at'] > get_setting('TASK_STALE_SECONDS', 900))
+
+def _maybe_cleanup_tasks() -> None:
+    """
+    Delete old finished tasks, at most once per TASK_CLEANUP_INTERVAL in this process.
+    """
+    global _last_cleanup
+    now = time.time()
+    if now - _last_cleanup < get_setting('TASK_CLEANUP_INTERVAL', 3600):
+        return
+    _last_cleanup = now
+    try:
+        removed = get_task_store().cleanup(get_setting('TASK_RETENTION_SECONDS', 7 * 24 * 3600))
+        if removed:
+            logger.info(f"Cleaned up {removed} old tasks")
+    except Exception as e:
+        logger.error(f"Error cleaning up old tasks: {e}")
+
+def create_task(task_type: str, params: Dict[str, Any], status: str = TaskStatus.PENDING) -> str:
     """
     Create a new task and return its ID.
     
     Args:
         task_type: Type of task (e.g., 'video_analysis')
         params: Parameters for the task
+        status: Initial status; records that never run are created as completed
         
     Returns:
         Task ID
     """
-    # Generate a unique task ID
-    task_id = hashlib.md5(f"{task_type}_{time.time()}_{params}".encode('utf-8')).hexdigest()
+    _maybe_cleanup_tasks()
+    
+    # Generate a unique task ID, unique across worker processes
+    task_id = uuid.uuid4().hex
     
     # Create task record
-    tasks[task_id] = {
+    now = time.time()
+    get_task_store().create({
         "id": task_id,
         "type": task_type,
         "params": params,
-        "status": TaskStatus.PENDING,
-        "created_at": time.time(),
-        "updated_at": time.time(),
+        "status": status,
+        "created_at": now,
+        "updated_at": now,
         "progress": 0,
+        "message": None,
+        "partial_result": None,
         "result": None,
         "error": None
-    }
+    })
     
     return task_id
 
 def update_task_status(task_id: str, status: str, progress: int = None, 
-                      result: Any = None, error: str = None) -> None:
+                      result: Any = None, error: str = None, message: str = None,
+                      expected_status: str = None) -> None:
     """
     Update the status of a task.
     
@@ -75,70 +170,271 @@ def update_task_status(task_id: str, status: str, progress: int = None,
         progress: Optional progress percentage (0-100)
         result: Optional task result
         error: Optional error message
+        message: Optional progress message
+        expected_status: Only update the task while it has this status
     """
-    if task_id in tasks:
-        if progress is not None:
-            tasks[task_id]["progress"] = progress
-        
-        if result is not None:
-            tasks[task_id]["result"] = result
-            
-        if error is not None:
-            tasks[task_id]["error"] = error
-            
-        tasks[task_id]["status"] = status
-        tasks[task_id]["updated_at"] = time.time()
+    fields = {"status": status, "updated_at": time.time()}
+    if progress is not None:
+        fields["progress"] = progress
+    
+    if message is not None:
+        fields["message"] = message
+    
+    if result is not None:
+        fields["result"] = result
         
+    if error is not None:
+        fields["error"] = error
+    
+    # All fields are written in one atomic store update
+    if get_task_store().update(task_id, fields, expected_status=expected_status):
+        _notify_task_updated()
         logger.info(f"Task {task_id} updated: status={status}, progress={progress}")
 
-def run_task_in_thread(task_id: str, func, *args, **kwargs):
+def task_progress_callback(task_id: str) -> Callable[..., None]:
+    """
+    Build a progress callback that records progress on a processing task.
+    
+    The callback raises TaskCancelled once the task has been cancelled, which
+    stops the analysis at its next progress report.
+    
+    Args:
+        task_id: The ID of the task
+        
+    Returns:
+        Callback receiving a progress percentage (0-100) and an optional message
+    """
+    def report_progress(progress: int, message: Optional[str] = None) -> None:
+        fields = {"progress": progress, "updated_at": time.time()}
+        if message is not None:
+            fields["message"] = message
+        if not get_task_store().update(task_id, fields, expected_status=TaskStatus.PROCESSING):
+            raise TaskCancelled(task_id)
+        _notify_task_updated()
+        logger.info(f"Task {task_id} updated: status={TaskStatus.PROCESSING}, progress={progress}")
+    
+    return report_progress
+
+def task_partial_callback(task_id: str) -> Callable[[str], None]:
+    """
+    Build a callback that records the partial result of a processing task.
+    
+    Args:
+        task_id: The ID of the task
+        
+    Returns:
+        Callback receiving the partial HTML result
+    """
+    def report_partial(partial_result: str) -> None:
+        if not get_task_store().update(task_id, {"partial_result": partial_result, "updated_at": time.time()},
+                                       expected_status=TaskStatus.PROCESSING):
+            raise TaskCancelled(task_id)
+        _notify_task_updated()
+    
+    return report_partial
+
+def _touch_scheduled_tasks(task_ids: List[str]) -> None:
+    """
+    Refresh queued and running tasks so a long queue wait, or a long analysis
+    that reports no progress, is not mistaken for a lost task.
+    
+    Args:
+        task_ids: IDs of the tasks queued or running in this process
+    """
+    now = time.time()
+    for task_id, task in get_task_store().get_many(task_ids).items():
+        if task['status'] in ACTIVE_STATUSES:
+            get_task_store().update(task_id, {"updated_at": now}, expected_status=task['status'])
+
+def _get_scheduler() -> JobScheduler:
+    """Get the process-wide scheduler with the task heartbeat attached."""
+    return get_scheduler(heartbeat=_touch_scheduled_tasks)
+
+def get_scheduler_stats() -> Dict[str, Any]:
+    """
+    Get queue depth, active workers and wait times of this process's scheduler.
+    
+    Returns:
+        Dictionary of scheduler statistics
+    """
+    return _get_scheduler().get_stats()
+
+def _collect_scheduler_stat(name: str) -> Callable[[], Dict[tuple, float]]:
+    return lambda: {(): get_scheduler_stats()[name]}
+
+register_collector("gptcheck_scheduler_queue_depth", "Jobs waiting in this process's scheduler queue", (),
+                   _collect_scheduler_stat("queue_depth"))
+register_collector("gptcheck_scheduler_active_workers", "Scheduler workers running a job", (),
+                   _collect_scheduler_stat("active_workers"))
+register_collector("gptcheck_scheduler_workers", "Scheduler worker threads", (),
+                   _collect_scheduler_stat("workers"))
+register_collector("gptcheck_scheduler_completed_jobs_total", "Jobs finished by the scheduler", (),
+                   _collect_scheduler_stat("completed_jobs"), metric_type="counter")
+
+def enqueue_task(task_id: str, func, *args, priority: int = Priority.INTERACTIVE, **kwargs) -> Optional[int]:
     """
-    Run a task in a separate thread.
+    Queue a pending task on the job scheduler.
+    
+    Only the caller that moves the task from pending to queued submits it, so a
+    task submitted concurrently by several requests runs once.
     
     Args:
         task_id: The ID of the task
         func: The function to run
+        priority: Priority class, see services.scheduler.Priority
         *args, **kwargs: Arguments to pass to the function
+        
+    Returns:
+        1-based queue position, or None if the task was already queued or running
+        
+    Raises:
+        QueueFullError: If the scheduler queue is full; the task stays pending
     """
+    if not get_task_store().update(task_id, {"status": TaskStatus.QUEUED, "updated_at": time.time()},
+                                   expected_status=TaskStatus.PENDING):
+        logger.info(f"Task {task_id} is already queued or running")
+        return None
+    
+    # Carry the Flask app into the worker thread so services see its config
+    app = current_app._get_current_object() if has_app_context() else None
+    
     def task_wrapper():
-        # Update status to processing
-        update_task_status(task_id, TaskStatus.PROCESSING, progress=0)
+        if app is not None:
+            with app.app_context():
+                run_task()
+        else:
+            run_task()
+    
+    def run_task():
+        # A task cancelled while queued is no longer in the queued state
+        if not get_task_store().update(task_id, {"status": TaskStatus.PROCESSING, "progress": 0,
+                                                 "updated_at": time.time()},
+                                       expected_status=TaskStatus.QUEUED):
+            logger.info(f"Task {task_id} was cancelled before it started")
+            return
+        _notify_task_updated()
         
-        try:
-            # Run the task
-            result = func(*args, **kwargs)
-            
-            # Update status to completed
-            update_task_status(task_id, TaskStatus.COMPLETED, progress=100, result=result)
-            
-            # Cache the result if caching is enabled
-            if current_app and 'CACHE_DIR' in current_app.config:
-                cache_dir = current_app.config['CACHE_DIR']
-                os.makedirs(cache_dir, exist_ok=True)
+        task = get_task_store().get(task_id) or {}
+        with task_spans(task_id, task.get("type", "unknown")) as trace:
+            try:
+                # Run the task
+                result = func(*args, **kwargs)
+                
+                # Update status to completed, unless the task was cancelled meanwhile
+                update_task_status(task_id, TaskStatus.COMPLETED, progress=100, result=result,
+                                   expected_status=TaskStatus.PROCESSING)
+                trace["status"] = TaskStatus.COMPLETED
                 
-                cache_file = os.path.join(cache_dir, f"{task_id}.json")
-                with open(cache_file, 'w') as f:
-                    json.dump({
-                        "task_id": task_id,
-                        "result": result,
-                        "completed_at": time.time()
-                    }, f)
-            
-        except Exception as e:
-            logger.error(f"Task {task_id} failed: {str(e)}")
-            update_task_status(task_id, TaskStatus.FAILED, error=str(e))
-    
-    # Start the thread
-    thread = threading.Thread(target=task_wrapper)
-    thread.daemon = True
-    thread.start()
+            except TaskCancelled:
+                logger.info(f"Task {task_id} stopped after cancellation")
+                trace["status"] = TaskStatus.CANCELLED
+            except Exception as e:
+                logger.error(f"Task {task_id} failed: {str(e)}")
+                update_task_status(task_id, TaskStatus.FAILED, error=str(e), expected_status=TaskStatus.PROCESSING)
     
-    return task_id
+    try:
+        return _get_scheduler().submit(task_id, task_wrapper, priority=priority)
+    except Exception:
+        # Hand the task back so a later submit can queue it
+        get_task_store().update(task_id, {"status": TaskStatus.PENDING, "updated_at": time.time()},
+                                expected_status=TaskStatus.QUEUED)
+        raise
+
+def get_queue_position(task_id: str) -> Optional[int]:
+    """
+    Get the queue position of a task queued in this process.
+    
+    Args:
+        task_id: The ID of the task
+        
+    Returns:
+        1-based queue position, or None if unknown
+    """
+    return _get_scheduler().get_position(task_id)
+
+def wait_for_task_update(task_id: str, last_updated_at: Optional[float], timeout: float) -> Dict[str, Any]:
+    """
+    Wait until a task changes, then return its status.
+    
+    Updates made in this process wake the waiter immediately; updates from
+    other worker processes are picked up by re-reading the task store every
+    TASK_EVENTS_POLL_INTERVAL seconds.
+    
+    Args:
+        task_id: The ID of the task
+        last_updated_at: updated_at of the last status the caller has seen
+        timeout: Maximum seconds to wait
+        
+    Returns:
+        Dictionary with task status information, possibly unchanged after the timeout
+    """
+    deadline = time.time() + timeout
+    poll_interval = get_setting('TASK_EVENTS_POLL_INTERVAL', 1.0)
+    while True:
+        task = get_task_status(task_id)
+        remaining = deadline - time.time()
+        if task['status'] == 'not_found' or task.get('updated_at') != last_updated_at or remaining <= 0:
+            return task
+        with _task_updated:
+            _task_updated.wait(min(poll_interval, remaining))
+
+def _key_hash(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+def cancel_task(task_id: str, api_key: str) -> bool:
+    """
+    Cancel a task that is still waiting or running.
+    
+    The status change goes through the task store, so any worker process can
+    cancel a task. Running tasks stop at their next progress report. Tasks are
+    shared by everyone analyzing the same video, so only the API key that
+    created the task may cancel it.
+    
+    Args:
+        task_id: The ID of the task
+        api_key: API key of the caller
+        
+    Returns:
+        True if the task was cancelled, False if it had already finished
+    
+    Raises:
+        PermissionError: If the task was not created with this API key
+    """
+    task = get_task_store().get(task_id)
+    if task is None:
+        return False
+    if (task.get('params') or {}).get('key_hash') != _key_hash(api_key):
+        raise PermissionError("API key does not match the task")
+    for status in ACTIVE_STATUSES:
+        if get_task_store().update(task_id, {"status": TaskStatus.CANCELLED, "updated_at": time.time()},
+                                   expected_status=status):
+            _get_scheduler().cancel(task_id)
+            _notify_task_updated()
+            logger.info(f"Task {task_id} cancelled while {status}")
+            return True
+    return False
+
+def video_analysis_index_key(video_id: str) -> str:
+    """
+    Build the deduplication key for analyses of a video with the current settings.
+    
+    Args:
+        video_id: YouTube video ID
+        
+    Returns:
+        Index key shared by every submission of the same video and settings
+    """
+    return make_cache_key('video_analysis', video_id, models_key(),
+                          SECTION_PROMPT_VERSION, SUMMARY_PROMPT_VERSION)
 
 def get_or_create_video_analysis_task(video_url: str, api_key: str) -> str:
     """
     Get an existing task for a video analysis or create a new one.
     
+    Submissions are matched on the normalized video ID, so different URL forms
+    of the same video share one task. The lookup and creation happen atomically
+    in the task store, so concurrent submits of the same video coalesce.
+    
     Args:
         video_url: YouTube video URL
         api_key: OpenAI API key
@@ -146,15 +442,38 @@ def get_or_create_video_analysis_task(video_url: str, api_key: str) -> str:
     Returns:
         Task ID
     """
-    # Check if there's an existing task for this video
-    for task_id, task in tasks.items():
-        if (task['type'] == 'video_analysis' and 
-            task['params'].get('youtube_url') == video_url and
-            task['status'] in [TaskStatus.PENDING, TaskStatus.PROCESSING, TaskStatus.COMPLETED]):
-            return task_id
-    
-    # Create a new task
-    return create_task('video_analysis', {
-        'youtube_url': video_url,
-        'api_key': api_key[:10] + '...'  # Store partial API key for reference
-    }) 
\ No newline at end of file
+    video_id = get_video_id(video_url)
+    if video_id is None:
+        raise ValueError("Could not extract a video ID from the URL")
+    
+    def reusable(task: Dict[str, Any]) -> bool:
+        # Failed and lost tasks are replaced so the video can be analyzed again, and so are
+        # completed ones whose result is an error message rather than a report
+        if task['status'] == TaskStatus.COMPLETED:
+            return isinstance(task.get('result'), dict)
+        return task['status'] in ACTIVE_STATUSES and not _is_stale(task)
+    
+    _maybe_cleanup_tasks()
+    now = time.time()
+    task, created = get_task_store().get_or_create(video_analysis_index_key(video_id), {
+        "id": uuid.uuid4().hex,
+        "type": 'video_analysis',
+        "params": {
+            'youtube_url': video_url,
+            'video_id': video_id,
+            'api_key': api_key[:10] + '...',  # Store partial API key for reference
+            'key_hash': _key_hash(api_key)
+        },
+        "status": TaskStatus.PENDING,
+        "created_at": now,
+        "updated_at": now,
+        "progress": 0,
+        "message": None,
+        "partial_result": None,
+        "result": None,
+        "error": None
+    }, reusable)
+    
+    if not created:
+        logger.info(f"Reusing task {task['id']} for video {video_id}")
+    return task['id']
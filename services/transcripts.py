@@ -0,0 +1,245 @@
+import os
+import mmap
+import time
+import struct
+import hashlib
+import logging
+import threading
+from array import array
+from typing import Dict, Any, Optional, Iterator, Iterable
+from config import get_setting
+from .cache import directory_bytes, prune_directory
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# File layout: header, then byte offsets (uint32 x count+1), character offsets
+# (uint32 x count+1), start times (float64 x count), durations (float64 x count)
+# and finally the caption texts as one UTF-8 blob joined with single spaces.
+_MAGIC = b"GPTT"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHxxII")  # magic, version, segment count, text blob size
+
+class Transcript:
+    """
+    Columnar, read-only transcript.
+    
+    Caption texts live in one UTF-8 blob joined with single spaces, indexed by
+    offset arrays, so the text of any run of consecutive captions is a single
+    slice. Transcripts loaded from the store are memory-mapped rather than
+    read into Python objects.
+    """
+    
+    def __init__(self, blob, byte_offsets, char_offsets, starts, durations):
+        self._blob = blob
+        self._byte_offsets = byte_offsets
+        self._char_offsets = char_offsets
+        self.starts = starts
+        self.durations = durations
+    
+    @classmethod
+    def from_segments(cls, segments: Iterable[Dict[str, Any]]) -> "Transcript":
+        """
+        Build a transcript from youtube_transcript_api style segment dictionaries.
+        
+        Args:
+            segments: Dictionaries with text, start and duration keys
+        
+        Returns:
+            Transcript
+        """
+        byte_offsets, char_offsets = array('I', [0]), array('I', [0])
+        starts, durations = array('d'), array('d')
+        parts = []
+        for segment in segments:
+            text = segment['text']
+            encoded = text.encode('utf-8')
+            parts.append(encoded)
+            # Each caption is followed by the joining space, so offsets[i + 1] - 1 ends caption i
+            byte_offsets.append(byte_offsets[-1] + len(encoded) + 1)
+            char_offsets.append(char_offsets[-1] + len(text) + 1)
+            starts.append(segment['start'])
+            durations.append(segment['duration'])
+        return cls(b" ".join(parts), byte_offsets, char_offsets, starts, durations)
+    
+    def __len__(self) -> int:
+        return len(self.starts)
+    
+    def text(self, index: int) -> str:
+        """Get the text of one caption."""
+        return self.text_range(index, index + 1)
+    
+    def text_range(self, first: int, last: int) -> str:
+        """
+        Get the captions first..last-1 joined with spaces.
+        
+        Args:
+            first: Index of the first caption
+            last: Index after the last caption
+        
+        Returns:
+            Joined caption text
+        """
+        if first >= last:
+            return ""
+        return bytes(self._blob[self._byte_offsets[first]:self._byte_offsets[last] - 1]).decode('utf-8')
+    
+    def text_length(self, index: int) -> int:
+        """Get the length in characters of one caption without decoding it."""
+        return self._char_offsets[index + 1] - self._char_offsets[index] - 1
+    
+    def content_hash(self) -> str:
+        """Hash of the caption texts, for cache keys."""
+        return hashlib.sha256(self._blob).hexdigest()
+    
+    def __getitem__(self, index: int) -> Dict[str, Any]:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return {'text': self.text(index), 'start': self.starts[index], 'duration': self.durations[index]}
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        # Compatibility with code expecting a list of segment dictionaries
+        for index in range(len(self)):
+            yield self[index]
+    
+    def to_bytes(self) -> bytes:
+        """Serialize to the on-disk format."""
+        return b"".join([
+            _HEADER.pack(_MAGIC, _VERSION, len(self), len(self._blob)),
+            array('I', self._byte_offsets).tobytes(),
+            array('I', self._char_offsets).tobytes(),
+            array('d', self.starts).tobytes(),
+            array('d', self.durations).tobytes(),
+            bytes(self._blob)
+        ])
+    
+    @classmethod
+    def from_buffer(cls, buffer) -> "Transcript":
+        """
+        Load a transcript from a buffer in the on-disk format without copying it.
+        
+        Args:
+            buffer: bytes, mmap or other object supporting the buffer protocol
+        
+        Returns:
+            Transcript viewing the buffer
+        """
+        view = memoryview(buffer)
+        magic, version, count, blob_size = _HEADER.unpack_from(view)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a transcript file")
+        
+        position = _HEADER.size
+        byte_offsets = view[position:position + 4 * (count + 1)].cast('I')
+        position += 4 * (count + 1)
+        char_offsets = view[position:position + 4 * (count + 1)].cast('I')
+        position += 4 * (count + 1)
+        starts = view[position:position + 8 * count].cast('d')
+        position += 8 * count
+        durations = view[position:position + 8 * count].cast('d')
+        position += 8 * count
+        blob = view[position:position + blob_size]
+        return cls(blob, byte_offsets, char_offsets, starts, durations)
+
+class TranscriptStore:
+    """
+    On-disk transcript store keyed by video ID and language.
+    
+    Each transcript is one file in the columnar format, memory-mapped on load.
+    Like the cache tiers, stored transcripts expire after ``ttl`` seconds and
+    the oldest are pruned once the store grows past ``max_bytes``.
+    """
+    
+    def __init__(self, directory: str, ttl: int, max_bytes: int):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._bytes = None
+    
+    def _path(self, video_id: str, language: str) -> str:
+        return os.path.join(self.directory, f"{video_id}.{language}.bin")
+    
+    def get(self, video_id: str, language: str) -> Optional[Transcript]:
+        """
+        Load a stored transcript.
+        
+        Args:
+            video_id: YouTube video ID
+            language: Transcript language code
+        
+        Returns:
+            Memory-mapped transcript, or None if it is not stored
+        """
+        path = self._path(video_id, language)
+        try:
+            if time.time() - os.path.getmtime(path) >= self.ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                # The mapping stays valid after the file is closed or removed
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return Transcript.from_buffer(mapped)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error) as e:
+            logger.error(f"Error loading stored transcript for {video_id}: {e}")
+            return None
+    
+    def put(self, video_id: str, language: str, transcript: Transcript) -> None:
+        """
+        Store a transcript, replacing any previous version atomically.
+        
+        Args:
+            video_id: YouTube video ID
+            language: Transcript language code
+            transcript: Transcript to store
+        """
+        path = self._path(video_id, language)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(transcript.to_bytes())
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Error storing transcript for {video_id}: {e}")
+            return
+        
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = directory_bytes(self.directory, '.bin')
+            else:
+                self._bytes += size
+            over_budget = self._bytes > self.max_bytes
+        if over_budget:
+            removed, total = prune_directory(self.directory, '.bin', self.max_bytes, self.ttl)
+            with self._lock:
+                self._bytes = total
+            if removed:
+                logger.info(f"Pruned {removed} stored transcripts from {self.directory}")
+
+_store: Optional[TranscriptStore] = None
+_store_lock = threading.Lock()
+
+def get_transcript_store() -> Optional[TranscriptStore]:
+    """
+    Get the process-wide transcript store under CACHE_DIR, bounded by CACHE_TTL
+    and CACHE_DISK_MAX_BYTES like the named caches.
+    
+    Returns:
+        Shared TranscriptStore, or None if caching is disabled
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            cache_dir = get_setting('CACHE_DIR')
+            if not cache_dir:
+                return None
+            _store = TranscriptStore(os.path.join(cache_dir, 'transcripts'),
+                                     ttl=get_setting('CACHE_TTL', 30 * 24 * 3600),
+                                     max_bytes=get_setting('CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024))
+        return _store
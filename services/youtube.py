@@ -1,13 +1,25 @@
 import re
-import requests
-from bs4 import BeautifulSoup
-from youtube_transcript_api import YouTubeTranscriptApi
-from typing import Optional, List, Dict, Any
+import html
+import threading
+from typing import Optional, List, Dict, Any, Union
 import logging
+from config import get_setting
+from .cache import get_cache
+from .transcripts import Transcript, get_transcript_store
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
+OEMBED_URL = "https://www.youtube.com/oembed"
+
+# og:title sits in the page head, so the rest of the page is never read
+OG_TITLE_PATTERN = re.compile(r'<meta\s+property="og:title"\s+content="([^"]*)"')
+OG_TITLE_MAX_BYTES = 512 * 1024
+
+# requests and youtube_transcript_api are imported on first use, keeping them out of app startup
+_http_session: Optional["requests.Session"] = None
+_http_session_lock = threading.Lock()
+
 def get_video_id(url: str) -> Optional[str]:
     """
     Extract the YouTube video ID from a URL.
@@ -21,91 +33,208 @@ def get_video_id(url: str) -> Optional[str]:
     match = re.search(r'(?:v=|\/)([0-9A-Za-z_-]{11}).*', url)
     return match.group(1) if match else None
 
-def get_youtube_video_title(url: str) -> Optional[str]:
+def _get_http_session() -> "requests.Session":
     """
-    Get the title of a YouTube video from its URL.
+    Get the pooled HTTP session shared by all YouTube requests in this process.
+    
+    Returns:
+        Shared requests session
+    """
+    global _http_session
+    import requests
+    
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _http_session = session
+        return _http_session
+
+def get_video_metadata(video_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get a YouTube video's metadata, using the metadata cache.
+    
+    Misses are resolved through the small oEmbed JSON endpoint, falling back to
+    reading the watch page only up to its og:title tag.
     
     Args:
-        url: YouTube video URL
+        video_id: YouTube video ID
+        
+    Returns:
+        Dictionary with at least a 'title' key, or None if retrieval fails
+    """
+    cache = get_cache('metadata', ttl=get_setting('METADATA_CACHE_TTL', 24 * 3600))
+    metadata = cache.get(video_id)
+    if metadata is not None:
+        return metadata
+    
+    watch_url = f"https://www.youtube.com/watch?v={video_id}"
+    metadata = _fetch_oembed_metadata(watch_url)
+    if metadata is None:
+        title = _fetch_og_title(watch_url)
+        metadata = {'title': title} if title else None
+    
+    # Failures are not cached so the next request tries again
+    if metadata is not None:
+        cache.set(video_id, metadata)
+    return metadata
+
+def _fetch_oembed_metadata(watch_url: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetch video metadata from YouTube's oEmbed endpoint.
+    
+    Args:
+        watch_url: YouTube watch page URL
+        
+    Returns:
+        Dictionary with title, author_name and thumbnail_url, or None if the request fails
+    """
+    try:
+        response = _get_http_session().get(OEMBED_URL, params={'url': watch_url, 'format': 'json'},
+                                           timeout=get_setting('YOUTUBE_HTTP_TIMEOUT', 5))
+        if response.status_code != 200:
+            logger.warning(f"oEmbed lookup failed. Status code: {response.status_code}")
+            return None
+        data = response.json()
+        if not data.get('title'):
+            return None
+        return {
+            'title': data['title'],
+            'author_name': data.get('author_name'),
+            'thumbnail_url': data.get('thumbnail_url')
+        }
+    except Exception as e:
+        logger.warning(f"An error occurred during oEmbed lookup: {e}")
+        return None
+
+def _fetch_og_title(url: str) -> Optional[str]:
+    """
+    Read a YouTube watch page only until its og:title meta tag has arrived.
+    
+    Args:
+        url: YouTube watch page URL
         
     Returns:
         Video title or None if retrieval fails
     """
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            title_tag = soup.find("meta", property="og:title")
-            if title_tag:
-                return title_tag["content"]
-            else:
-                logger.warning("Title tag not found.")
+        with _get_http_session().get(url, stream=True, timeout=get_setting('YOUTUBE_HTTP_TIMEOUT', 5)) as response:
+            if response.status_code != 200:
+                logger.error(f"Failed to fetch the YouTube page. Status code: {response.status_code}")
                 return None
-        else:
-            logger.error(f"Failed to fetch the YouTube page. Status code: {response.status_code}")
-            return None
+            
+            head = ""
+            for chunk in response.iter_content(chunk_size=16 * 1024, decode_unicode=True):
+                head += chunk
+                match = OG_TITLE_PATTERN.search(head)
+                if match:
+                    return html.unescape(match.group(1))
+                if len(head) > OG_TITLE_MAX_BYTES:
+                    break
+        logger.warning("Title tag not found.")
+        return None
     except Exception as e:
         logger.error(f"An error occurred while fetching video title: {e}")
         return None
 
-def get_transcript(video_id: str) -> Optional[List[Dict[str, Any]]]:
+def get_youtube_video_title(url: str) -> Optional[str]:
+    """
+    Get the title of a YouTube video from its URL.
+    
+    Args:
+        url: YouTube video URL
+        
+    Returns:
+        Video title or None if retrieval fails
+    """
+    video_id = get_video_id(url)
+    if video_id is None:
+        return _fetch_og_title(url)
+    
+    metadata = get_video_metadata(video_id)
+    return metadata['title'] if metadata else None
+
+def get_transcript(video_id: str, language: str = 'en') -> Optional[Transcript]:
     """
     Get the transcript for a YouTube video.
     
+    Transcripts are kept in the transcript store after the first fetch, so
+    re-analyses and chunking read the stored columnar copy instead of
+    fetching and parsing the captions again.
+    
     Args:
         video_id: YouTube video ID
+        language: Transcript language code
         
     Returns:
-        List of transcript segments or None if retrieval fails
+        Transcript or None if retrieval fails
     """
+    store = get_transcript_store()
+    if store:
+        stored = store.get(video_id, language)
+        if stored is not None:
+            return stored
+    
     try:
+        from youtube_transcript_api import YouTubeTranscriptApi
+        
         transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
-        transcript = transcript_list.find_transcript(['en'])
-        return transcript.fetch()
+        transcript = Transcript.from_segments(transcript_list.find_transcript([language]).fetch())
     except Exception as e:
         logger.error(f"Error fetching transcript: {e}")
         return None
+    
+    if store and len(transcript):
+        store.put(video_id, language, transcript)
+    return transcript
 
-def split_transcript_with_timestamps(transcript_data: List[Dict[str, Any]], max_length: int = 15385) -> List[Dict[str, Any]]:
+def split_transcript_with_timestamps(transcript_data: Union[Transcript, List[Dict[str, Any]]],
+                                     max_length: int = 15385) -> List[Dict[str, Any]]:
     """
     Split a transcript into parts, each with a maximum text length.
     
+    Caption lengths come from the transcript's offset arrays and each part's
+    text is a single slice of its text blob, so no per-caption strings are built.
+    
     Args:
-        transcript_data: List of transcript segments
+        transcript_data: Transcript, or list of transcript segments
         max_length: Maximum text length for each part
         
     Returns:
         List of transcript parts with start and end timestamps
     """
+    if not isinstance(transcript_data, Transcript):
+        transcript_data = Transcript.from_segments(transcript_data)
+    starts, durations = transcript_data.starts, transcript_data.durations
+    
     parts = []
-    current_part = []
+    first = 0
     current_length = 0
     start_time = 0
 
-    for item in transcript_data:
-        text = item['text']
-        start = item['start']
-        duration = item['duration']
-        end_time = start + duration
+    for index in range(len(transcript_data)):
+        length = transcript_data.text_length(index)
         
-        if current_length + len(text) + 1 > max_length:
+        if current_length + length + 1 > max_length:
             parts.append({
-                "text": " ".join(current_part),
+                "text": transcript_data.text_range(first, index),
                 "start_time": start_time,
-                "end_time": start
+                "end_time": starts[index]
             })
-            current_part = [text]
-            current_length = len(text)
-            start_time = start
+            first = index
+            current_length = length
+            start_time = starts[index]
         else:
-            current_part.append(text)
-            current_length += len(text) + 1
+            current_length += length + 1
 
-    if current_part:
+    if len(transcript_data):
+        last = len(transcript_data) - 1
         parts.append({
-            "text": " ".join(current_part),
+            "text": transcript_data.text_range(first, len(transcript_data)),
             "start_time": start_time,
-            "end_time": end_time
+            "end_time": starts[last] + durations[last]
         })
 
-    return parts 
\ No newline at end of file
+    return parts
@@ -0,0 +1,13 @@
+import pytest
+from services import task_store
+from services.task_store import MemoryTaskStore, SQLiteTaskStore
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path, monkeypatch):
+    """Each task store backend that runs without a server, installed as the process-wide store."""
+    if request.param == "memory":
+        instance = MemoryTaskStore()
+    else:
+        instance = SQLiteTaskStore(str(tmp_path / "tasks.db"))
+    monkeypatch.setattr(task_store, "_store", instance)
+    return instance
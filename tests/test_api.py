@@ -0,0 +1,27 @@
+import pytest
+from app import create_app
+
+@pytest.fixture
+def client(store, tmp_path):
+    app = create_app()
+    app.config.update(TESTING=True, BULK_MAX_URLS=3, OPENAI_API_KEY=None, BATCH_DIR=str(tmp_path / "batches"))
+    return app.test_client()
+
+def test_batch_rejects_urls_that_are_not_a_list(client):
+    response = client.post('/api/batch', json={'urls': "https://youtu.be/dQw4w9WgXcQ", 'api_key': 'sk-test'})
+    assert response.status_code == 400
+
+def test_batch_rejects_too_many_urls(client):
+    urls = [f"https://youtu.be/video{index:06d}" for index in range(4)]
+    response = client.post('/api/batch', json={'urls': urls, 'api_key': 'sk-test'})
+    assert response.status_code == 400
+    assert '3' in response.get_json()['error']
+
+def test_batch_limit_applies_to_line_bodies(client):
+    body = "\n".join(f"https://youtu.be/video{index:06d}" for index in range(4))
+    response = client.post('/api/batch', data=body, headers={'X-OpenAI-Key': 'sk-test'})
+    assert response.status_code == 400
+
+def test_bulk_rejects_urls_that_are_not_a_list(client):
+    response = client.post('/api/analyze/bulk', json={'urls': "https://youtu.be/dQw4w9WgXcQ", 'api_key': 'sk-test'})
+    assert response.status_code == 400
@@ -0,0 +1,51 @@
+from services.chunking import chunk_transcript, count_tokens, section_token_budget
+from services.transcripts import Transcript
+
+MODEL = "gpt-3.5-turbo"
+
+def _transcript(texts, duration=2.0, gap=0.0):
+    return Transcript.from_segments([{'text': text, 'start': index * (duration + gap), 'duration': duration}
+                                     for index, text in enumerate(texts)])
+
+def test_chunks_cover_transcript_within_budget():
+    transcript = _transcript([f"Claim number {index} is stated here" for index in range(200)])
+    chunks = chunk_transcript(transcript, MODEL, max_tokens=100)
+    assert len(chunks) > 1
+    assert all(chunk['tokens'] <= 100 for chunk in chunks)
+    assert " ".join(chunk['text'] for chunk in chunks) == transcript.text_range(0, len(transcript))
+    assert chunks[0]['start_time'] == 0.0 and chunks[-1]['end_time'] == 400.0
+
+def test_chunks_prefer_sentence_ends():
+    texts = []
+    for index in range(60):
+        texts.append(f"the speaker keeps talking about topic {index}")
+        texts.append(f"and then finishes the thought {index}.")
+    chunks = chunk_transcript(_transcript(texts), MODEL, max_tokens=120)
+    assert all(chunk['text'].endswith('.') for chunk in chunks)
+
+def test_oversized_caption_is_split():
+    words = [f"word{index}" for index in range(400)]
+    transcript = _transcript(["Intro.", " ".join(words), "Outro."], duration=10.0)
+    chunks = chunk_transcript(transcript, MODEL, max_tokens=50)
+    assert all(chunk['tokens'] <= 50 for chunk in chunks)
+    assert all(count_tokens(" " + chunk['text'], MODEL) <= 50 for chunk in chunks)
+    assert " ".join(chunk['text'] for chunk in chunks).split() == ["Intro."] + words + ["Outro."]
+    # Pieces share the caption's time span in order
+    assert [chunk['start_time'] for chunk in chunks] == sorted(chunk['start_time'] for chunk in chunks)
+    assert chunks[-1]['end_time'] == 30.0
+
+def test_overlap_repeats_previous_captions():
+    transcript = _transcript([f"Sentence {index}." for index in range(100)])
+    plain = chunk_transcript(transcript, MODEL, max_tokens=60)
+    overlapped = chunk_transcript(transcript, MODEL, max_tokens=60, overlap_tokens=10)
+    assert len(overlapped) > len(plain)
+    for previous, chunk in zip(overlapped, overlapped[1:]):
+        assert chunk['text'].split(".")[0] + "." in previous['text']
+
+def test_empty_transcript():
+    assert chunk_transcript(_transcript([]), MODEL, max_tokens=100) == []
+
+def test_section_token_budget():
+    assert section_token_budget("gpt-4", prompt_tokens=500, max_output_tokens=1000) == 8192 - 1000 - 500 - 64
+    assert section_token_budget("gpt-4", prompt_tokens=500, max_output_tokens=1000, limit=2000) == 2000
+    assert section_token_budget("unknown", prompt_tokens=4000, max_output_tokens=1000) == 256
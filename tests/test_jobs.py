@@ -0,0 +1,47 @@
+from services import jobs
+from services.tasks import TaskStatus, create_task
+
+def _job(store, statuses):
+    items = []
+    for index, status in enumerate(statuses):
+        if status == 'invalid':
+            items.append({'youtube_url': 'not a video', 'video_id': None, 'task_id': None, 'error': "Invalid URL"})
+            continue
+        task_id = create_task('video_analysis', {}, status=status)
+        if status == TaskStatus.COMPLETED:
+            store.update(task_id, {"progress": 100, "result": {"report": {"index": index}, "html": "<p></p>"}})
+        items.append({'youtube_url': f"https://youtu.be/video{index:05d}", 'video_id': f"video{index:05d}",
+                      'task_id': task_id})
+    job_id = create_task(jobs.BULK_JOB_TYPE, {'items': items}, status=TaskStatus.PROCESSING)
+    return jobs.get_bulk_analysis_job(job_id)
+
+def test_job_tasks_are_read_without_results(store):
+    job = _job(store, [TaskStatus.COMPLETED, TaskStatus.QUEUED])
+    assert all('result' not in task for task in job['tasks'].values())
+
+def test_summary_counts_whole_job_and_pages_items(store, monkeypatch):
+    reports = []
+    monkeypatch.setattr(jobs, 'report_data', lambda result: reports.append(result) or result['report'])
+    job = _job(store, [TaskStatus.COMPLETED] * 5 + [TaskStatus.QUEUED, 'invalid'])
+    
+    summary = jobs.summarize_bulk_analysis_job(job, page=2, per_page=2)
+    assert summary['counts'] == {TaskStatus.COMPLETED: 5, TaskStatus.QUEUED: 1, 'invalid': 1}
+    assert summary['status'] == 'processing' and summary['pages'] == 4
+    assert [item['result'] for item in summary['items']] == [{'index': 2}, {'index': 3}]
+    # Only the page's results are deserialized
+    assert len(reports) == 2
+
+def test_summary_of_finished_job(store):
+    job = _job(store, [TaskStatus.COMPLETED, TaskStatus.FAILED, 'invalid'])
+    summary = jobs.summarize_bulk_analysis_job(job)
+    assert summary['status'] == 'partial' and summary['progress'] == 100
+    assert [item['status'] for item in summary['items']] == [TaskStatus.COMPLETED, TaskStatus.FAILED, 'invalid']
+
+def test_version_changes_with_task_status(store):
+    job = _job(store, [TaskStatus.QUEUED])
+    version = jobs.bulk_job_version(job, 1, 100)
+    assert jobs.bulk_job_version(jobs.get_bulk_analysis_job(job['id']), 1, 100) == version
+    assert jobs.bulk_job_version(job, 2, 100) != version
+    task_id = job['params']['items'][0]['task_id']
+    store.update(task_id, {"status": TaskStatus.PROCESSING, "updated_at": job['tasks'][task_id]['updated_at'] + 1})
+    assert jobs.bulk_job_version(jobs.get_bulk_analysis_job(job['id']), 1, 100) != version
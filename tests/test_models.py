@@ -0,0 +1,66 @@
+import openai
+import pytest
+from config import Config
+from services import models
+
+class FakeClient:
+    def __init__(self, name, calls, fail_after=None, error=None):
+        self.name, self.calls, self.fail_after, self.error = name, calls, fail_after, error
+
+    def chat_completion(self, max_retries=None, **params):
+        self.calls.append(params['model'])
+        if self.fail_after == 0:
+            raise self.error
+        return self._stream()
+
+    def _stream(self):
+        for index in range(3):
+            if index == self.fail_after:
+                raise self.error
+            yield f"{self.name}{index}"
+
+class FakeBackend:
+    def __init__(self, client):
+        self._client = client
+
+    def client(self, api_key):
+        return self._client
+
+@pytest.fixture
+def backends(monkeypatch):
+    """Serve each model from a fake client, configured per test by model name."""
+    clients, calls = {}, []
+    monkeypatch.setattr(Config, 'SUMMARY_MODEL', 'primary', raising=False)
+    monkeypatch.setattr(Config, 'SUMMARY_FALLBACK_MODELS', 'fallback', raising=False)
+    monkeypatch.setattr(models, 'get_backend', lambda spec: FakeBackend(clients.get(spec) or FakeClient(spec, calls)))
+
+    def configure(spec, **kwargs):
+        clients[spec] = FakeClient(spec, calls, **kwargs)
+    return configure, calls
+
+def test_stream_falls_back_when_opening_fails(backends):
+    configure, calls = backends
+    configure('primary', fail_after=0, error=openai.error.RateLimitError("slow down"))
+    assert list(models.chat_completion(models.SUMMARY, "sk", stream=True)) == ["fallback0", "fallback1", "fallback2"]
+    assert calls == ['primary', 'fallback']
+
+def test_stream_falls_back_mid_stream_and_signals_restart(backends):
+    configure, calls = backends
+    configure('primary', fail_after=2, error=openai.error.ServiceUnavailableError("overloaded"))
+    chunks = list(models.chat_completion(models.SUMMARY, "sk", stream=True))
+    assert chunks == ["primary0", "primary1", None, "fallback0", "fallback1", "fallback2"]
+
+def test_stream_does_not_fall_back_on_permanent_errors(backends):
+    configure, calls = backends
+    configure('primary', fail_after=1, error=openai.error.InvalidRequestError("bad", None))
+    with pytest.raises(openai.error.InvalidRequestError):
+        list(models.chat_completion(models.SUMMARY, "sk", stream=True))
+    assert calls == ['primary']
+
+def test_last_model_errors_are_raised(backends):
+    configure, calls = backends
+    configure('primary', fail_after=1, error=openai.error.Timeout("slow"))
+    configure('fallback', fail_after=1, error=openai.error.Timeout("slow"))
+    with pytest.raises(openai.error.Timeout):
+        list(models.chat_completion(models.SUMMARY, "sk", stream=True))
+    assert calls == ['primary', 'fallback']
@@ -0,0 +1,37 @@
+from services.transcripts import Transcript
+from services.normalization import clean_caption, normalize_transcript
+
+def _transcript(*texts):
+    return Transcript.from_segments({'text': text, 'start': float(i), 'duration': 1.0} for i, text in enumerate(texts))
+
+def _texts(transcript):
+    return [transcript.text(i) for i in range(len(transcript))]
+
+def test_clean_caption_removes_markers_and_fillers():
+    assert clean_caption("[Music] um, so uh the   answer is ♪ yes") == "so the answer is yes"
+    assert clean_caption("(audience laughter) Hmm. Erm okay") == "okay"
+
+def test_clean_caption_keeps_fillers_when_asked():
+    assert clean_caption("um the answer", remove_filler=False) == "um the answer"
+
+def test_numbers_with_units_survive():
+    assert clean_caption("The bolt is 5 mm wide") == "The bolt is 5 mm wide"
+    assert clean_caption("Mm, that is right") == "Mm, that is right"
+    assert clean_caption("It weighs 3.5 kg and is 20 cm long") == "It weighs 3.5 kg and is 20 cm long"
+
+def test_rolling_caption_overlap_is_dropped():
+    normalized, stats = normalize_transcript(
+        _transcript("the earth orbits", "the earth orbits the sun", "the sun once a year"), "gpt-3.5-turbo")
+    assert _texts(normalized) == ["the earth orbits", "the sun", "once a year"]
+    assert stats['captions_before'] == 3 and stats['captions_after'] == 3
+
+def test_empty_captions_are_dropped_and_times_kept():
+    normalized, stats = normalize_transcript(_transcript("[Music]", "uh", "water boils at 100 degrees"),
+                                             "gpt-3.5-turbo")
+    assert _texts(normalized) == ["water boils at 100 degrees"]
+    assert list(normalized.starts) == [2.0]
+    assert stats['tokens_saved'] >= 0
+
+def test_repeated_single_word_is_kept():
+    normalized, _ = normalize_transcript(_transcript("it is very", "very cold"), "gpt-3.5-turbo")
+    assert _texts(normalized) == ["it is very", "very cold"]
@@ -0,0 +1,27 @@
+import openai
+import requests
+from services import openai_client
+from services.openai_client import get_openai_client, is_retryable
+
+def test_retryable_errors():
+    assert is_retryable(openai.error.RateLimitError("slow down"))
+    assert is_retryable(openai.error.ServiceUnavailableError("overloaded"))
+    assert not is_retryable(openai.error.RateLimitError("no quota", code='insufficient_quota'))
+    assert not is_retryable(openai.error.APIError("bad request", http_status=400))
+    assert not is_retryable(openai.error.InvalidRequestError("bad", None))
+    assert not is_retryable(ValueError())
+
+def test_router_only_routes_openai_requests(monkeypatch):
+    sessions = []
+    monkeypatch.setattr(requests.Session, 'request', lambda self, method, url, **kwargs: sessions.append(self))
+    monkeypatch.setattr(openai_client, '_clients', openai_client.OrderedDict())
+    openai_client._install_session_router()
+    router = openai.requestssession
+
+    router.request("post", "http://localhost:8000/v1/chat/completions", headers={'Authorization': "Bearer local"})
+    assert sessions == [router]
+    assert not openai_client._clients
+
+    router.request("post", openai.api_base + "/chat/completions", headers={'Authorization': "Bearer sk-test"})
+    assert sessions[-1] is get_openai_client("sk-test").session
+    assert len(openai_client._clients) == 1
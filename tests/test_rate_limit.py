@@ -0,0 +1,81 @@
+import pytest
+from config import Config
+from services import rate_limit
+from services.rate_limit import (MemoryRateLimiter, RateLimitExceeded, SQLiteRateLimiter, inbound_buckets,
+                                  openai_buckets, parse_rate_limits)
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, 'time', clock.time)
+    monkeypatch.setattr(rate_limit.time, 'sleep', clock.sleep)
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite"])
+def limiter(request, tmp_path, clock):
+    if request.param == "memory":
+        return MemoryRateLimiter()
+    return SQLiteRateLimiter(str(tmp_path / "ratelimit.db"))
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("200 per day; 50/hour;10 per 30 seconds") == [(200, 86400), (50, 3600), (10, 30)]
+    assert parse_rate_limits(None) == [] and parse_rate_limits("") == []
+    with pytest.raises(ValueError):
+        parse_rate_limits("lots per fortnight")
+
+def test_bucket_drains_and_refills(limiter, clock):
+    bucket = [("key", 1, 3, 1.0)]
+    assert [limiter.try_acquire(bucket) for _ in range(3)] == [0, 0, 0]
+    assert limiter.try_acquire(bucket) == pytest.approx(1.0)
+    clock.now += 0.5
+    assert limiter.try_acquire(bucket) == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.try_acquire(bucket) == 0
+
+def test_refill_is_capped_at_capacity(limiter, clock):
+    bucket = [("key", 1, 2, 1.0)]
+    clock.now += 3600
+    assert [limiter.try_acquire(bucket) for _ in range(3)][-1] == pytest.approx(1.0)
+
+def test_buckets_are_charged_all_or_nothing(limiter):
+    rpm, tpm = ("rpm", 1, 10, 1.0), ("tpm", 100, 150, 10.0)
+    assert limiter.try_acquire([rpm, tpm]) == 0
+    # The TPM bucket is short, so neither bucket is charged
+    assert limiter.try_acquire([rpm, tpm]) == pytest.approx(5.0)
+    assert [limiter.try_acquire([rpm]) for _ in range(9)] == [0] * 9
+    assert limiter.try_acquire([rpm]) > 0
+
+def test_acquire_waits_or_times_out(limiter, clock):
+    bucket = [("key", 1, 1, 0.5)]
+    limiter.acquire(bucket)
+    with pytest.raises(RateLimitExceeded) as excinfo:
+        limiter.acquire(bucket, timeout=1)
+    assert excinfo.value.retry_after == pytest.approx(2.0)
+    start = clock.now
+    limiter.acquire(bucket)
+    assert clock.now - start == pytest.approx(2.0)
+
+def test_openai_buckets(monkeypatch):
+    monkeypatch.setattr(Config, 'OPENAI_RPM_LIMIT', 60, raising=False)
+    monkeypatch.setattr(Config, 'OPENAI_TPM_LIMIT', 1000, raising=False)
+    (rpm_key, requests, rpm, rpm_rate), (tpm_key, tokens, tpm, tpm_rate) = openai_buckets("sk-a", "gpt-4", 5000)
+    assert (requests, rpm, rpm_rate) == (1, 60, 1.0)
+    # A call larger than the bucket waits for a full bucket rather than forever
+    assert (tokens, tpm) == (1000, 1000)
+    assert "sk-a" not in rpm_key and rpm_key != openai_buckets("sk-b", "gpt-4", 10)[0][0]
+    monkeypatch.setattr(Config, 'OPENAI_RPM_LIMIT', 0)
+    monkeypatch.setattr(Config, 'OPENAI_TPM_LIMIT', 0)
+    assert openai_buckets("sk-a", "gpt-4", 10) == []
+
+def test_inbound_buckets():
+    assert inbound_buckets("1.2.3.4", "10 per minute") == [("inbound:1.2.3.4:10/60", 1, 10, 10 / 60)]
@@ -0,0 +1,80 @@
+import json
+from services.report import (format_timestamp, parse_partial_report, parse_report, parse_timestamp,
+                             render_report_html, render_report_markdown, report_data, report_from_text)
+
+REPORT = {
+    "summary": "A documentary about bridges.",
+    "sections": [
+        {"category": "Scientific Accuracy", "claims": [
+            {"claim": "Steel expands when heated", "verdict": "accurate", "timestamp": "0:01:05",
+             "explanation": "Thermal expansion."}]},
+        {"category": "historical accuracy", "claims": [
+            {"claim": "The bridge opened in 1937", "verdict": "Accurate", "timestamp": 3723},
+            {"claim": "It was built by <giants>", "verdict": "legendary"},
+            "A plain string claim"]}
+    ]
+}
+
+def test_timestamps():
+    assert format_timestamp(65) == "1:05"
+    assert format_timestamp(3723) == "1:02:03"
+    assert parse_timestamp("at 1:02:03") == 3723
+    assert parse_timestamp("4:05") == 245
+    assert parse_timestamp(12.7) == 12
+    assert parse_timestamp(-1) is None and parse_timestamp(True) is None and parse_timestamp("soon") is None
+
+def test_parse_report_normalizes_json():
+    report = parse_report(json.dumps(REPORT), "Bridges")
+    assert report["title"] == "Bridges" and report["summary"] == "A documentary about bridges."
+    # Sections come back in category order with known names
+    assert [section["category"] for section in report["sections"]] == ["Historical Accuracy", "Scientific Accuracy"]
+    history = report["sections"][0]["claims"]
+    assert history[0] == {"claim": "The bridge opened in 1937", "verdict": "accurate", "explanation": "",
+                          "timestamp": 3723}
+    assert history[1]["verdict"] == "unverifiable" and history[2]["claim"] == "A plain string claim"
+    assert report["sections"][1]["claims"][0]["timestamp"] == 65
+
+def test_parse_report_tolerates_fences_and_prose():
+    expected = parse_report(json.dumps(REPORT), "Bridges")
+    assert parse_report("```json\n" + json.dumps(REPORT) + "\n```", "Bridges") == expected
+    assert parse_report("Here is the report: " + json.dumps(REPORT) + " Done.", "Bridges") == expected
+
+def test_free_form_summary_is_parsed_as_text():
+    text = ("Intro line\n## Historical Accuracy\n- claim one\n"
+            "Scientific Accuracy: inline claim\n## Weird Heading\n- kept\n")
+    for report in (report_from_text(text, "T"), parse_report(text, "T")):
+        assert report["summary"] == "Intro line"
+        assert [section["category"] for section in report["sections"]] == \
+            ["Historical Accuracy", "Scientific Accuracy", "Weird Heading"]
+        assert report["sections"][1]["claims"][0]["claim"] == "inline claim"
+
+def test_every_prefix_of_a_streamed_report_parses():
+    text = json.dumps(REPORT, indent=2)
+    final = parse_report(text, "Bridges")
+    claims = 0
+    for end in range(len(text) + 1):
+        partial = parse_partial_report(text[:end], "Bridges")
+        if partial is not None:
+            count = sum(len(section["claims"]) for section in partial["sections"])
+            assert count >= claims
+            claims = count
+    assert parse_partial_report(text, "Bridges") == final
+    assert parse_partial_report("no json yet", "Bridges") is None
+
+def test_render_html_escapes_and_links_timestamps():
+    report = parse_report(json.dumps(REPORT), "Bridges")
+    page = render_report_html(report, "abcdefghijk")
+    assert "&lt;giants&gt;" in page and "<giants>" not in page
+    assert "href='https://www.youtube.com/watch?v=abcdefghijk&amp;t=3723s'" in page
+    assert "text-bg-success" in page and "Thermal expansion." in page
+    assert "<span class='claim-timestamp'>1:02:03</span>" in render_report_html(report)
+
+def test_render_markdown():
+    markdown = render_report_markdown(parse_report(json.dumps(REPORT), "Bridges"), "abcdefghijk")
+    assert markdown.startswith("**Summary**")
+    assert "- **Accurate**: The bridge opened in 1937 ([1:02:03](<https://www.youtube.com/watch?v=abcdefghijk&t=3723s>))" \
+        in markdown
+
+def test_report_data():
+    assert report_data({"report": {"summary": "s"}, "html": "<p>"}) == {"summary": "s"}
+    assert report_data("Error: no transcript") == "Error: no transcript"
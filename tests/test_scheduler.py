@@ -0,0 +1,59 @@
+import threading
+import pytest
+from services.scheduler import JobScheduler, Priority, QueueFullError
+
+@pytest.fixture
+def busy():
+    """A single-worker scheduler whose worker is held busy until release is set."""
+    scheduler = JobScheduler(workers=1, queue_size=10)
+    started, release = threading.Event(), threading.Event()
+    scheduler.submit("blocker", lambda: (started.set(), release.wait(5)))
+    assert started.wait(5)
+    yield scheduler, release
+    release.set()
+    scheduler.shutdown(timeout=5)
+
+def test_jobs_run_by_priority_then_submission_order(busy):
+    scheduler, release = busy
+    ran = []
+    jobs = [("bulk-1", Priority.BULK), ("api-1", Priority.API), ("interactive-1", Priority.INTERACTIVE),
+            ("discord-1", Priority.DISCORD), ("api-2", Priority.API), ("interactive-2", Priority.INTERACTIVE)]
+    positions = [scheduler.submit(job_id, ran.append, job_id, priority=priority) for job_id, priority in jobs]
+    assert positions == [1, 1, 1, 2, 4, 2]
+    assert [scheduler.get_position(job_id) for job_id, _ in jobs] == [6, 4, 1, 3, 5, 2]
+    release.set()
+    scheduler.shutdown(timeout=5)
+    assert ran == ["interactive-1", "interactive-2", "discord-1", "api-1", "api-2", "bulk-1"]
+
+def test_cancelled_jobs_are_skipped(busy):
+    scheduler, release = busy
+    ran = []
+    for job_id in ("a", "b", "c"):
+        scheduler.submit(job_id, ran.append, job_id, priority=Priority.API)
+    assert scheduler.cancel("b") and not scheduler.cancel("b")
+    assert scheduler.get_position("b") is None and scheduler.get_position("c") == 2
+    release.set()
+    scheduler.shutdown(timeout=5)
+    assert ran == ["a", "c"]
+
+def test_full_queue_rejects_jobs():
+    scheduler = JobScheduler(workers=1, queue_size=2)
+    release = threading.Event()
+    try:
+        scheduler.submit("running", release.wait, 5)
+        # The worker may not have taken the first job yet, so fill the queue until it rejects
+        with pytest.raises(QueueFullError):
+            for index in range(4):
+                scheduler.submit(f"job-{index}", lambda: None)
+        assert scheduler.get_stats()["queue_depth"] == 2
+    finally:
+        release.set()
+        scheduler.shutdown(timeout=5)
+
+def test_shutdown_stops_accepting_jobs(busy):
+    scheduler, release = busy
+    release.set()
+    scheduler.shutdown(timeout=5)
+    with pytest.raises(RuntimeError):
+        scheduler.submit("late", lambda: None)
+    assert scheduler.get_stats()["completed_jobs"] == 1
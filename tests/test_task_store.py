@@ -0,0 +1,61 @@
+import time
+from services.tasks import TaskStatus, get_or_create_video_analysis_task
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def _task(task_id, status="pending"):
+    now = time.time()
+    return {"id": task_id, "type": "video_analysis", "params": {}, "status": status, "created_at": now,
+            "updated_at": now, "progress": 0, "message": None, "partial_result": None, "result": None,
+            "error": None}
+
+def test_get_or_create_reuses_indexed_task(store):
+    first, created = store.get_or_create("key", _task("a"), lambda task: True)
+    assert created and first["id"] == "a"
+    second, created = store.get_or_create("key", _task("b"), lambda task: True)
+    assert not created and second["id"] == "a"
+    assert store.get("b") is None
+
+def test_get_or_create_replaces_unusable_task(store):
+    store.get_or_create("key", _task("a", "failed"), lambda task: True)
+    task, created = store.get_or_create("key", _task("b"), lambda task: task["status"] != "failed")
+    assert created and task["id"] == "b"
+    again, created = store.get_or_create("key", _task("c"), lambda task: task["status"] != "failed")
+    assert not created and again["id"] == "b"
+
+def test_update_respects_expected_status(store):
+    store.create(_task("a", "processing"))
+    assert not store.update("a", {"status": "failed"}, expected_status="queued")
+    assert store.update("a", {"status": "completed"}, expected_status="processing")
+    assert store.get("a")["status"] == "completed"
+    assert not store.update("missing", {"status": "failed"})
+
+def test_get_many_reads_selected_fields(store):
+    task = _task("a", "completed")
+    task["result"] = {"html": "x" * 100}
+    store.create(task)
+    tasks = store.get_many(["a", "missing"], ["status", "updated_at"])
+    assert tasks == {"a": {"id": "a", "status": "completed", "updated_at": task["updated_at"]}}
+    assert store.get_many(["a"])["a"]["result"] == {"html": "x" * 100}
+
+def test_analysis_task_is_shared_between_url_forms(store):
+    task_id = get_or_create_video_analysis_task(URL, "sk-test-key")
+    assert get_or_create_video_analysis_task("https://youtu.be/dQw4w9WgXcQ?t=30", "sk-other-key") == task_id
+
+def test_completed_analysis_with_report_is_reused(store):
+    task_id = get_or_create_video_analysis_task(URL, "sk-test-key")
+    store.update(task_id, {"status": TaskStatus.COMPLETED, "result": {"html": "<p>report</p>"}})
+    assert get_or_create_video_analysis_task(URL, "sk-test-key") == task_id
+
+def test_completed_analysis_with_error_message_is_not_reused(store):
+    task_id = get_or_create_video_analysis_task(URL, "sk-test-key")
+    store.update(task_id, {"status": TaskStatus.COMPLETED, "result": "Failed to retrieve transcript."})
+    assert get_or_create_video_analysis_task(URL, "sk-test-key") != task_id
+
+def test_failed_and_stale_analyses_are_replaced(store):
+    task_id = get_or_create_video_analysis_task(URL, "sk-test-key")
+    store.update(task_id, {"status": TaskStatus.FAILED})
+    retry_id = get_or_create_video_analysis_task(URL, "sk-test-key")
+    assert retry_id != task_id
+    store.update(retry_id, {"status": TaskStatus.PROCESSING, "updated_at": 0})
+    assert get_or_create_video_analysis_task(URL, "sk-test-key") != retry_id
@@ -0,0 +1,20 @@
+import pytest
+from services.tasks import TaskStatus, cancel_task, get_or_create_video_analysis_task, get_task_status
+
+URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+
+def test_submitter_can_cancel(store):
+    task_id = get_or_create_video_analysis_task(URL, "sk-owner")
+    assert cancel_task(task_id, "sk-owner")
+    assert get_task_status(task_id)['status'] == TaskStatus.CANCELLED
+    assert not cancel_task(task_id, "sk-owner")
+
+def test_other_callers_cannot_cancel_shared_task(store):
+    task_id = get_or_create_video_analysis_task(URL, "sk-owner")
+    assert get_or_create_video_analysis_task(URL, "sk-other") == task_id
+    with pytest.raises(PermissionError):
+        cancel_task(task_id, "sk-other")
+    assert get_task_status(task_id)['status'] == TaskStatus.PENDING
+
+def test_cancel_of_missing_task(store):
+    assert not cancel_task("missing", "sk-owner")
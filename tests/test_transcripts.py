@@ -0,0 +1,39 @@
+import os
+import time
+from services.transcripts import Transcript, TranscriptStore
+
+SEGMENTS = [{'text': "Water boils at 100 °C", 'start': 0.0, 'duration': 2.5},
+            {'text': "at sea level", 'start': 2.5, 'duration': 1.5}]
+
+def test_transcript_slices_and_round_trips():
+    transcript = Transcript.from_segments(SEGMENTS)
+    assert len(transcript) == 2
+    assert transcript.text(0) == "Water boils at 100 °C"
+    assert transcript.text_range(0, 2) == "Water boils at 100 °C at sea level"
+    assert list(transcript) == SEGMENTS
+    copy = Transcript.from_buffer(transcript.to_bytes())
+    assert list(copy) == SEGMENTS and copy.content_hash() == transcript.content_hash()
+
+def test_store_round_trip(tmp_path):
+    store = TranscriptStore(str(tmp_path), ttl=3600, max_bytes=1024 * 1024)
+    assert store.get("video", "en") is None
+    store.put("video", "en", Transcript.from_segments(SEGMENTS))
+    assert list(store.get("video", "en")) == SEGMENTS
+    assert store.get("video", "de") is None
+
+def test_store_expires_old_transcripts(tmp_path):
+    store = TranscriptStore(str(tmp_path), ttl=60, max_bytes=1024 * 1024)
+    store.put("video", "en", Transcript.from_segments(SEGMENTS))
+    path = store._path("video", "en")
+    os.utime(path, (time.time() - 120, time.time() - 120))
+    assert store.get("video", "en") is None
+    assert not os.path.exists(path)
+
+def test_store_prunes_oldest_transcripts_over_budget(tmp_path):
+    size = len(Transcript.from_segments(SEGMENTS).to_bytes())
+    store = TranscriptStore(str(tmp_path), ttl=3600, max_bytes=size * 3)
+    for index in range(5):
+        store.put(f"video{index}", "en", Transcript.from_segments(SEGMENTS))
+        os.utime(store._path(f"video{index}", "en"), (time.time() - 100 + index, time.time() - 100 + index))
+    stored = [index for index in range(5) if store.get(f"video{index}", "en") is not None]
+    assert len(stored) <= 3 and 4 in stored